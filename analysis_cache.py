@@ -0,0 +1,136 @@
+import asyncio
+import hashlib
+import logging
+import os
+
+import psycopg2
+
+from caching import TTLCache
+from db_manager import DBManager, PoolTimeout
+from lexical import normalize_prompt
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisCache:
+    """
+    Compliance analysis results keyed by (prompt, requirements, project focus, model id,
+    system prompt version).
+
+    Analyses run at temperature 0, so a re-check of an unchanged prompt against
+    unchanged requirements can reuse the previous answer. Because the requirements
+    and focus are part of the key, editing a project can never serve a stale
+    analysis; DBManager.create_project / update_project and `invalidate_project`
+    just reclaim the space. The Postgres tier keeps at most `max_rows` entries,
+    evicting the least recently used; its failures are logged and treated as misses.
+    """
+    PRUNE_EVERY = 100  # persistent writes between eviction passes
+
+    def __init__(self, maxsize=1024, ttl=None, persistent=True, max_rows=10000):
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.persistent = persistent
+        self.max_rows = max_rows
+        self.persistent_hits = 0
+        self._writes = 0
+
+    @staticmethod
+    def key(prompt, requirements, project_focus, model_name, prompt_version):
+        material = "\0".join((prompt_version, model_name, requirements, project_focus or "", normalize_prompt(prompt)))
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _db_get(self, key):
+        db = DBManager(pooled=True)
+        try:
+            return db.get_cached_analysis(key)
+        finally:
+            db.close()
+
+    def _db_put(self, key, project, model_name, analysis):
+        db = DBManager(pooled=True)
+        try:
+            db.put_cached_analysis(key, project, model_name, analysis)
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                db.prune_analysis_cache(self.max_rows)
+        finally:
+            db.close()
+
+    def get(self, key):
+        entry = self.memory.get(key)
+        if entry is not None:
+            return entry[1]
+        if not self.persistent:
+            return None
+        try:
+            analysis = self._db_get(key)
+        except (psycopg2.Error, PoolTimeout) as e:
+            logger.warning("Analysis cache lookup failed: %s", e)
+            return None
+        if analysis is not None:
+            self.persistent_hits += 1
+            # The owning project is not stored in memory for these; invalidate_project drops them too.
+            self.memory.set(key, (None, analysis))
+        return analysis
+
+    def put(self, key, project, model_name, analysis):
+        self.memory.set(key, (project.lower(), analysis))
+        if self.persistent:
+            try:
+                self._db_put(key, project, model_name, analysis)
+            except (psycopg2.Error, PoolTimeout) as e:
+                logger.warning("Analysis cache write failed: %s", e)
+
+    async def aget(self, key):
+        entry = self.memory.get(key)
+        if entry is not None:
+            return entry[1]
+        if not self.persistent:
+            return None
+        try:
+            analysis = await asyncio.to_thread(self._db_get, key)
+        except (psycopg2.Error, PoolTimeout) as e:
+            logger.warning("Analysis cache lookup failed: %s", e)
+            return None
+        if analysis is not None:
+            self.persistent_hits += 1
+            self.memory.set(key, (None, analysis))
+        return analysis
+
+    async def aput(self, key, project, model_name, analysis):
+        self.memory.set(key, (project.lower(), analysis))
+        if self.persistent:
+            try:
+                await asyncio.to_thread(self._db_put, key, project, model_name, analysis)
+            except (psycopg2.Error, PoolTimeout) as e:
+                logger.warning("Analysis cache write failed: %s", e)
+
+    def invalidate_project(self, project):
+        """Drops the in-memory analyses of `project`; the Postgres rows are removed by DBManager."""
+        project = project.lower()
+        stale = [k for k, (owner, _) in self.memory.items() if owner in (project, None)]
+        for k in stale:
+            self.memory.pop(k)
+        return len(stale)
+
+    def clear(self):
+        return self.memory.clear()
+
+    def stats(self):
+        memory = self.memory.stats()
+        return {
+            "memory_hits": memory["hits"],
+            "persistent_hits": self.persistent_hits,
+            "misses": memory["misses"] - self.persistent_hits,
+            "size": memory["size"],
+            "maxsize": memory["maxsize"],
+            "persistent": self.persistent,
+            "max_rows": self.max_rows,
+        }
+
+
+analysis_cache = AnalysisCache(
+    maxsize=int(os.getenv("ANALYSIS_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("ANALYSIS_CACHE_TTL")) if os.getenv("ANALYSIS_CACHE_TTL") else None,
+    persistent=os.getenv("ANALYSIS_CACHE_PERSIST", "true").lower() in ("1", "true", "yes"),
+    max_rows=int(os.getenv("ANALYSIS_CACHE_MAX_ROWS", "10000")),
+)
@@ -1,28 +1,92 @@
-from fastapi import FastAPI, HTTPException, Body, File, UploadFile
+from fastapi import FastAPI, HTTPException, Body, File, UploadFile, Depends, Request, BackgroundTasks
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List
-import requests
+from contextlib import asynccontextmanager
+import asyncio
+import json
+import logging
 import os
-import pdfplumber
-from io import BytesIO
-from db_manager import DBManager
-from similarity_check import get_embedding, analyze_requirements
+import time
+from db_manager import DBManager, AsyncDBManager, PoolTimeout, get_pool, pool_stats, close_pool, metadata_cache
+from similarity_check import (
+    get_embedding_async, run_check_pipeline, run_batch_pipeline, stream_check_pipeline,
+    compile_requirements_async, warm_model_cache, invalidate_models, cached_models, embedding_flight,
+    pick_embedding_model
+)
+from requirements_digest import REQUIREMENTS_TOKEN_BUDGET, count_tokens
+from lm_client import aclose_clients, backend_stats, create_pool, register_pool
+from lm_scheduler import LM_CHAT_CONCURRENCY, LM_EMBEDDING_CONCURRENCY, QueueFull, lm_scheduler, priority
+import metrics
+from analysis_cache import analysis_cache
+from embedding_cache import embedding_cache
+from pdf_extract import PdfLimitError, pdf_extractor, spool_upload
+from reembed import ReembedJob
+from caching import SingleFlight
+from lexical import normalize_prompt
+from duplicate_audit import AUDIT_THRESHOLD, EnvironmentNotFound, audit_environment
 
 VERSION = "0.6.3"
 
-app = FastAPI(title="Prompt Manager API")
+logger = logging.getLogger(__name__)
+
+def upgrade_schema():
+    db = DBManager(pooled=True)
+    try:
+        db.upgrade_schema()
+    finally:
+        db.close()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        get_pool().open()
+    except Exception as e:
+        # The pool opens connections on demand, so a database that is not up yet is not fatal.
+        logger.warning("Could not pre-open database connections: %s", e)
+    try:
+        # Upgrades databases created by older versions (new columns, partitioning) before serving.
+        await asyncio.to_thread(upgrade_schema)
+    except Exception as e:
+        logger.warning("Could not upgrade the database schema: %s", e)
+    # Caches project/environment lookups; other instances' edits arrive via LISTEN/NOTIFY.
+    metadata_cache.start_listener()
+    if LM_STUDIO_BACKENDS:
+        # Calls for the default URL are spread over the pool, so each operation may run that many more at once.
+        pool = create_pool(LM_STUDIO_BACKENDS, pick_embedding_model=pick_embedding_model)
+        register_pool(LM_STUDIO_DEFAULT_URL, pool).start(LM_BACKEND_PROBE_INTERVAL)
+        lm_scheduler.configure("embedding", limit=LM_EMBEDDING_CONCURRENCY * len(pool.backends))
+        lm_scheduler.configure("chat", limit=LM_CHAT_CONCURRENCY * len(pool.backends))
+    if os.getenv("LM_MODEL_WARMUP", "").lower() in ("1", "true", "yes"):
+        try:
+            await warm_model_cache(LM_STUDIO_DEFAULT_URL)
+        except Exception as e:
+            logger.warning("Could not warm LM Studio model cache: %s", e)
+    yield
+    if reembed_job:
+        reembed_job.stop()
+    pdf_extractor.shutdown()
+    await asyncio.to_thread(metadata_cache.stop_listener)
+    await aclose_clients()
+    close_pool()
+
+app = FastAPI(title="Prompt Manager API", lifespan=lifespan)
+app.add_middleware(metrics.MetricsMiddleware)
 
 # Mount static files for the frontend
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 LM_STUDIO_DEFAULT_URL = os.getenv("LM_STUDIO_URL", "http://localhost:1234/v1")
+# OpenAI-compatible servers that share the load of calls made to LM_STUDIO_DEFAULT_URL.
+LM_STUDIO_BACKENDS = [url.strip() for url in os.getenv("LM_STUDIO_BACKENDS", "").split(",") if url.strip()]
+LM_BACKEND_PROBE_INTERVAL = float(os.getenv("LM_BACKEND_PROBE_INTERVAL", "10"))
 
 class ProjectCreate(BaseModel):
     name: str
     requirements: str
     project_focus: Optional[str] = None
+    url: str = LM_STUDIO_DEFAULT_URL  # embedding endpoint used to compile the requirements digest
 
 class EnvironmentCreate(BaseModel):
     project_name: str
@@ -35,6 +99,40 @@ class CheckRequest(BaseModel):
     threshold: float = 0.85
     url: str = LM_STUDIO_DEFAULT_URL
     model: Optional[str] = None
+    full_analysis: bool = False  # skip the lexical duplicate short-circuit
+
+class ReembedRequest(BaseModel):
+    url: str = LM_STUDIO_DEFAULT_URL
+    model: Optional[str] = None
+    batch_size: Optional[int] = None
+    pause: Optional[float] = None  # seconds between batches
+
+class BatchCheckRequest(BaseModel):
+    project: str
+    environment: str
+    prompts: List[str]
+    threshold: float = 0.85
+    url: str = LM_STUDIO_DEFAULT_URL
+    model: Optional[str] = None
+    batch_size: Optional[int] = None
+    analyze: bool = True
+    save: bool = True
+
+def get_db():
+    """FastAPI dependency handing each request a pooled connection for its lifetime."""
+    db = DBManager(pooled=True)
+    try:
+        yield AsyncDBManager(db)
+    finally:
+        db.close()
+
+@app.exception_handler(PoolTimeout)
+async def pool_timeout_handler(request: Request, exc: PoolTimeout):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+@app.exception_handler(QueueFull)
+async def queue_full_handler(request: Request, exc: QueueFull):
+    return JSONResponse(status_code=429, content={"detail": str(exc)}, headers={"Retry-After": str(exc.retry_after)})
 
 @app.get("/")
 async def read_index():
@@ -46,183 +144,350 @@ async def get_info():
     return {
         "version": VERSION,
         "status": "healthy",
-        "name": "Prompt Similarity Detector"
+        "name": "Prompt Similarity Detector",
+        "db_pool": pool_stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "analysis_cache": analysis_cache.stats(),
+        "metadata_cache": metadata_cache.stats(),
+        "pdf_import": pdf_extractor.stats(),
+        "coalescing": {"check": check_flight.stats(), "embedding": embedding_flight.stats()},
+        "lm_queue": lm_scheduler.stats(),
+        "lm_backends": backend_stats()
     }
 
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus scrape endpoint (text exposition format)."""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/api/projects")
-async def list_projects():
-    db = DBManager()
-    try:
-        with db.conn.cursor(cursor_factory=None) as cur:
-            cur.execute("SELECT name, requirements, created_at, project_focus FROM projects ORDER BY name;")
-            projects = [{"name": row[0], "requirements": row[1], "created_at": row[2], "project_focus": row[3]} for row in cur.fetchall()]
-            return projects
-    finally:
-        db.close()
+async def list_projects(db: AsyncDBManager = Depends(get_db)):
+    return await db.list_projects()
 
 @app.delete("/api/projects/{name}")
-async def delete_project(name: str):
-    db = DBManager()
+async def delete_project(name: str, db: AsyncDBManager = Depends(get_db)):
+    await db.delete_project(name)
+    return {"message": f"Project '{name}' deleted"}
+
+async def compile_project_requirements(project_id, requirements, base_url):
+    """Background task: compiles long requirements into chunks so the first check does not pay for it."""
+    if count_tokens(requirements) <= REQUIREMENTS_TOKEN_BUDGET:
+        return
+    db = AsyncDBManager(await asyncio.to_thread(DBManager, pooled=True))
     try:
-        db.delete_project(name)
-        return {"message": f"Project '{name}' deleted"}
+        await compile_requirements_async(db, project_id, requirements, base_url)
+    except Exception as e:
+        # Checks compile lazily (or fall back to the full text), so this is not fatal.
+        logger.warning("Could not compile requirements for project %s: %s", project_id, e)
     finally:
-        db.close()
+        await db.close()
 
 @app.post("/api/projects")
-async def create_project(data: ProjectCreate):
-    db = DBManager()
-    try:
-        pid = db.create_project(data.name, data.requirements, data.project_focus)
-        return {"id": pid, "name": data.name, "message": "Project created/updated"}
-    finally:
-        db.close()
+async def create_project(data: ProjectCreate, background_tasks: BackgroundTasks, db: AsyncDBManager = Depends(get_db)):
+    pid = await db.create_project(data.name, data.requirements, data.project_focus)
+    analysis_cache.invalidate_project(data.name)
+    background_tasks.add_task(compile_project_requirements, pid, data.requirements, data.url)
+    return {"id": pid, "name": data.name, "message": "Project created/updated"}
 
 @app.patch("/api/projects/{name}")
-async def update_project(name: str, data: dict = Body(...)):
-    db = DBManager()
-    try:
-        db.update_project(name, requirements=data.get("requirements"), project_focus=data.get("project_focus"))
-        return {"message": f"Project '{name}' updated"}
-    finally:
-        db.close()
+async def update_project(name: str, background_tasks: BackgroundTasks, data: dict = Body(...),
+                         db: AsyncDBManager = Depends(get_db)):
+    pid = await db.update_project(name, requirements=data.get("requirements"), project_focus=data.get("project_focus"))
+    analysis_cache.invalidate_project(name)
+    if pid and data.get("requirements") is not None:
+        background_tasks.add_task(compile_project_requirements, pid, data["requirements"],
+                                  data.get("url") or LM_STUDIO_DEFAULT_URL)
+    return {"message": f"Project '{name}' updated"}
 
 @app.get("/api/projects/{project_name}/environments")
-async def list_environments(project_name: str):
-    db = DBManager()
-    try:
-        project = db.get_project(project_name)
-        if not project:
-            raise HTTPException(status_code=404, detail="Project not found")
-        
-        with db.conn.cursor(cursor_factory=None) as cur:
-            cur.execute("SELECT name, created_at FROM environments WHERE project_id = %s ORDER BY name;", (project['id'],))
-            envs = [{"name": row[0], "created_at": row[1]} for row in cur.fetchall()]
-            return envs
-    finally:
-        db.close()
+async def list_environments(project_name: str, db: AsyncDBManager = Depends(get_db)):
+    project = await db.get_project(project_name)
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    
+    return await db.list_environments(project['id'])
 
 @app.post("/api/environments")
-async def create_environment(data: EnvironmentCreate):
-    db = DBManager()
+async def create_environment(data: EnvironmentCreate, db: AsyncDBManager = Depends(get_db)):
     try:
-        eid = db.create_environment(data.project_name, data.name)
+        eid = await db.create_environment(data.project_name, data.name)
         return {"id": eid, "name": data.name, "message": "Environment created"}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
-    finally:
-        db.close()
 
 @app.delete("/api/projects/{project_name}/environments/{env_name}")
-async def delete_environment(project_name: str, env_name: str):
-    db = DBManager()
-    try:
-        db.delete_environment(project_name, env_name)
-        return {"message": f"Environment '{env_name}' in project '{project_name}' deleted"}
-    finally:
-        db.close()
+async def delete_environment(project_name: str, env_name: str, db: AsyncDBManager = Depends(get_db)):
+    await db.delete_environment(project_name, env_name)
+    return {"message": f"Environment '{env_name}' in project '{project_name}' deleted"}
 
 @app.delete("/api/projects/{project_name}/environments/{env_name}/prompts")
-async def delete_environment_prompts(project_name: str, env_name: str):
-    db = DBManager()
+async def delete_environment_prompts(project_name: str, env_name: str, db: AsyncDBManager = Depends(get_db)):
+    await db.delete_environment_prompts(project_name, env_name)
+    return {"message": f"All prompts in environment '{env_name}' (Project: '{project_name}') have been deleted"}
+
+@app.get("/api/projects/{project_name}/environments/{env_name}/duplicates")
+async def audit_duplicates(project_name: str, env_name: str, threshold: float = AUDIT_THRESHOLD,
+                           method: str = "auto", limit: int = 50):
+    """Clusters of near-duplicate prompts in the environment, largest first."""
+    if method not in ("auto", "blocked", "lsh"):
+        raise HTTPException(status_code=400, detail=f"Unknown audit method '{method}'. Use auto, blocked or lsh.")
+
+    def run():
+        # The similarity blocks are CPU-bound NumPy work: keep the whole audit off the event loop.
+        db = DBManager(pooled=True)
+        try:
+            return audit_environment(db, project_name, env_name, threshold, method, limit)
+        finally:
+            db.close()
+
     try:
-        db.delete_environment_prompts(project_name, env_name)
-        return {"message": f"All prompts in environment '{env_name}' (Project: '{project_name}') have been deleted"}
-    finally:
-        db.close()
+        return await asyncio.to_thread(run)
+    except EnvironmentNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
-@app.post("/api/check")
-async def check_prompt(req: CheckRequest):
-    db = DBManager()
+async def _check_and_save(req):
+    """Pipeline plus auto-save behind /api/check; runs once for a group of identical in-flight checks."""
+    # A coalesced check can outlive the request that started it, so it holds its own connection.
+    db = AsyncDBManager(await asyncio.to_thread(DBManager, pooled=True))
     try:
-        env_data = db.get_environment_by_name(req.project, req.environment)
+        env_data = await db.get_environment_by_name(req.project, req.environment)
         if not env_data:
             raise HTTPException(status_code=404, detail=f"Environment '{req.environment}' for project '{req.project}' not found")
 
-        # 1. Requirement Analysis
-        req_analysis = analyze_requirements(
-            req.prompt, 
-            env_data['requirements'], 
-            req.url, 
-            model_name=req.model,
-            project_focus=env_data.get('project_focus')
-        )
-        
-        # 2. Embedding
-        embedding = get_embedding(req.prompt, req.url, req.model)
-        
-        # 3. Similarity Check
-        similar = db.find_similar(env_data['id'], embedding, threshold=req.threshold)
+        # 0. Verbatim / near-verbatim resubmissions are answered by the lexical tier without model calls
+        # 1-3. Otherwise requirement analysis runs alongside embedding + similarity search
+        result = await run_check_pipeline(db, env_data, req.prompt, req.url, req.model, req.threshold,
+                                          lexical=not req.full_analysis)
+        similar = result["similar_prompts"]
+        timings = result["timings"]
         
         # 4. Auto-save if no similar prompts found
         was_saved = False
         if not similar:
-            db.save_prompt(env_data['id'], req.prompt, embedding)
+            start = time.perf_counter()
+            await db.save_prompt(env_data['id'], req.prompt, result["embedding"])
+            timings["save"] = round((time.perf_counter() - start) * 1000, 1)
+            metrics.observe_stage("save", timings["save"] / 1000)
             was_saved = True
+        metrics.record_check_outcome(similar, result["lexical_match"], was_saved)
         
         return {
-            "requirement_analysis": req_analysis,
+            "requirement_analysis": result["requirement_analysis"],
             "similar_prompts": similar,
             "prompt_text": req.prompt,
             "environment_id": env_data['id'],
-            "was_saved": was_saved
+            "was_saved": was_saved,
+            "lexical_match": result["lexical_match"],
+            "analysis_cached": result["analysis_cached"],
+            "requirements_tokens": result["requirements_tokens"],
+            "timings": timings
         }
+    finally:
+        await db.close()
+
+check_flight = SingleFlight()
+
+@app.post("/api/check")
+async def check_prompt(req: CheckRequest):
+    # Double-clicks, client retries and teammates pasting the same template share one
+    # pipeline run: one set of LM Studio calls and at most one saved prompt.
+    key = (req.project.lower(), req.environment.lower(), normalize_prompt(req.prompt),
+           req.url.rstrip("/"), req.model, req.threshold, req.full_analysis)
+    try:
+        result, shared = await check_flight.run(key, lambda: _check_and_save(req))
+    except (HTTPException, PoolTimeout, QueueFull):
+        raise
     except RuntimeError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Unexpected error: {e}")
+    if shared:
+        metrics.COALESCED_CALLS.inc(operation="check")
+    return {**result, "prompt_text": req.prompt, "coalesced": shared}
+
+@app.post("/api/check/stream")
+async def check_prompt_stream(req: CheckRequest):
+    """
+    Server-Sent Events variant of /api/check: similarity results, analysis tokens and the
+    parsed analysis are sent as they become available instead of in one final response.
+    """
+    # The connection is held for the whole stream, so it is managed here rather than by get_db.
+    db = AsyncDBManager(await asyncio.to_thread(DBManager, pooled=True))
+    env_data = None
+    try:
+        env_data = await db.get_environment_by_name(req.project, req.environment)
     finally:
-        db.close()
+        if not env_data:
+            await db.close()
+    if not env_data:
+        raise HTTPException(status_code=404, detail=f"Environment '{req.environment}' for project '{req.project}' not found")
+
+    async def stream():
+        try:
+            async for event, payload in stream_check_pipeline(
+                db, env_data, req.prompt, req.url, req.model, req.threshold, lexical=not req.full_analysis
+            ):
+                yield f"event: {event}\ndata: {json.dumps(payload, default=str)}\n\n"
+        finally:
+            await db.close()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        # Keep proxies from buffering the stream into one late response.
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/api/check/batch")
+async def check_prompt_batch(req: BatchCheckRequest):
+    """Checks a list of prompts and streams one NDJSON line per prompt, then a summary line."""
+    if not req.prompts:
+        raise HTTPException(status_code=400, detail="No prompts provided")
+    if req.batch_size is not None and req.batch_size < 1:
+        raise HTTPException(status_code=400, detail="batch_size must be at least 1")
+
+    # The connection is held for the whole stream, so it is managed here rather than by get_db.
+    db = AsyncDBManager(await asyncio.to_thread(DBManager, pooled=True))
+    env_data = None
+    try:
+        env_data = await db.get_environment_by_name(req.project, req.environment)
+    finally:
+        if not env_data:
+            await db.close()
+    if not env_data:
+        raise HTTPException(status_code=404, detail=f"Environment '{req.environment}' for project '{req.project}' not found")
+
+    async def stream():
+        summary = {"total": len(req.prompts), "saved": 0, "similar_in_environment": 0, "duplicates_in_batch": 0}
+        try:
+            # Batch LM Studio calls wait behind interactive checks instead of being turned away.
+            with priority("batch"):
+                async for item in run_batch_pipeline(
+                    db, env_data, req.prompts, req.url, req.model, req.threshold,
+                    batch_size=req.batch_size, analyze=req.analyze, save=req.save
+                ):
+                    summary["saved"] += item["was_saved"]
+                    summary["similar_in_environment"] += bool(item["similar_prompts"])
+                    summary["duplicates_in_batch"] += bool(item["batch_duplicates"])
+                    yield json.dumps(item, default=str) + "\n"
+            yield json.dumps({"summary": summary}) + "\n"
+        except RuntimeError as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+        except Exception as e:
+            # Headers are long gone: the error line is the only way to tell the client the batch stopped.
+            logger.exception("Batch check for '%s'/'%s' failed", req.project, req.environment)
+            yield json.dumps({"error": f"{type(e).__name__}: {e}"}) + "\n"
+        finally:
+            await db.close()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
 
 @app.post("/api/save")
-async def save_prompt(req: CheckRequest):
-    db = DBManager()
+async def save_prompt(req: CheckRequest, db: AsyncDBManager = Depends(get_db)):
     try:
-        env_data = db.get_environment_by_name(req.project, req.environment)
+        env_data = await db.get_environment_by_name(req.project, req.environment)
         if not env_data:
             raise HTTPException(status_code=404, detail=f"Environment '{req.environment}' for project '{req.project}' not found")
         
-        embedding = get_embedding(req.prompt, req.url, req.model)
-        db.save_prompt(env_data['id'], req.prompt, embedding)
+        embedding = await get_embedding_async(req.prompt, req.url, req.model)
+        await db.save_prompt(env_data['id'], req.prompt, embedding)
         return {"message": "Prompt saved successfully"}
+    except (HTTPException, QueueFull):
+        raise
     except RuntimeError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Unexpected error: {e}")
-    finally:
-        db.close()
+
+@app.get("/api/debug/model-cache")
+async def get_model_cache():
+    return {"models": cached_models()}
+
+@app.delete("/api/debug/model-cache")
+async def clear_model_cache(url: Optional[str] = None):
+    """Forgets resolved model IDs (for one LM Studio URL, or all) so the next call rediscovers them."""
+    cleared = invalidate_models(url)
+    return {"message": f"Cleared {cleared} cached model entries"}
 
 @app.delete("/api/debug/reset-prompts")
-async def reset_prompts(req: CheckRequest):
+async def reset_prompts(req: CheckRequest, db: AsyncDBManager = Depends(get_db)):
     # We use CheckRequest to get the URL/model to determine the NEW dimension
-    db = DBManager()
     try:
-        embedding = get_embedding(req.prompt, req.url, req.model)
+        embedding = await get_embedding_async(req.prompt, req.url, req.model)
         dim = len(embedding)
-        db.reset_prompts_table(dim)
+        await db.reset_prompts_table(dim)
         return {"message": f"Prompt database reset to {dim} dimensions"}
+    except (HTTPException, QueueFull):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        db.close()
 
-@app.post("/api/projects/import-pdf")
-async def import_pdf_requirements(file: UploadFile = File(...)):
+reembed_job: Optional[ReembedJob] = None
+
+@app.post("/api/debug/reembed", status_code=202)
+async def start_reembedding(req: ReembedRequest):
+    """Re-embeds every prompt with another model in the background, keeping the library online."""
+    global reembed_job
+    if reembed_job and reembed_job.running:
+        raise HTTPException(status_code=409, detail="A re-embedding job is already running")
+    reembed_job = ReembedJob(req.url, req.model, req.batch_size, req.pause).start()
+    return reembed_job.to_dict()
+
+@app.get("/api/debug/reembed")
+async def get_reembedding():
+    if not reembed_job:
+        return {"status": "idle"}
+    return reembed_job.to_dict()
+
+@app.delete("/api/debug/reembed")
+async def cancel_reembedding():
+    """Stops the running job and discards its partial results; searches are unaffected."""
+    if not reembed_job:
+        raise HTTPException(status_code=404, detail="No re-embedding job")
+    await reembed_job.cancel()
+    return reembed_job.to_dict()
+
+@app.post("/api/debug/rebuild-index")
+async def rebuild_index(kind: Optional[str] = None, db: AsyncDBManager = Depends(get_db)):
+    """Rebuilds the prompts.embedding ANN index online (hnsw, ivfflat or none)."""
+    try:
+        return await db.rebuild_vector_index(kind)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def _spool_pdf(file: UploadFile):
     if not file.filename.lower().endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Only PDF files are supported.")
-    
     try:
-        content = await file.read()
-        text = ""
-        with pdfplumber.open(BytesIO(content)) as pdf:
-            for page in pdf.pages:
-                extracted = page.extract_text()
-                if extracted:
-                    text += extracted + "\n"
-        
-        return {"text": text.strip()}
+        return await asyncio.to_thread(spool_upload, file.file)
+    except PdfLimitError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+@app.post("/api/projects/import-pdf")
+async def import_pdf_requirements(file: UploadFile = File(...)):
+    path = await _spool_pdf(file)
+    try:
+        # pdfplumber is CPU-bound; pages are extracted in worker processes, off the event loop.
+        return {"text": await pdf_extractor.extract(path)}
+    except PdfLimitError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to extract PDF text: {str(e)}")
+    finally:
+        os.unlink(path)
+
+@app.post("/api/projects/import-pdf/jobs", status_code=202)
+async def start_pdf_import(file: UploadFile = File(...)):
+    """Starts a background extraction; poll the returned job for progress and the text."""
+    path = await _spool_pdf(file)
+    return pdf_extractor.submit(path, file.filename).to_dict()
+
+@app.get("/api/projects/import-pdf/jobs/{job_id}")
+async def get_pdf_import(job_id: str):
+    job = pdf_extractor.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found or expired")
+    return job.to_dict()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,117 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from db_manager import QUANTIZED_COLUMNS, DBManager  # noqa: E402
+
+
+def storage(db):
+    """Bytes held by each embedding column and each index on prompts."""
+    with db.conn.cursor() as cur:
+        cur.execute("""
+            SELECT attname FROM pg_attribute
+            WHERE attrelid = 'prompts'::regclass AND attname = ANY(%s) AND NOT attisdropped;
+        """, (["embedding", *QUANTIZED_COLUMNS.values()],))
+        columns = [row[0] for row in cur.fetchall()]
+        cur.execute("SELECT " + ", ".join(f"coalesce(sum(pg_column_size({c})), 0)" for c in columns) + " FROM prompts;")
+        sizes = {f"column_{c}_bytes": int(v) for c, v in zip(columns, cur.fetchone())}
+        cur.execute("""
+            SELECT c.relname, pg_relation_size(c.oid)
+            FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE i.indrelid = 'prompts'::regclass;
+        """)
+        sizes.update({f"index_{name}_bytes": int(size) for name, size in cur.fetchall()})
+    return sizes
+
+
+def queries(db, environment_id, count, noise, seed=0):
+    """Stored embeddings with gaussian noise, so each query has close but not identical neighbours."""
+    ids, matrix = db.export_embeddings(environment_id)
+    if not len(ids):
+        raise RuntimeError("The environment has no prompts; seed it first.")
+    rng = np.random.default_rng(seed)
+    sample = matrix[rng.choice(len(matrix), size=min(count, len(matrix)), replace=False)]
+    scale = noise * np.abs(sample).mean()
+    return (sample + rng.normal(0, scale, sample.shape).astype(np.float32)).tolist()
+
+
+def measure(db, environment_id, vectors, k, truth=None, **search):
+    latencies, results = [], []
+    for vector in vectors:
+        start = time.perf_counter()
+        matches = db.find_similar(environment_id, vector, threshold=-1.0, limit=k, **search)
+        latencies.append(time.perf_counter() - start)
+        results.append([m['id'] for m in matches])
+    ms = np.asarray(latencies) * 1000
+    summary = {
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(ms, 95)), 2),
+    }
+    if truth is not None:
+        hits = sum(len(set(found) & set(expected)) for found, expected in zip(results, truth))
+        summary[f"recall_at_{k}"] = round(hits / max(sum(len(t) for t in truth), 1), 4)
+    return summary, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare storage, recall and latency of full-precision and quantized search")
+    parser.add_argument("--project", default="bench-project-0", help="Project name (seed_corpus.py default)")
+    parser.add_argument("--environment", default="bench-env-0", help="Environment name (seed_corpus.py default)")
+    parser.add_argument("--modes", default="ann,halfvec,binary", help="Comma-separated subset of ann,halfvec,binary")
+    parser.add_argument("--queries", type=int, default=100, help="Query vectors sampled from the environment")
+    parser.add_argument("--noise", type=float, default=0.3, help="Query noise relative to the mean absolute component")
+    parser.add_argument("-k", type=int, default=10, help="Neighbours per query")
+    parser.add_argument("--keep", action="store_true", help="Keep the compact columns afterwards (dropped by default)")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    db = DBManager()
+    try:
+        env = db.get_environment_by_name(args.project, args.environment)
+        if not env:
+            raise RuntimeError(f"Environment '{args.environment}' for project '{args.project}' not found; seed it first.")
+        vectors = queries(db, env['id'], args.queries, args.noise)
+        exact, truth = measure(db, env['id'], vectors, args.k, exact=True)
+        report = {"config": vars(args), "pgvector": ".".join(map(str, db.pgvector_version())),
+                  "results": [{"mode": "exact", **exact, "storage": storage(db)}]}
+
+        print(f"{'mode':>8} {'recall':>8} {'p50 ms':>9} {'p95 ms':>9}")
+        print(f"{'exact':>8} {1.0:>8.4f} {exact['p50_ms']:>9.2f} {exact['p95_ms']:>9.2f}")
+        for mode in [m for m in args.modes.split(",") if m]:
+            if mode == "halfvec" and db.pgvector_version() < (0, 7):
+                print(f"{mode:>8} skipped (needs pgvector 0.7+)")
+                continue
+            prepare = None
+            if mode != "ann":
+                start = time.perf_counter()
+                prepare = db.ensure_quantization(mode)
+                prepare["seconds"] = round(time.perf_counter() - start, 2)
+            summary, _ = measure(db, env['id'], vectors, args.k, truth, exact=False,
+                                 quantization="none" if mode == "ann" else mode)
+            report["results"].append({"mode": mode, **summary, "prepare": prepare, "storage": storage(db)})
+            print(f"{mode:>8} {summary[f'recall_at_{args.k}']:>8.4f} {summary['p50_ms']:>9.2f} {summary['p95_ms']:>9.2f}")
+        print("\nStorage:")
+        for name, size in report["results"][-1]["storage"].items():
+            print(f"  {name:<40} {size / 1e6:>10.2f} MB")
+        if not args.keep:
+            db.ensure_quantization("none")
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    finally:
+        db.close()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n[+] Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
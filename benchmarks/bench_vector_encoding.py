@@ -0,0 +1,109 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2.extras import execute_values
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from db_manager import DBManager  # noqa: E402
+from vector_codec import Vector, copy_binary  # noqa: E402
+
+
+def per_call(fn, iterations):
+    """Mean wall time of `fn()` in microseconds."""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def bench_encoding(vector, iterations):
+    legacy = psycopg2.extensions.adapt(vector).getquoted()
+    return {
+        "legacy_list_us": per_call(lambda: psycopg2.extensions.adapt(vector).getquoted(), iterations),
+        "vector_text_us": per_call(lambda: Vector(vector).getquoted(), iterations),
+        "vector_binary_us": per_call(lambda: Vector(vector).to_binary(), iterations),
+        "legacy_list_bytes": len(legacy),
+        "vector_text_bytes": len(Vector(vector).getquoted()),
+        "vector_binary_bytes": len(Vector(vector).to_binary()),
+    }
+
+
+def bench_round_trip(db, vector, iterations):
+    """A find_similar-shaped statement: the old form interpolated the list twice."""
+    with db.conn.cursor() as cur:
+        def legacy():
+            cur.execute("SELECT 1 - (%(q)s::vector <=> %(q)s::vector) ORDER BY %(q)s::vector <=> %(q)s::vector;", {"q": vector})
+            cur.fetchall()
+
+        def adapted():
+            cur.execute("SELECT 1 - distance FROM (SELECT %(q)s <=> %(q)s AS distance) d;", {"q": Vector(vector)})
+            cur.fetchall()
+
+        return {"legacy_list_us": per_call(legacy, iterations), "vector_text_us": per_call(adapted, iterations)}
+
+
+def bench_bulk_insert(db, vectors, rounds):
+    dim = len(vectors[0])
+    with db.conn.cursor() as cur:
+        cur.execute(f"CREATE TEMP TABLE bench_vectors (id INTEGER, prompt_text TEXT, embedding vector({dim}));")
+        rows = [(i, f"prompt {i}", v) for i, v in enumerate(vectors)]
+
+        def legacy():
+            execute_values(cur, "INSERT INTO bench_vectors VALUES %s;", rows, page_size=len(rows))
+            cur.execute("TRUNCATE bench_vectors;")
+
+        def text_literals():
+            execute_values(cur, "INSERT INTO bench_vectors VALUES %s;", [(i, t, Vector(v)) for i, t, v in rows], page_size=len(rows))
+            cur.execute("TRUNCATE bench_vectors;")
+
+        def binary_copy():
+            copy_binary(cur, "bench_vectors", [("id", "int4"), ("prompt_text", "text"), ("embedding", "vector")], rows)
+            cur.execute("TRUNCATE bench_vectors;")
+
+        result = {
+            "rows": len(rows),
+            "legacy_list_ms": per_call(legacy, rounds) / 1000,
+            "vector_text_ms": per_call(text_literals, rounds) / 1000,
+            "binary_copy_ms": per_call(binary_copy, rounds) / 1000,
+        }
+        cur.execute("DROP TABLE bench_vectors;")
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare list vs pgvector-adapted embedding encoding cost")
+    parser.add_argument("--dim", type=int, default=1536, help="Embedding dimensions")
+    parser.add_argument("--iterations", type=int, default=200, help="Calls per encoding / round-trip measurement")
+    parser.add_argument("--rows", type=int, default=500, help="Rows per bulk insert measurement")
+    parser.add_argument("--rounds", type=int, default=5, help="Bulk inserts per measurement")
+    parser.add_argument("--no-db", action="store_true", help="Only measure client-side encoding")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    vectors = [[rng.uniform(-1, 1) for _ in range(args.dim)] for _ in range(args.rows)]
+    report = {"dim": args.dim, "encode": bench_encoding(vectors[0], args.iterations)}
+
+    if not args.no_db:
+        try:
+            db = DBManager()
+        except psycopg2.Error as e:
+            print(f"Error: Could not connect to the database ({e}). Use --no-db for encoding only.", file=sys.stderr)
+            sys.exit(1)
+        try:
+            report["round_trip"] = bench_round_trip(db, vectors[0], args.iterations)
+            report["bulk_insert"] = bench_bulk_insert(db, vectors, args.rounds)
+        finally:
+            db.close()
+
+    print(json.dumps({k: ({m: round(v, 1) for m, v in s.items()} if isinstance(s, dict) else s) for k, s in report.items()}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+EMBEDDING_MODEL = "text-embedding-fake"
+CHAT_MODEL = "fake-chat-instruct"
+ANALYSIS = "STATUS: PASSED\nSUMMARY: The prompt meets the project requirements.\nWORKFLOW: 1. Read the input.\n2. Answer."
+
+
+def fake_embedding(text, dim):
+    """Deterministic unit vector for `text`: the same text always maps to the same vector."""
+    seed = int.from_bytes(hashlib.sha256(" ".join(text.split()).encode("utf-8")).digest()[:8], "big")
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def create_app(dim=768, embedding_latency=0.0, embedding_item_latency=0.0, chat_latency=0.0,
+               token_latency=0.0, jitter=0.0, seed=0):
+    """
+    OpenAI-compatible stand-in for LM Studio serving /v1/models, /v1/embeddings and /v1/chat/completions.
+
+    Latencies are in seconds: `embedding_latency` per request plus `embedding_item_latency`
+    per input, `chat_latency` per completion and `token_latency` between streamed chunks.
+    `jitter` adds up to that fraction of random extra delay (seeded, so runs repeat).
+    """
+    app = FastAPI(title="Fake LM Studio")
+    rng = random.Random(seed)
+
+    async def delay(seconds):
+        if seconds > 0:
+            await asyncio.sleep(seconds * (1 + jitter * rng.random()))
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": EMBEDDING_MODEL, "object": "model"}, {"id": CHAT_MODEL, "object": "model"}]}
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        await delay(embedding_latency + embedding_item_latency * len(inputs))
+        data = [{"object": "embedding", "index": i, "embedding": fake_embedding(text, dim).tolist()} for i, text in enumerate(inputs)]
+        return {"object": "list", "model": body.get("model", EMBEDDING_MODEL), "data": data}
+
+    @app.post("/v1/chat/completions")
+    async def chat(request: Request):
+        body = await request.json()
+        if body.get("model") not in (None, CHAT_MODEL):
+            return JSONResponse(status_code=404, content={"error": f"Model '{body['model']}' not found"})
+        if not body.get("stream"):
+            await delay(chat_latency)
+            return {"model": CHAT_MODEL, "choices": [{"index": 0, "message": {"role": "assistant", "content": ANALYSIS}}]}
+
+        async def events():
+            await delay(chat_latency)
+            for line in ANALYSIS.splitlines(keepends=True):
+                yield f"data: {json.dumps({'choices': [{'delta': {'content': line}}]})}\n\n"
+                await delay(token_latency)
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible LM Studio server for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1235)
+    parser.add_argument("--dim", type=int, default=768, help="Embedding dimensions")
+    parser.add_argument("--embedding-latency", type=float, default=20.0, help="Milliseconds per /embeddings request")
+    parser.add_argument("--embedding-item-latency", type=float, default=2.0, help="Extra milliseconds per embedded input")
+    parser.add_argument("--chat-latency", type=float, default=800.0, help="Milliseconds per chat completion")
+    parser.add_argument("--token-latency", type=float, default=20.0, help="Milliseconds between streamed chunks")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Random extra delay as a fraction of each latency")
+    args = parser.parse_args()
+
+    import uvicorn
+    app = create_app(args.dim, args.embedding_latency / 1000, args.embedding_item_latency / 1000,
+                     args.chat_latency / 1000, args.token_latency / 1000, args.jitter)
+    print(f"[+] Fake LM Studio on http://{args.host}:{args.port}/v1 ({args.dim} dimensions)")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import sys
+import time
+import uuid
+
+import httpx
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from db_manager import DBManager  # noqa: E402
+from fake_lm_server import fake_embedding  # noqa: E402
+from seed_corpus import environment_size, prompt_text, seed  # noqa: E402
+
+TARGETS = ("check", "save", "find_similar")
+
+
+def summarize(latencies, elapsed, failures):
+    """Throughput and latency percentiles (ms) of one measurement."""
+    ms = np.asarray(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "requests": len(latencies) + failures,
+        "failures": failures,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(float(ms.mean()), 1),
+        "p50_ms": round(float(np.percentile(ms, 50)), 1),
+        "p95_ms": round(float(np.percentile(ms, 95)), 1),
+        "p99_ms": round(float(np.percentile(ms, 99)), 1),
+    }
+
+
+async def run_level(call, requests, concurrency):
+    """Runs `call(i)` for i in range(requests) with at most `concurrency` in flight."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+
+    async def one(i):
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                ok = await call(i)
+            except (httpx.HTTPError, RuntimeError):
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return summarize(latencies, time.perf_counter() - start, failures)
+
+
+def http_call(client, args, path):
+    async def call(i):
+        payload = {
+            "project": args.project,
+            "environment": args.environment,
+            # Unique text so every request does the full analysis + embedding round-trip.
+            "prompt": f"{args.prompt} [{uuid.uuid4().hex}]",
+            "threshold": args.threshold,
+            "url": args.url,
+        }
+        resp = await client.post(path, json=payload)
+        return resp.status_code == 200
+    return call
+
+
+def find_similar_call(args, environment_id, rows):
+    # Queries are seeded prompts, so every search has at least one true neighbour.
+    def search(i):
+        text = prompt_text(0, 0, i % max(rows, 1))
+        db = DBManager(pooled=True)
+        try:
+            db.find_similar(environment_id, fake_embedding(text, args.dim), threshold=args.threshold)
+        finally:
+            db.close()
+        return True
+
+    async def call(i):
+        return await asyncio.to_thread(search, i)
+    return call
+
+
+def environment_rows(args):
+    db = DBManager()
+    try:
+        env = db.get_environment_by_name(args.project, args.environment)
+        if not env:
+            raise RuntimeError(f"Environment '{args.environment}' for project '{args.project}' not found; seed it first.")
+        return env['id'], environment_size(db, env['id'])
+    finally:
+        db.close()
+
+
+def grow_corpus(args, size):
+    db = DBManager()
+    try:
+        summary = seed(db, 1, 1, size, args.dim, args.prefix)
+        db.rebuild_vector_index()
+        return summary
+    finally:
+        db.close()
+
+
+async def main_async(args):
+    targets = [t for t in args.targets.split(",") if t]
+    unknown = set(targets) - set(TARGETS)
+    if unknown:
+        raise SystemExit(f"Unknown targets: {', '.join(sorted(unknown))}. Choose from {', '.join(TARGETS)}.")
+    levels = [int(c) for c in args.concurrency.split(",")]
+    sizes = [int(s) for s in args.sizes.split(",")] if args.sizes else [None]
+    needs_db = "find_similar" in targets or args.sizes
+
+    report = {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "version": None,
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "results": [],
+    }
+    async with httpx.AsyncClient(base_url=args.server, timeout=None) as client:
+        if {"check", "save"} & set(targets):
+            report["version"] = (await client.get("/api/info")).json().get("version")
+
+        print(f"{'target':>12} {'rows':>9} {'conc':>5} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'fail':>5}")
+        for size in sizes:
+            if size is not None:
+                await asyncio.to_thread(grow_corpus, args, size)
+            environment_id, rows = await asyncio.to_thread(environment_rows, args) if needs_db else (None, None)
+            for target in targets:
+                if target == "find_similar":
+                    call = find_similar_call(args, environment_id, rows)
+                else:
+                    call = http_call(client, args, "/api/check" if target == "check" else "/api/save")
+                for level in levels:
+                    result = {"target": target, "table_rows": rows, "concurrency": level,
+                              **await run_level(call, args.requests, level)}
+                    report["results"].append(result)
+                    print(f"{target:>12} {rows if rows is not None else '-':>9} {level:>5} {result['throughput_rps']:>9.2f} "
+                          f"{result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} {result['p99_ms']:>9.1f} {result['failures']:>5}")
+    return report
+
+
+def compare(report, baseline):
+    """Prints p95 and throughput changes against a previous report for matching measurements."""
+    previous = {(r["target"], r["table_rows"], r["concurrency"]): r for r in baseline["results"]}
+    print(f"\nCompared with {baseline.get('version') or 'baseline'} ({baseline['timestamp']}):")
+    for r in report["results"]:
+        old = previous.get((r["target"], r["table_rows"], r["concurrency"]))
+        if not old or not old["p95_ms"] or not old["throughput_rps"]:
+            continue
+        p95 = (r["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100
+        rps = (r["throughput_rps"] - old["throughput_rps"]) / old["throughput_rps"] * 100
+        print(f"  {r['target']:>12} rows={r['table_rows']} conc={r['concurrency']}: p95 {p95:+.1f}%, throughput {rps:+.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure latency percentiles and throughput at increasing concurrency")
+    parser.add_argument("--server", default="http://localhost:8000", help="Prompt Manager base URL")
+    parser.add_argument("--project", default="bench-project-0", help="Project name (seed_corpus.py default)")
+    parser.add_argument("--environment", default="bench-env-0", help="Environment name (seed_corpus.py default)")
+    parser.add_argument("--url", default="http://localhost:1234/v1", help="LM Studio (or fake_lm_server.py) API Base URL")
+    parser.add_argument("--prompt", default="Summarize the attached quarterly report.", help="Base prompt text")
+    parser.add_argument("--threshold", type=float, default=0.99, help="Similarity threshold sent with each check")
+    parser.add_argument("--requests", type=int, default=32, help="Requests per concurrency level")
+    parser.add_argument("--concurrency", default="1,2,4,8", help="Comma-separated concurrency levels")
+    parser.add_argument("--targets", default="check", help=f"Comma-separated subset of {','.join(TARGETS)}")
+    parser.add_argument("--sizes", help="Comma-separated environment sizes; the corpus is grown to each before measuring")
+    parser.add_argument("--dim", type=int, default=768, help="Embedding dimensions for seeding and find_similar queries")
+    parser.add_argument("--prefix", default="bench", help="Seeded project/environment prefix used by --sizes")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Previous JSON results to compare p95 and throughput against")
+    args = parser.parse_args()
+    if args.sizes:
+        args.project, args.environment = f"{args.prefix}-project-0", f"{args.prefix}-env-0"
+
+    try:
+        report = asyncio.run(main_async(args))
+    except httpx.HTTPError as e:
+        print(f"Error talking to {args.server}: {e}")
+        sys.exit(1)
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n[+] Results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from db_manager import DBManager  # noqa: E402
+from fake_lm_server import fake_embedding  # noqa: E402
+
+REQUIREMENTS = (
+    "- Prompts must state the expected output format.\n"
+    "- Prompts must not ask for personal data.\n"
+    "- Prompts should name the target audience."
+)
+_VERBS = ["Summarize", "Translate", "Classify", "Rewrite", "Explain", "Extract", "Review", "Draft"]
+_OBJECTS = ["the quarterly report", "this support ticket", "the release notes", "a customer email",
+            "the meeting transcript", "this contract clause", "the incident postmortem", "a product description"]
+_AUDIENCES = ["for executives", "for new hires", "for the legal team", "for customers", "for engineers"]
+_FORMATS = ["as bullet points", "in one paragraph", "as a JSON object", "in under 100 words", "as a table"]
+
+
+def prompt_text(project, environment, index):
+    """Deterministic, realistic-looking prompt; the index keeps every prompt unique."""
+    rng = random.Random(f"{project}/{environment}/{index}")
+    return (f"{rng.choice(_VERBS)} {rng.choice(_OBJECTS)} {rng.choice(_AUDIENCES)} "
+            f"{rng.choice(_FORMATS)}. Reference #{project}-{environment}-{index}.")
+
+
+def environment_size(db, environment_id):
+    with db.conn.cursor() as cur:
+        cur.execute("SELECT count(*) FROM prompts WHERE environment_id = %s;", (environment_id,))
+        return cur.fetchone()[0]
+
+
+def seed(db, projects, environments, prompts, dim, prefix="bench", batch_size=1000):
+    """
+    Creates `projects` x `environments` and tops each environment up to `prompts` prompts.
+
+    Embeddings come from fake_embedding, so checks served by the fake LM server find
+    the seeded prompts. Seeding again with a larger `prompts` only adds the difference.
+    Returns a summary dict.
+    """
+    db._ensure_schema(dim)
+    start = time.perf_counter()
+    added = 0
+    for p in range(projects):
+        project = f"{prefix}-project-{p}"
+        db.create_project(project, REQUIREMENTS)
+        for e in range(environments):
+            environment_id = db.create_environment(project, f"{prefix}-env-{e}")
+            existing = environment_size(db, environment_id)
+            for batch_start in range(existing, prompts, batch_size):
+                texts = [prompt_text(p, e, i) for i in range(batch_start, min(batch_start + batch_size, prompts))]
+                db.save_prompts(environment_id, [(text, fake_embedding(text, dim)) for text in texts])
+                added += len(texts)
+    with db.conn.cursor() as cur:
+        cur.execute("SELECT count(*) FROM prompts;")
+        total = cur.fetchone()[0]
+    return {
+        "projects": projects,
+        "environments_per_project": environments,
+        "prompts_per_environment": prompts,
+        "dimensions": dim,
+        "prompts_added": added,
+        "prompts_total": total,
+        "seconds": round(time.perf_counter() - start, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed benchmark projects, environments and prompts")
+    parser.add_argument("--projects", type=int, default=1)
+    parser.add_argument("--environments", type=int, default=1, help="Environments per project")
+    parser.add_argument("--prompts", type=int, default=10000, help="Prompts per environment (existing ones are kept)")
+    parser.add_argument("--dim", type=int, default=768, help="Embedding dimensions (must match the fake server)")
+    parser.add_argument("--prefix", default="bench", help="Name prefix for seeded projects and environments")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Prompts per bulk insert")
+    parser.add_argument("--rebuild-index", action="store_true", help="Rebuild the vector index after seeding")
+    args = parser.parse_args()
+
+    try:
+        db = DBManager()
+    except psycopg2.Error as e:
+        print(f"Error: Could not connect to the database ({e}).", file=sys.stderr)
+        sys.exit(1)
+    try:
+        summary = seed(db, args.projects, args.environments, args.prompts, args.dim, args.prefix, args.batch_size)
+        if args.rebuild_index:
+            summary["index"] = db.rebuild_vector_index()["message"]
+    except RuntimeError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        db.close()
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
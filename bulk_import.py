@@ -0,0 +1,219 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from db_manager import DBManager
+from similarity_check import LM_STUDIO_DEFAULT_URL, get_embeddings, unit_rows
+
+
+def iter_prompts(source, field="prompt", pattern="*.txt"):
+    """
+    Streams prompt texts from a directory (one prompt per file matching `pattern`),
+    a JSONL file (objects with `field`, or bare strings) or a CSV file (column `field`).
+    The order is deterministic so a checkpoint's record count can be resumed from.
+    """
+    path = Path(source)
+    if path.is_dir():
+        for file in sorted(p for p in path.rglob(pattern) if p.is_file()):
+            yield file.read_text(encoding="utf-8", errors="replace").strip()
+    elif path.suffix.lower() == ".jsonl":
+        with open(path, encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if isinstance(record, dict):
+                    if field not in record:
+                        raise ValueError(f"Line {line_no} has no '{field}' field.")
+                    record = record[field]
+                yield str(record).strip()
+    elif path.suffix.lower() == ".csv":
+        with open(path, newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            if field not in (reader.fieldnames or []):
+                raise ValueError(f"CSV has no '{field}' column (found: {', '.join(reader.fieldnames or [])}).")
+            for row in reader:
+                yield (row[field] or "").strip()
+    else:
+        raise ValueError(f"Unsupported source '{source}'. Use a directory, a .jsonl file or a .csv file.")
+
+
+def iter_batches(prompts, size, skip=0):
+    """Groups prompts into lists of `size`, after discarding the first `skip` records."""
+    batch = []
+    for i, text in enumerate(prompts):
+        if i < skip:
+            continue
+        batch.append(text)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def load_checkpoint(path, identity):
+    """
+    The checkpoint file's state, or a fresh one. `import_id` names the import's row in
+    the database's import_checkpoints table, which is committed with every batch.
+    """
+    if not os.path.exists(path):
+        return {**identity, "import_id": uuid.uuid4().hex, "processed": 0, "saved": 0, "duplicates": 0, "empty": 0,
+                "completed": False}
+    with open(path) as f:
+        checkpoint = json.load(f)
+    for key, value in identity.items():
+        if checkpoint.get(key) != value:
+            raise ValueError(f"Checkpoint '{path}' belongs to a different import ({key}: {checkpoint.get(key)!r}).")
+    checkpoint.setdefault("import_id", uuid.uuid4().hex)
+    return checkpoint
+
+
+def save_checkpoint(path, checkpoint):
+    # Write-then-rename so an interrupted run never leaves a truncated checkpoint.
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import prompts into an environment (non-interactive)")
+    parser.add_argument("--project", required=True, help="Project name")
+    parser.add_argument("--environment", required=True, help="Environment name")
+    parser.add_argument("--source", required=True, help="Directory of prompt files, .jsonl or .csv file")
+    parser.add_argument("--field", default="prompt", help="JSONL field / CSV column holding the prompt text")
+    parser.add_argument("--pattern", default="*.txt", help="File glob when --source is a directory")
+    parser.add_argument("--url", default=LM_STUDIO_DEFAULT_URL, help="LM Studio API Base URL")
+    parser.add_argument("--model", help="Specific embedding model name to use")
+    parser.add_argument("--batch-size", type=int, default=64, help="Prompts per embedding request and insert")
+    parser.add_argument("--workers", type=int, default=4, help="Embedding batches in flight")
+    parser.add_argument("--dedupe-threshold", type=float, help="Skip prompts more similar than this to an existing or earlier imported prompt")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <source>.checkpoint.json)")
+    parser.add_argument("--progress-interval", type=float, default=2.0, help="Seconds between throughput reports")
+
+    args = parser.parse_args()
+    checkpoint_path = args.checkpoint or f"{args.source.rstrip('/')}.checkpoint.json"
+
+    try:
+        db = DBManager()
+        env_data = db.get_environment_by_name(args.project, args.environment)
+        if not env_data:
+            print(f"Error: Environment '{args.environment}' for project '{args.project}' not found.", file=sys.stderr)
+            sys.exit(1)
+        checkpoint = load_checkpoint(checkpoint_path, {
+            "source": os.path.abspath(args.source),
+            "project": args.project.lower(),
+            "environment": args.environment.lower(),
+        })
+        # The file is written after each batch commits; a run killed in between left the
+        # database's copy ahead, and it is the one that matches the saved prompts.
+        stored = db.get_import_checkpoint(checkpoint["import_id"])
+        if stored and stored["processed"] > checkpoint["processed"]:
+            checkpoint = stored
+        save_checkpoint(checkpoint_path, checkpoint)
+        batches = iter_batches(iter_prompts(args.source, args.field, args.pattern), args.batch_size, skip=checkpoint["processed"])
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if checkpoint["processed"]:
+        print(f"[i] Resuming after {checkpoint['processed']} records (checkpoint: {checkpoint_path})", file=sys.stderr)
+
+    start = time.perf_counter()
+    last_report = start
+    processed_this_run = 0
+    error = None
+
+    def embed(batch):
+        texts = [t for t in batch if t]
+        return batch, texts, get_embeddings(texts, args.url, args.model, args.batch_size) if texts else []
+
+    # Embedding runs in worker threads; results are committed strictly in submission order
+    # so the checkpoint is always a clean prefix of the source.
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        pending = deque()
+        try:
+            while True:
+                while len(pending) < args.workers * 2:
+                    batch = next(batches, None)
+                    if batch is None:
+                        break
+                    pending.append(pool.submit(embed, batch))
+                if not pending:
+                    break
+
+                batch, texts, embeddings = pending.popleft().result()
+                keep = list(range(len(texts)))
+                if args.dedupe_threshold is not None and texts:
+                    similar = db.find_similar_batch(env_data['id'], embeddings, threshold=args.dedupe_threshold, limit=1)
+                    vectors = unit_rows(embeddings)
+                    within = np.tril(vectors @ vectors.T, k=-1)
+                    keep = []
+                    for i in range(len(texts)):
+                        # Only compare against earlier prompts that are themselves being kept; same
+                        # strict comparison as find_similar_batch.
+                        if not similar[i] and not (keep and within[i, keep].max() > args.dedupe_threshold):
+                            keep.append(i)
+
+                progress = {
+                    **checkpoint,
+                    "processed": checkpoint["processed"] + len(batch),
+                    "empty": checkpoint["empty"] + len(batch) - len(texts),
+                    "saved": checkpoint["saved"] + len(keep),
+                    "duplicates": checkpoint["duplicates"] + len(texts) - len(keep),
+                }
+                # The batch and the progress that covers it commit together, so a resumed run never re-inserts it.
+                db.save_prompts(env_data['id'], [(texts[i], embeddings[i]) for i in keep],
+                                checkpoint=(checkpoint["import_id"], progress))
+                checkpoint = progress
+                save_checkpoint(checkpoint_path, checkpoint)
+                processed_this_run += len(batch)
+
+                now = time.perf_counter()
+                if now - last_report >= args.progress_interval:
+                    rate = processed_this_run / (now - start)
+                    print(f"[~] {checkpoint['processed']} processed, {checkpoint['saved']} saved ({rate:.1f} prompts/sec)", file=sys.stderr)
+                    last_report = now
+        except (Exception, KeyboardInterrupt) as e:
+            error = str(e) or type(e).__name__
+            for future in pending:
+                future.cancel()
+
+    elapsed = time.perf_counter() - start
+    checkpoint["completed"] = error is None
+    save_checkpoint(checkpoint_path, checkpoint)
+    if checkpoint["completed"]:
+        db.delete_import_checkpoint(checkpoint["import_id"])
+    db.close()
+
+    summary = {
+        "project": checkpoint["project"],
+        "environment": checkpoint["environment"],
+        "source": checkpoint["source"],
+        "processed": checkpoint["processed"],
+        "saved": checkpoint["saved"],
+        "duplicates": checkpoint["duplicates"],
+        "empty": checkpoint["empty"],
+        "processed_this_run": processed_this_run,
+        "elapsed_seconds": round(elapsed, 2),
+        "prompts_per_second": round(processed_this_run / elapsed, 1) if elapsed > 0 else None,
+        "completed": checkpoint["completed"],
+        "checkpoint": checkpoint_path,
+        "error": error,
+    }
+    print(json.dumps(summary, indent=2))
+    if error:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
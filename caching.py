@@ -0,0 +1,105 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Thread-safe LRU mapping whose entries expire `ttl` seconds after they were stored.
+
+    `maxsize` bounds the number of entries (least recently used are evicted first);
+    `ttl=None` disables expiry. Hit/miss counters are kept for reporting.
+    """
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            return entry[1] if entry is not None else default
+
+    def clear(self):
+        with self._lock:
+            count = len(self._data)
+            self._data.clear()
+            return count
+
+    def items(self):
+        """Snapshot of the live (unexpired) entries."""
+        now = time.monotonic()
+        with self._lock:
+            return [(k, v) for k, (exp, v) in self._data.items() if exp is None or exp > now]
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical async calls: while `run(key, factory)` for a key is
+    in flight, further calls with the same key await the same task instead of starting
+    their own, and all of them get its result or exception.
+
+    The task is shielded from its callers, so a caller that goes away (client
+    disconnect) neither cancels the work for the others nor leaves it half done.
+    Completed keys are forgotten immediately; this is not a cache.
+    """
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self._calls = {}  # key -> asyncio.Task
+
+    async def run(self, key, factory):
+        """Returns (result, shared) where `shared` is True if another caller started the work."""
+        task = self._calls.get(key)
+        shared = task is not None
+        if shared:
+            self.coalesced += 1
+        else:
+            self.leaders += 1
+            task = self._calls[key] = asyncio.ensure_future(factory())
+            task.add_done_callback(lambda t: self._forget(key, t))
+        return await asyncio.shield(task), shared
+
+    def _forget(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # marks it retrieved even if every caller went away
+
+    def __len__(self):
+        return len(self._calls)
+
+    def stats(self):
+        return {"in_flight": len(self._calls), "leaders": self.leaders, "coalesced": self.coalesced}
@@ -1,7 +1,356 @@
+import asyncio
+import functools
 import psycopg2
-from psycopg2.extras import RealDictCursor
+import psycopg2.extensions
+from psycopg2.extras import RealDictCursor, execute_values
 import json
+import logging
 import os
+import select
+import threading
+import time
+import numpy as np
+from collections import deque
+
+import lexical
+import metrics
+from caching import TTLCache
+from vector_codec import Bits, HalfVector, Vector, VectorCopyReader, copy_binary
+
+
+# Approximate nearest-neighbour index settings for prompts.embedding
+VECTOR_INDEX = os.getenv("VECTOR_INDEX", "hnsw").lower()  # hnsw, ivfflat or none
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "100"))
+HNSW_ITERATIVE_SCAN = os.getenv("HNSW_ITERATIVE_SCAN")  # e.g. relaxed_order (pgvector >= 0.8)
+IVFFLAT_LISTS = os.getenv("IVFFLAT_LISTS")  # derived from the row count when unset
+IVFFLAT_PROBES = int(os.getenv("IVFFLAT_PROBES", "10"))
+VECTOR_EXACT_SEARCH = os.getenv("VECTOR_EXACT_SEARCH", "").lower() in ("1", "true", "yes")
+MAX_INDEXED_DIM = 2000  # pgvector's limit for indexing the vector type
+# Compact embedding copy searched first; candidates are reranked on the full vectors.
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none").lower()  # none, halfvec or binary
+VECTOR_RERANK_OVERSAMPLE = int(os.getenv("VECTOR_RERANK_OVERSAMPLE", "10"))  # candidates fetched per requested result
+QUANTIZED_COLUMNS = {"halfvec": "embedding_half", "binary": "embedding_bits"}
+MAX_INDEXED_COMPACT_DIM = {"halfvec": 4000, "binary": 64000}
+
+_pgvector_version = None
+
+# Project/environment metadata cache (see MetadataCache)
+METADATA_CACHE_SIZE = int(os.getenv("METADATA_CACHE_SIZE", "1024"))
+METADATA_CACHE_TTL = float(os.getenv("METADATA_CACHE_TTL", "300"))  # backstop; notifications invalidate first
+METADATA_CHANNEL = "prompt_metadata"
+SCHEMA_LOCK = 0x70726f6d  # advisory lock key serializing schema upgrades across app instances
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection became available within the checkout timeout."""
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of long-lived autocommit connections.
+
+    Connections are opened lazily up to `maxconn`; `minconn` of them are opened
+    up front by `open()`. A connection that sat idle longer than
+    `healthcheck_interval` seconds is probed with `SELECT 1` before it is handed
+    out and transparently replaced if the probe fails.
+    """
+    def __init__(self, minconn=1, maxconn=10, timeout=30.0, healthcheck_interval=30.0, **conn_kwargs):
+        if maxconn < 1 or minconn < 0 or minconn > maxconn:
+            raise ValueError(f"Invalid pool size: min={minconn}, max={maxconn}")
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.healthcheck_interval = healthcheck_interval
+        self.conn_kwargs = conn_kwargs
+        self._idle = deque()  # (conn, last_used) pairs, most recently used last
+        self._total = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def _connect(self):
+        conn = psycopg2.connect(**self.conn_kwargs)
+        conn.autocommit = True
+        return conn
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            return True
+        except psycopg2.Error:
+            return False
+
+    def open(self):
+        """Pre-opens `minconn` connections so the first requests skip the handshake."""
+        with self._cond:
+            missing = max(0, self.minconn - self._total)
+            self._total += missing
+        opened = []
+        try:
+            for _ in range(missing):
+                opened.append(self._connect())
+        finally:
+            with self._cond:
+                self._total -= missing - len(opened)
+                now = time.monotonic()
+                self._idle.extend((conn, now) for conn in opened)
+                self._cond.notify_all()
+
+    def getconn(self):
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeout("Connection pool is closed.")
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    self._in_use += 1
+                    break
+                if self._total < self.maxconn:
+                    conn, last_used = None, None
+                    self._total += 1
+                    self._in_use += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(
+                        f"Timed out after {self.timeout}s waiting for a database connection "
+                        f"({self._in_use}/{self.maxconn} in use)."
+                    )
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+        # Connecting and probing happen outside the lock so other threads are not stalled.
+        try:
+            if conn is not None and time.monotonic() - last_used > self.healthcheck_interval:
+                if not self._is_healthy(conn):
+                    self._close_quietly(conn)
+                    conn = None
+            if conn is None:
+                conn = self._connect()
+            return conn
+        except Exception:
+            with self._cond:
+                self._total -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def putconn(self, conn, discard=False):
+        if not discard and not conn.closed:
+            # Never hand out a connection with a half-finished transaction.
+            if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    discard = True
+        discard = discard or conn.closed or self._closed
+        if discard:
+            self._close_quietly(conn)
+        with self._cond:
+            self._in_use -= 1
+            if discard:
+                self._total -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "min": self.minconn,
+                "max": self.maxconn,
+                "total": self._total,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+            }
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._total -= len(idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        for conn in idle:
+            self._close_quietly(conn)
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Returns the process-wide connection pool, creating it from the environment on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(
+                minconn=int(os.getenv("DB_POOL_MIN", "1")),
+                maxconn=int(os.getenv("DB_POOL_MAX", "10")),
+                timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+                healthcheck_interval=float(os.getenv("DB_POOL_HEALTHCHECK_INTERVAL", "30")),
+                dbname=os.getenv("DB_NAME", "prompt_similarity"),
+                user=os.getenv("DB_USER", "promptmanager"),
+                password=os.getenv("DB_PASSWORD", ""),
+                host=os.getenv("DB_HOST", "localhost"),
+                port=os.getenv("DB_PORT", "5432"),
+            )
+        return _pool
+
+def pool_stats():
+    """Pool usage counters, or None if no pooled connection has been requested yet."""
+    return _pool.stats() if _pool is not None else None
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+
+def _partition_name(environment_id):
+    """Table holding an environment's prompts (a LIST partition of prompts)."""
+    return f"prompts_env_{int(environment_id)}"
+
+
+def _is_missing_partition(error):
+    return isinstance(error, psycopg2.errors.CheckViolation) and "no partition" in str(error).lower()
+
+
+def _is_dimension_error(error):
+    message = str(error).lower()
+    # pgvector reports "expected N dimensions"; bit columns report length mismatches.
+    return "dimensions" in message or "bit string length" in message or "different sizes" in message
+
+
+class MetadataCache:
+    """
+    In-process cache of get_environment_by_name rows keyed by (project, environment).
+
+    DBManager invalidates it whenever it changes a project or environment and sends
+    the change on the METADATA_CHANNEL NOTIFY channel; a listener thread applies the
+    notifications of every process (itself included) to this process's cache. The
+    cache only serves entries while the listener is connected: without it another
+    instance's edit could go unnoticed, so lookups fall through to Postgres (CLI
+    tools, tests, or after the listener lost its connection, which also clears it).
+
+    A generation counter keeps a lookup that raced an invalidation from storing the
+    row it read before the change.
+    """
+    def __init__(self, maxsize=1024, ttl=None):
+        self.entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.invalidations = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._listening = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def enabled(self):
+        return self._listening
+
+    def get(self, project, environment):
+        return self.entries.get((project, environment)) if self._listening else None
+
+    def generation(self):
+        return self._generation
+
+    def set(self, project, environment, row, generation):
+        with self._lock:
+            if self._listening and generation == self._generation:
+                self.entries.set((project, environment), row)
+
+    def invalidate(self, project, environment=None):
+        """Drops the entries of `project` (or only one of its environments)."""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            stale = [k for k, _ in self.entries.items() if k[0] == project and environment in (None, k[1])]
+            for k in stale:
+                self.entries.pop(k)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            return self.entries.clear()
+
+    def _apply(self, payload):
+        try:
+            change = json.loads(payload)
+            self.invalidate(change["project"], change.get("environment"))
+        except (ValueError, KeyError, TypeError):
+            self.clear()
+
+    def _listen(self, conn_kwargs, poll_interval):
+        backoff = 1.0
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**conn_kwargs)
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {METADATA_CHANNEL};")
+                # Anything cached before LISTEN took effect may have missed a notification.
+                self.clear()
+                self._listening = True
+                backoff = 1.0
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], poll_interval) != ([], [], []):
+                        conn.poll()
+                        while conn.notifies:
+                            self._apply(conn.notifies.pop(0).payload)
+            except psycopg2.Error as e:
+                logger.warning("Metadata cache listener lost its connection: %s", e)
+            finally:
+                self._listening = False
+                self.clear()
+                if conn is not None:
+                    ConnectionPool._close_quietly(conn)
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+    def start_listener(self, poll_interval=1.0, **conn_kwargs):
+        """Starts the LISTEN thread (connection settings default to the pool's) and enables the cache."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._listen, args=(conn_kwargs or get_pool().conn_kwargs, poll_interval),
+                                        name="metadata-cache-listener", daemon=True)
+        self._thread.start()
+
+    def stop_listener(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    def stats(self):
+        return {**self.entries.stats(), "listening": self._listening, "invalidations": self.invalidations}
+
+
+metadata_cache = MetadataCache(maxsize=METADATA_CACHE_SIZE, ttl=METADATA_CACHE_TTL)
+
 
 class DBManager:
     def __init__(self, 
@@ -9,7 +358,14 @@ class DBManager:
                  user=os.getenv("DB_USER", "promptmanager"), 
                  password=os.getenv("DB_PASSWORD", ""), 
                  host=os.getenv("DB_HOST", "localhost"), 
-                 port=os.getenv("DB_PORT", "5432")):
+                 port=os.getenv("DB_PORT", "5432"),
+                 pooled=False):
+        # Pooled managers borrow a connection from the shared pool and return it on close();
+        # the CLI tools keep using a dedicated connection.
+        self._pool = get_pool() if pooled else None
+        if self._pool is not None:
+            self.conn = self._pool.getconn()
+            return
         self.conn = psycopg2.connect(
             dbname=dbname,
             user=user,
@@ -53,32 +409,508 @@ class DBManager:
                 );
             """)
             
-            # Check if prompts table exists and its current dimension
-            cur.execute("SELECT 1 FROM information_schema.tables WHERE table_name = 'prompts';")
-            exists = cur.fetchone()
-            if exists:
-                cur.execute("SELECT atttypmod FROM pg_attribute WHERE attrelid = 'prompts'::regclass AND attname = 'embedding';")
-                current_dim = cur.fetchone()[0]
-                if current_dim != dim and current_dim != -1: # -1 means no dimension specified
-                    # We don't automatically drop, but we could if it's empty.
-                    # For now, we'll let save_prompt catch the error.
-                    pass
-            
+            self._ensure_embedding_cache_table()
+            self._ensure_analysis_cache_table()
+            self._ensure_requirement_chunks_table()
+            self._ensure_import_checkpoints_table()
+
+            # Prompts are LIST-partitioned by environment: searches only touch their
+            # environment's partition, and clearing or deleting an environment is a
+            # TRUNCATE or DROP instead of a row-by-row DELETE.
+            cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('prompts');")
+            existing = cur.fetchone()
+            if existing and existing[0] == 'r':
+                self._partition_prompts_table(cur)
+
             cur.execute(f"""
                 CREATE TABLE IF NOT EXISTS prompts (
-                    id SERIAL PRIMARY KEY,
-                    environment_id INTEGER REFERENCES environments(id) ON DELETE CASCADE,
+                    id SERIAL,
+                    environment_id INTEGER NOT NULL REFERENCES environments(id) ON DELETE CASCADE,
                     prompt_text TEXT NOT NULL,
                     embedding vector({dim}),
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (environment_id, id)
+                ) PARTITION BY LIST (environment_id);
+            """)
+            # Partition-local; serves id lookups and the id-ordered scans of re-embedding.
+            cur.execute("CREATE INDEX IF NOT EXISTS prompts_id_idx ON prompts (id);")
+            self._sync_prompt_partitions(cur)
+            self._ensure_lexical_columns(cur)
+            self._ensure_quantized_column(cur)
+        self.ensure_vector_index()
+
+    def upgrade_schema(self):
+        """
+        Brings an existing database up to the current schema: new columns, caches,
+        partitioning of an older prompts table and its indexes. Returns False without
+        touching anything when there is no prompts table yet; the first save creates it
+        with the model's dimension.
+
+        Safe to run from every app instance at startup: an advisory lock makes
+        concurrent upgrades wait for each other, and each re-checks the schema.
+        """
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s);", (SCHEMA_LOCK,))
+            try:
+                cur.execute("""
+                    SELECT atttypmod FROM pg_attribute
+                    WHERE attrelid = to_regclass('prompts') AND attname = 'embedding' AND NOT attisdropped;
+                """)
+                row = cur.fetchone()
+                if row is None:
+                    return False
+                self._ensure_schema(row[0])
+                return True
+            finally:
+                cur.execute("SELECT pg_advisory_unlock(%s);", (SCHEMA_LOCK,))
+
+    def _ensure_lexical_columns(self, cur):
+        # Lexical duplicate tier: exact normalized-text hash plus MinHash signature and LSH band keys.
+        # Rows saved before these columns existed are filled in by backfill_lexical_signatures().
+        cur.execute("""
+            ALTER TABLE prompts
+                ADD COLUMN IF NOT EXISTS text_hash TEXT,
+                ADD COLUMN IF NOT EXISTS minhash BIGINT[],
+                ADD COLUMN IF NOT EXISTS lsh_buckets BIGINT[];
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS prompts_text_hash_idx ON prompts (text_hash);")
+        cur.execute("CREATE INDEX IF NOT EXISTS prompts_lsh_buckets_idx ON prompts USING gin (lsh_buckets);")
+
+    def _partition_prompts_table(self, cur):
+        """
+        Migrates an unpartitioned prompts table (created before partitioning) in place.
+
+        Runs as one transaction holding an exclusive lock while the rows are copied
+        into a partition per environment; ids, the id sequence and every column
+        (including lexical, compact and re-embedding columns) are kept. Indexes are
+        rebuilt on the partitions by _ensure_schema afterwards.
+        """
+        cur.execute("SELECT pg_get_serial_sequence('prompts', 'id');")
+        sequence = cur.fetchone()[0]
+        cur.execute("BEGIN;")
+        try:
+            cur.execute("LOCK TABLE prompts IN ACCESS EXCLUSIVE MODE;")
+            cur.execute("ALTER TABLE prompts RENAME TO prompts_unpartitioned;")
+            # The sequence would otherwise be dropped with the old table.
+            cur.execute(f"ALTER SEQUENCE {sequence} OWNED BY NONE;")
+            cur.execute("""
+                CREATE TABLE prompts (LIKE prompts_unpartitioned INCLUDING DEFAULTS INCLUDING COMMENTS)
+                PARTITION BY LIST (environment_id);
+            """)
+            cur.execute("SELECT id FROM environments;")
+            for (environment_id,) in cur.fetchall():
+                cur.execute(f"CREATE TABLE {_partition_name(environment_id)} PARTITION OF prompts FOR VALUES IN ({int(environment_id)});")
+            # Prompts without an environment were unreachable; they have no partition to go to.
+            cur.execute("INSERT INTO prompts SELECT * FROM prompts_unpartitioned WHERE environment_id IS NOT NULL;")
+            cur.execute("DROP TABLE prompts_unpartitioned;")
+            cur.execute("""
+                ALTER TABLE prompts
+                    ALTER COLUMN environment_id SET NOT NULL,
+                    ADD PRIMARY KEY (environment_id, id),
+                    ADD FOREIGN KEY (environment_id) REFERENCES environments(id) ON DELETE CASCADE;
+            """)
+            cur.execute(f"ALTER SEQUENCE {sequence} OWNED BY prompts.id;")
+            cur.execute("COMMIT;")
+        except BaseException:
+            cur.execute("ROLLBACK;")
+            raise
+        logger.info("Partitioned the prompts table by environment.")
+
+    def _prompt_partitions(self, cur):
+        """Names of the tables partitioning prompts."""
+        cur.execute("SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = 'prompts'::regclass ORDER BY 1;")
+        return [row[0] for row in cur.fetchall()]
+
+    def _sync_prompt_partitions(self, cur):
+        # Partitions are listed before environments: a partition is only created after its
+        # environment, so one created meanwhile is never mistaken for an orphan.
+        partitions = set(self._prompt_partitions(cur))
+        cur.execute("SELECT id FROM environments;")
+        expected = {_partition_name(row[0]): row[0] for row in cur.fetchall()}
+        for name, environment_id in expected.items():
+            if name not in partitions:
+                cur.execute(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF prompts FOR VALUES IN ({int(environment_id)});")
+        # Environments removed outside DBManager (e.g. TRUNCATE) leave empty partitions behind.
+        for name in partitions - expected.keys():
+            if name.startswith("prompts_env_"):
+                cur.execute(f"DROP TABLE IF EXISTS {name};")
+
+    def _add_prompt_partition(self, environment_id):
+        """Creates the environment's partition; returns False if it already exists or the environment does not."""
+        name = _partition_name(environment_id)
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT to_regclass(%s) IS NULL AND EXISTS (SELECT 1 FROM environments WHERE id = %s);",
+                        (name, environment_id))
+            if not cur.fetchone()[0]:
+                return False
+            cur.execute(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF prompts FOR VALUES IN ({int(environment_id)});")
+        return True
+
+    def _drop_prompt_partition(self, environment_id):
+        """Drops an environment's partition, and with it all of its prompts."""
+        name = _partition_name(environment_id)
+        with self.conn.cursor() as cur:
+            if self.conn.server_version >= 140000:
+                cur.execute("SELECT inhdetachpending FROM pg_inherits WHERE inhrelid = to_regclass(%s) AND inhparent = 'prompts'::regclass;", (name,))
+                row = cur.fetchone()
+                if row and row[0]:
+                    # An earlier concurrent detach was interrupted; it must be finished, not restarted.
+                    cur.execute(f"ALTER TABLE prompts DETACH PARTITION {name} FINALIZE;")
+                elif row:
+                    # Detaching concurrently waits for running searches instead of locking prompts
+                    # (and with it every other environment) while they finish.
+                    cur.execute(f"ALTER TABLE prompts DETACH PARTITION {name} CONCURRENTLY;")
+            cur.execute(f"DROP TABLE IF EXISTS {name};")
+
+    def pgvector_version(self):
+        """Installed pgvector version as a tuple, e.g. (0, 7, 4)."""
+        global _pgvector_version
+        if _pgvector_version is None:
+            with self.conn.cursor() as cur:
+                cur.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector';")
+                row = cur.fetchone()
+            _pgvector_version = tuple(int(part) for part in row[0].split(".")) if row else (0,)
+        return _pgvector_version
+
+    def _ensure_quantized_column(self, cur, mode=None):
+        # Compact copy of the embedding for two-phase search; rows saved before it existed
+        # are filled in by backfill_quantized().
+        mode = mode or VECTOR_QUANTIZATION
+        if mode == "none":
+            return
+        if mode not in QUANTIZED_COLUMNS:
+            raise ValueError(f"Unknown quantization '{mode}'. Use none, halfvec or binary.")
+        if mode == "halfvec" and self.pgvector_version() < (0, 7):
+            raise RuntimeError("halfvec quantization requires pgvector 0.7 or newer; use binary or upgrade the extension.")
+        cur.execute("SELECT atttypmod FROM pg_attribute WHERE attrelid = 'prompts'::regclass AND attname = 'embedding';")
+        dim = cur.fetchone()[0]
+        kind = f"halfvec({dim})" if mode == "halfvec" else f"bit({dim})"
+        cur.execute(f"ALTER TABLE prompts ADD COLUMN IF NOT EXISTS {QUANTIZED_COLUMNS[mode]} {kind};")
+
+    def _ensure_embedding_cache_table(self):
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS embedding_cache (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    embedding REAL[] NOT NULL,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 );
             """)
 
+    def _ensure_analysis_cache_table(self):
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS analysis_cache (
+                    key TEXT PRIMARY KEY,
+                    project TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    analysis TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+            cur.execute("CREATE INDEX IF NOT EXISTS analysis_cache_project_idx ON analysis_cache (project);")
+            cur.execute("CREATE INDEX IF NOT EXISTS analysis_cache_last_used_idx ON analysis_cache (last_used_at);")
+
+    def _ensure_import_checkpoints_table(self):
+        # Bulk import progress, committed together with each imported batch.
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS import_checkpoints (
+                    import_id TEXT PRIMARY KEY,
+                    state JSONB NOT NULL,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+
+    def _ensure_requirement_chunks_table(self):
+        # Compiled requirements: deduplicated chunks of projects.requirements with their embeddings.
+        # requirements_hash and model identify what they were compiled from.
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS requirement_chunks (
+                    project_id INTEGER REFERENCES projects(id) ON DELETE CASCADE,
+                    position INTEGER NOT NULL,
+                    chunk_text TEXT NOT NULL,
+                    tokens INTEGER NOT NULL,
+                    embedding REAL[] NOT NULL,
+                    model TEXT NOT NULL,
+                    requirements_hash TEXT NOT NULL,
+                    PRIMARY KEY (project_id, position)
+                );
+            """)
+
+    def _vector_index_using(self, kind, rows, column="embedding"):
+        """USING clause of an ANN index on `column` of a table holding `rows` prompts."""
+        if kind == "hnsw":
+            return f"USING hnsw ({column} vector_cosine_ops) WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION})"
+        # IVFFlat clusters are trained on the rows present at build time (pgvector guidance:
+        # rows / 1000 lists up to 1M rows, sqrt(rows) beyond).
+        lists = int(IVFFLAT_LISTS) if IVFFLAT_LISTS else max(1, rows // 1000 if rows <= 1_000_000 else int(rows ** 0.5))
+        return f"USING ivfflat ({column} vector_cosine_ops) WITH (lists = {lists})"
+
+    def _create_index_concurrently(self, cur, name, using):
+        """
+        Builds index `name` on prompts without blocking saves or searches.
+
+        CONCURRENTLY is not supported on partitioned tables, so the parent index is
+        created ON ONLY prompts (invalid and empty), then each partition's index is
+        built concurrently and attached; the parent becomes valid once every
+        partition has one. `using(rows)` returns the USING clause for a table of
+        `rows` prompts, so IVFFlat lists are sized per partition. Partitions that
+        already have their index are skipped, so an interrupted build resumes.
+        """
+        cur.execute("SELECT count(*) FROM prompts;")
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {name} ON ONLY prompts {using(cur.fetchone()[0])};")
+        cur.execute("""
+            SELECT t.relname FROM pg_inherits i
+            JOIN pg_index x ON x.indexrelid = i.inhrelid
+            JOIN pg_class t ON t.oid = x.indrelid
+            WHERE i.inhparent = %s::regclass;
+        """, (name,))
+        indexed = {row[0] for row in cur.fetchall()}
+        for partition in self._prompt_partitions(cur):
+            if partition in indexed:
+                continue
+            child = f"{partition}_{name.removeprefix('prompts_')}"
+            cur.execute(f"SELECT count(*) FROM {partition};")
+            rows = cur.fetchone()[0]
+            cur.execute(f"DROP INDEX IF EXISTS {child};")  # invalid leftover of an interrupted build
+            cur.execute(f"CREATE INDEX CONCURRENTLY {child} ON {partition} {using(rows)};")
+            cur.execute(f"ALTER INDEX {name} ATTACH PARTITION {child};")
+
+    def _rename_index(self, cur, old, new):
+        """Renames a partitioned index along with its partitions' indexes."""
+        cur.execute("""
+            SELECT c.relname, t.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_index x ON x.indexrelid = c.oid
+            JOIN pg_class t ON t.oid = x.indrelid
+            WHERE i.inhparent = to_regclass(%s);
+        """, (old,))
+        for child, partition in cur.fetchall():
+            cur.execute(f"ALTER INDEX {child} RENAME TO {partition}_{new.removeprefix('prompts_')};")
+        cur.execute(f"ALTER INDEX IF EXISTS {old} RENAME TO {new};")
+
+    def ensure_vector_index(self, kind=None, rebuild=False):
+        """
+        Creates the ANN index on prompts.embedding for the current column dimension.
+
+        The index is partitioned: every environment's partition has its own, built
+        from that environment's prompts only. `kind` defaults to VECTOR_INDEX. With
+        `rebuild`, a fresh index is built concurrently and swapped in for the existing one, so searches and saves keep
+        working meanwhile. Rebuild after reset_prompts_table and, for IVFFlat, after
+        bulk loads (its lists are trained on the rows present at build time).
+        Returns a description of the outcome.
+        """
+        kind = (kind or VECTOR_INDEX).lower()
+        if kind not in ("hnsw", "ivfflat", "none"):
+            raise ValueError(f"Unknown vector index type '{kind}'. Use hnsw, ivfflat or none.")
+        stale = [f"prompts_embedding_{k}_idx" for k in ("hnsw", "ivfflat") if k != kind or rebuild]
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT atttypmod FROM pg_attribute WHERE attrelid = 'prompts'::regclass AND attname = 'embedding';")
+            dim = cur.fetchone()[0]
+            cur.execute("SELECT count(*) FROM prompts;")
+            rows = cur.fetchone()[0]
+            indexable = kind != "none" and dim != -1 and dim <= MAX_INDEXED_DIM
+            if kind == "ivfflat" and rows == 0:
+                indexable = False
+            name = f"prompts_embedding_{kind}_idx"
+
+            if indexable and rebuild:
+                cur.execute(f"DROP INDEX IF EXISTS {name}_new;")
+                self._create_index_concurrently(cur, f"{name}_new", lambda n: self._vector_index_using(kind, n))
+            if rebuild or kind == "none":
+                # Partitioned indexes cannot be dropped concurrently; this only waits for running queries.
+                for old in stale:
+                    cur.execute(f"DROP INDEX IF EXISTS {old};")
+            if indexable and rebuild:
+                self._rename_index(cur, f"{name}_new", name)
+            elif indexable:
+                # Also runs at startup, e.g. right after an older table was partitioned.
+                self._create_index_concurrently(cur, name, lambda n: self._vector_index_using(kind, n))
+
+        if kind == "none":
+            message = "Vector index disabled; searches use exact scans."
+        elif dim == -1 or dim > MAX_INDEXED_DIM:
+            message = f"{dim}-dimension vectors cannot be indexed; searches use exact scans."
+        elif not indexable:
+            message = "IVFFlat index deferred until the table has data; rebuild the index after loading prompts."
+        else:
+            message = f"{kind} index ready on {rows} prompts ({dim} dimensions)."
+        return {"index": kind if indexable else None, "dimensions": dim, "rows": rows, "message": message}
+
+    def rebuild_vector_index(self, kind=None):
+        return self.ensure_vector_index(kind, rebuild=True)
+
+    def ensure_quantization(self, mode=None, batch_size=1000):
+        """
+        Prepares the compact embedding column searched by `mode` (default VECTOR_QUANTIZATION).
+
+        Adds the column, fills it for existing prompts and builds its HNSW index
+        concurrently (pgvector >= 0.7; binary columns on older versions are scanned
+        with bit_count). `none` drops the compact columns. Returns a description.
+        """
+        mode = (mode or VECTOR_QUANTIZATION).lower()
+        with self.conn.cursor() as cur:
+            if mode == "none":
+                cur.execute("ALTER TABLE prompts " + ", ".join(f"DROP COLUMN IF EXISTS {c}" for c in QUANTIZED_COLUMNS.values()) + ";")
+                return {"quantization": None, "backfilled": 0, "index": None, "message": "Quantized embeddings dropped; searches use full vectors."}
+            self._ensure_quantized_column(cur, mode)
+            cur.execute("SELECT atttypmod FROM pg_attribute WHERE attrelid = 'prompts'::regclass AND attname = 'embedding';")
+            dim = cur.fetchone()[0]
+        filled = self.backfill_quantized(mode, batch_size)
+
+        column = QUANTIZED_COLUMNS[mode]
+        index = None
+        if self.pgvector_version() >= (0, 7) and dim <= MAX_INDEXED_COMPACT_DIM[mode]:
+            index = f"prompts_{column}_idx"
+            ops = "halfvec_cosine_ops" if mode == "halfvec" else "bit_hamming_ops"
+            with self.conn.cursor() as cur:
+                self._create_index_concurrently(
+                    cur, index, lambda rows: f"USING hnsw ({column} {ops}) WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION})"
+                )
+        how = f"indexed by {index}" if index else "scanned (index needs pgvector 0.7+)"
+        return {"quantization": mode, "dimensions": dim, "backfilled": filled, "index": index,
+                "message": f"{mode} embeddings ready ({dim} dimensions, {filled} backfilled), {how}."}
+
+    def backfill_quantized(self, mode=None, batch_size=1000):
+        """Fills the compact column for prompts that do not have it yet; returns how many were filled."""
+        mode = (mode or VECTOR_QUANTIZATION).lower()
+        column = QUANTIZED_COLUMNS[mode]
+        total = 0
+        with self.conn.cursor() as cur:
+            while True:
+                if mode == "halfvec":
+                    cur.execute(f"""
+                        UPDATE prompts SET {column} = embedding::halfvec WHERE id IN (
+                            SELECT id FROM prompts WHERE {column} IS NULL AND embedding IS NOT NULL LIMIT %s
+                        );
+                    """, (batch_size,))
+                    filled = cur.rowcount
+                else:
+                    cur.execute(f"SELECT id, embedding FROM prompts WHERE {column} IS NULL AND embedding IS NOT NULL LIMIT %s;", (batch_size,))
+                    rows = cur.fetchall()
+                    if rows:
+                        execute_values(cur, f"""
+                            UPDATE prompts SET {column} = v.bits
+                            FROM (VALUES %s) AS v(id, bits)
+                            WHERE prompts.id = v.id;
+                        """, [(pid, Bits(Vector.from_text(embedding))) for pid, embedding in rows])
+                    filled = len(rows)
+                if not filled:
+                    return total
+                total += filled
+
     def reset_prompts_table(self, dim):
         with self.conn.cursor() as cur:
             cur.execute("DROP TABLE IF EXISTS prompts;")
             self._ensure_schema(dim)
 
+    # Re-embedding migration: prompts.embedding_next is a shadow column filled with the new
+    # model's vectors while searches keep using prompts.embedding, then swapped in.
+    def prepare_reembedding(self, dim, model):
+        """
+        Adds the shadow column for a migration to `model` (`dim` dimensions).
+
+        The model is recorded as the column comment; an existing shadow column for the
+        same model and dimension is kept so an interrupted migration resumes where it
+        stopped. Returns {"total", "done"} row counts.
+        """
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT a.atttypmod, col_description(a.attrelid, a.attnum)
+                FROM pg_attribute a
+                WHERE a.attrelid = 'prompts'::regclass AND a.attname = 'embedding_next' AND NOT a.attisdropped;
+            """)
+            existing = cur.fetchone()
+            if existing and existing != (dim, model):
+                cur.execute("ALTER TABLE prompts DROP COLUMN embedding_next;")
+                existing = None
+            if not existing:
+                cur.execute(f"ALTER TABLE prompts ADD COLUMN embedding_next vector({int(dim)});")
+                cur.execute("COMMENT ON COLUMN prompts.embedding_next IS %s;", (model,))
+            cur.execute("SELECT count(*), count(embedding_next) FROM prompts;")
+            total, done = cur.fetchone()
+        return {"total": total, "done": done}
+
+    def next_reembedding_batch(self, after_id, limit):
+        """(id, prompt_text) of the next prompts without a new embedding, in id order after `after_id`."""
+        with self.conn.cursor() as cur:
+            cur.execute(
+                "SELECT id, prompt_text FROM prompts WHERE id > %s AND embedding_next IS NULL ORDER BY id LIMIT %s;",
+                (after_id, limit)
+            )
+            return cur.fetchall()
+
+    def save_reembedded(self, rows):
+        """Stores new embeddings given as (id, embedding) pairs in the shadow column."""
+        if not rows:
+            return
+        with self.conn.cursor() as cur:
+            execute_values(cur, """
+                UPDATE prompts SET embedding_next = v.embedding
+                FROM (VALUES %s) AS v(id, embedding)
+                WHERE prompts.id = v.id;
+            """, [(pid, Vector(embedding)) for pid, embedding in rows])
+
+    def build_reembedding_index(self, kind=None):
+        """Builds the ANN index on the shadow column concurrently, ready to be renamed by the swap."""
+        kind = (kind or VECTOR_INDEX).lower()
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT atttypmod FROM pg_attribute WHERE attrelid = 'prompts'::regclass AND attname = 'embedding_next';")
+            dim = cur.fetchone()[0]
+            cur.execute("SELECT count(*) FROM prompts;")
+            rows = cur.fetchone()[0]
+            if kind not in ("hnsw", "ivfflat") or dim > MAX_INDEXED_DIM or (kind == "ivfflat" and rows == 0):
+                return None
+            name = f"prompts_embedding_next_{kind}_idx"
+            cur.execute(f"DROP INDEX IF EXISTS {name};")
+            self._create_index_concurrently(cur, name, lambda n: self._vector_index_using(kind, n, column="embedding_next"))
+            return kind
+
+    def swap_reembedding(self, limit=500, lock_timeout="5s"):
+        """
+        Replaces prompts.embedding with the shadow column in one short transaction.
+
+        Writes are blocked while the table is checked for prompts saved since the last
+        batch; if there are any, the transaction is rolled back and they are returned
+        (as (id, prompt_text)) to be embedded before trying again. Otherwise the old
+        column and its index are dropped, the shadow column and its index take their
+        names, and an empty list is returned. Raises psycopg2.errors.LockNotAvailable
+        if the table lock is not granted within `lock_timeout`.
+        """
+        with self.conn.cursor() as cur:
+            cur.execute("BEGIN;")
+            try:
+                cur.execute("SET LOCAL lock_timeout = %s;", (lock_timeout,))
+                # Blocks saves but not searches while stragglers are looked for.
+                cur.execute("LOCK TABLE prompts IN SHARE ROW EXCLUSIVE MODE;")
+                cur.execute("SELECT id, prompt_text FROM prompts WHERE embedding_next IS NULL ORDER BY id LIMIT %s;", (limit,))
+                stragglers = cur.fetchall()
+                if stragglers:
+                    cur.execute("ROLLBACK;")
+                    return stragglers
+                cur.execute("LOCK TABLE prompts IN ACCESS EXCLUSIVE MODE;")
+                cur.execute("DROP INDEX IF EXISTS prompts_embedding_hnsw_idx, prompts_embedding_ivfflat_idx;")
+                # Compact copies of the old vectors are rebuilt by ensure_quantization afterwards.
+                cur.execute("ALTER TABLE prompts " + ", ".join(f"DROP COLUMN IF EXISTS {c}" for c in QUANTIZED_COLUMNS.values()) + ";")
+                cur.execute("ALTER TABLE prompts DROP COLUMN embedding;")
+                cur.execute("ALTER TABLE prompts RENAME COLUMN embedding_next TO embedding;")
+                for kind in ("hnsw", "ivfflat"):
+                    self._rename_index(cur, f"prompts_embedding_next_{kind}_idx", f"prompts_embedding_{kind}_idx")
+                cur.execute("COMMIT;")
+            except BaseException:
+                cur.execute("ROLLBACK;")
+                raise
+        return []
+
+    def abort_reembedding(self):
+        """Drops the shadow column (and its index) of an unfinished migration."""
+        with self.conn.cursor() as cur:
+            cur.execute("ALTER TABLE prompts DROP COLUMN IF EXISTS embedding_next;")
+
     # Project Management
     def create_project(self, name, requirements, project_focus=None):
         try:
@@ -87,7 +919,12 @@ class DBManager:
                     "INSERT INTO projects (name, requirements, project_focus) VALUES (%s, %s, %s) ON CONFLICT (name) DO UPDATE SET requirements = EXCLUDED.requirements, project_focus = EXCLUDED.project_focus RETURNING id;",
                     (name.lower(), requirements, project_focus)
                 )
-                return cur.fetchone()[0]
+                project_id = cur.fetchone()[0]
+            # Re-creating an existing project replaces its requirements.
+            self._metadata_changed(name)
+            self.invalidate_cached_analyses(name)
+            self.delete_requirement_chunks(project_id)
+            return project_id
         except psycopg2.errors.UndefinedTable:
             self._ensure_schema()
             return self.create_project(name, requirements, project_focus)
@@ -106,9 +943,20 @@ class DBManager:
             return
             
         params.append(name.lower())
-        query = f"UPDATE projects SET {', '.join(updates)} WHERE name = %s;"
+        query = f"UPDATE projects SET {', '.join(updates)} WHERE name = %s RETURNING id;"
         with self.conn.cursor() as cur:
             cur.execute(query, tuple(params))
+            row = cur.fetchone()
+        self._metadata_changed(name)
+        self.invalidate_cached_analyses(name)
+        if row and requirements is not None:
+            self.delete_requirement_chunks(row[0])
+        return row[0] if row else None
+
+    def list_projects(self):
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT name, requirements, created_at, project_focus FROM projects ORDER BY name;")
+            return [{"name": row[0], "requirements": row[1], "created_at": row[2], "project_focus": row[3]} for row in cur.fetchall()]
 
     def get_project(self, name):
         with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
@@ -129,6 +977,8 @@ class DBManager:
                 )
                 res = cur.fetchone()
                 if res:
+                    self._add_prompt_partition(res[0])
+                    self._metadata_changed(project_name, env_name)
                     return res[0]
                 # If already exists, fetch it
                 cur.execute("SELECT id FROM environments WHERE project_id = %s AND name = %s;", (project['id'], env_name.lower()))
@@ -137,71 +987,649 @@ class DBManager:
             self._ensure_schema()
             return self.create_environment(project_name, env_name)
 
+    def list_environments(self, project_id):
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT name, created_at FROM environments WHERE project_id = %s ORDER BY name;", (project_id,))
+            return [{"name": row[0], "created_at": row[1]} for row in cur.fetchall()]
+
     def get_environment_by_name(self, project_name, env_name):
+        project_name, env_name = project_name.lower(), env_name.lower()
+        cached = metadata_cache.get(project_name, env_name)
+        if cached is not None:
+            return dict(cached)
+        generation = metadata_cache.generation()
         with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute("""
-                SELECT e.*, p.name as project_name, p.requirements
+                SELECT e.*, p.name as project_name, p.requirements, p.project_focus
                 FROM environments e
                 JOIN projects p ON e.project_id = p.id
                 WHERE p.name = %s AND e.name = %s;
-            """, (project_name.lower(), env_name.lower()))
-            return cur.fetchone()
+            """, (project_name, env_name))
+            row = cur.fetchone()
+        if row is not None:
+            metadata_cache.set(project_name, env_name, dict(row), generation)
+        return row
 
-    def save_prompt(self, environment_id, prompt_text, embedding):
+    def _metadata_changed(self, project_name, env_name=None):
+        """Invalidates cached environment rows here and, via NOTIFY, in every other process."""
+        project_name = project_name.lower()
+        env_name = env_name.lower() if env_name is not None else None
+        metadata_cache.invalidate(project_name, env_name)
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT pg_notify(%s, %s);",
+                        (METADATA_CHANNEL, json.dumps({"project": project_name, "environment": env_name})))
+
+    def _add_prompt_columns(self):
+        """Adds the lexical and compact columns to a prompts table created before them."""
+        with self.conn.cursor() as cur:
+            self._ensure_lexical_columns(cur)
+            self._ensure_quantized_column(cur)
+
+    def save_prompt(self, environment_id, prompt_text, embedding, _retry=True):
         dim = len(embedding)
+        text_hash, minhash, buckets = lexical.signature(prompt_text)
+        columns = ["environment_id", "prompt_text", "embedding", "text_hash", "minhash", "lsh_buckets"]
+        values = [environment_id, prompt_text, Vector(embedding), text_hash, minhash, buckets]
+        if VECTOR_QUANTIZATION != "none":
+            columns.append(QUANTIZED_COLUMNS[VECTOR_QUANTIZATION])
+            values.append((HalfVector if VECTOR_QUANTIZATION == "halfvec" else Bits)(values[2]))
         try:
             with self.conn.cursor() as cur:
                 cur.execute(
-                    "INSERT INTO prompts (environment_id, prompt_text, embedding) VALUES (%s, %s, %s) RETURNING id;",
-                    (environment_id, prompt_text, embedding)
+                    f"INSERT INTO prompts ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(values))}) RETURNING id;",
+                    values
                 )
                 return cur.fetchone()[0]
         except psycopg2.errors.UndefinedTable:
             self._ensure_schema(dim)
             return self.save_prompt(environment_id, prompt_text, embedding)
+        except psycopg2.errors.UndefinedColumn as e:
+            if not _retry:
+                raise
+            self._add_prompt_columns()
+            try:
+                return self.save_prompt(environment_id, prompt_text, embedding, _retry=False)
+            except psycopg2.errors.UndefinedColumn:
+                raise e from None
         except psycopg2.Error as e:
-            if "dimensions" in str(e).lower():
+            if _is_missing_partition(e) and self._add_prompt_partition(environment_id):
+                return self.save_prompt(environment_id, prompt_text, embedding)
+            if _is_dimension_error(e):
                 raise RuntimeError(f"Dimension mismatch: Your current model uses {dim} dimensions, but the database is configured for a different size. Please reset the prompt database.")
             raise e
 
-    def find_similar(self, environment_id, embedding, threshold=0.9, limit=5):
+    def save_prompts(self, environment_id, prompts, checkpoint=None, _retry=True):
+        """
+        Inserts (prompt_text, embedding) pairs and returns their ids in order.
+
+        Rows are streamed with binary COPY, so embeddings reach Postgres in pgvector's
+        wire format instead of being rendered and re-parsed as text. COPY cannot return
+        generated keys, so the ids are drawn from the sequence up front.
+
+        `checkpoint`, an (import_id, state) pair, is stored in import_checkpoints in the
+        same transaction as the rows, so progress never lags behind what was committed.
+        """
+        if not prompts and checkpoint is None:
+            return []
+        dim = len(prompts[0][1]) if prompts else None
+        retry = functools.partial(self.save_prompts, environment_id, prompts, checkpoint)
+        try:
+            with self.conn.cursor() as cur:
+                if checkpoint is not None:
+                    cur.execute("BEGIN;")
+                try:
+                    ids = self._copy_prompts(cur, environment_id, prompts) if prompts else []
+                    if checkpoint is not None:
+                        cur.execute("""
+                            INSERT INTO import_checkpoints (import_id, state) VALUES (%s, %s)
+                            ON CONFLICT (import_id) DO UPDATE SET state = EXCLUDED.state, updated_at = CURRENT_TIMESTAMP;
+                        """, (checkpoint[0], json.dumps(checkpoint[1])))
+                        cur.execute("COMMIT;")
+                except BaseException:
+                    if checkpoint is not None:
+                        cur.execute("ROLLBACK;")
+                    raise
+                return ids
+        except psycopg2.errors.UndefinedTable:
+            if not _retry:
+                raise
+            if prompts:
+                self._ensure_schema(dim)
+            else:
+                self._ensure_import_checkpoints_table()
+            return retry(_retry=False)
+        except psycopg2.errors.UndefinedColumn as e:
+            if not _retry:
+                raise
+            self._add_prompt_columns()
+            try:
+                return retry(_retry=False)
+            except psycopg2.errors.UndefinedColumn:
+                raise e from None
+        except psycopg2.Error as e:
+            if _is_missing_partition(e) and self._add_prompt_partition(environment_id):
+                return retry(_retry=_retry)
+            if _is_dimension_error(e):
+                raise RuntimeError(f"Dimension mismatch: Your current model uses {dim} dimensions, but the database is configured for a different size. Please reset the prompt database.")
+            raise e
+
+    def _copy_prompts(self, cur, environment_id, prompts):
+        cur.execute(
+            "SELECT nextval(pg_get_serial_sequence('prompts', 'id')) FROM generate_series(1, %s);",
+            (len(prompts),)
+        )
+        ids = [row[0] for row in cur.fetchall()]
+        columns = [("id", "int4"), ("environment_id", "int4"), ("prompt_text", "text"), ("embedding", "vector"),
+                   ("text_hash", "text"), ("minhash", "int8[]"), ("lsh_buckets", "int8[]")]
+        quantized = VECTOR_QUANTIZATION != "none"
+        if quantized:
+            # The encoder derives the compact column from the embedding.
+            columns.append((QUANTIZED_COLUMNS[VECTOR_QUANTIZATION], "halfvec" if VECTOR_QUANTIZATION == "halfvec" else "bit"))
+        copy_binary(
+            cur, "prompts", columns,
+            [(pid, environment_id, text, embedding, *lexical.signature(text)) + ((embedding,) if quantized else ())
+             for pid, (text, embedding) in zip(ids, prompts)]
+        )
+        return ids
+
+    # Import Checkpoints
+    def get_import_checkpoint(self, import_id):
+        """The state last stored by save_prompts(checkpoint=...) for `import_id`, or None."""
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute("SELECT state FROM import_checkpoints WHERE import_id = %s;", (import_id,))
+                row = cur.fetchone()
+        except psycopg2.errors.UndefinedTable:
+            return None
+        return row[0] if row else None
+
+    def delete_import_checkpoint(self, import_id):
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute("DELETE FROM import_checkpoints WHERE import_id = %s;", (import_id,))
+        except psycopg2.errors.UndefinedTable:
+            pass
+
+    # Compiled Requirements
+    def get_requirement_chunks(self, project_id):
+        try:
+            with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute("""
+                    SELECT position, chunk_text, tokens, embedding, model, requirements_hash
+                    FROM requirement_chunks WHERE project_id = %s ORDER BY position;
+                """, (project_id,))
+                return cur.fetchall()
+        except psycopg2.errors.UndefinedTable:
+            self._ensure_requirement_chunks_table()
+            return []
+
+    def save_requirement_chunks(self, project_id, requirements_hash, model, chunks):
+        """Replaces a project's compiled requirements with `chunks`: (text, tokens, embedding) triples."""
+        if not chunks:
+            return self.delete_requirement_chunks(project_id)
+        try:
+            with self.conn.cursor() as cur:
+                # Upsert by position and trim the tail in one statement, so readers never see a
+                # half-written set and concurrent compilations of the same project cannot collide.
+                execute_values(cur, """
+                    WITH upserted AS (
+                        INSERT INTO requirement_chunks (project_id, position, chunk_text, tokens, embedding, model, requirements_hash)
+                        VALUES %s
+                        ON CONFLICT (project_id, position) DO UPDATE SET
+                            chunk_text = EXCLUDED.chunk_text, tokens = EXCLUDED.tokens, embedding = EXCLUDED.embedding,
+                            model = EXCLUDED.model, requirements_hash = EXCLUDED.requirements_hash
+                    )
+                """ + cur.mogrify(
+                    "DELETE FROM requirement_chunks WHERE project_id = %s AND position >= %s;", (project_id, len(chunks))
+                ).decode(), [
+                    (project_id, position, text, tokens, list(embedding), model, requirements_hash)
+                    for position, (text, tokens, embedding) in enumerate(chunks)
+                ], page_size=len(chunks))
+        except psycopg2.errors.UndefinedTable:
+            self._ensure_requirement_chunks_table()
+            self.save_requirement_chunks(project_id, requirements_hash, model, chunks)
+
+    def delete_requirement_chunks(self, project_id):
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute("DELETE FROM requirement_chunks WHERE project_id = %s;", (project_id,))
+        except psycopg2.errors.UndefinedTable:
+            pass
+
+    # Embedding Cache
+    def get_cached_embedding(self, key):
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute("SELECT embedding FROM embedding_cache WHERE key = %s;", (key,))
+                row = cur.fetchone()
+                return row[0] if row else None
+        except psycopg2.errors.UndefinedTable:
+            self._ensure_embedding_cache_table()
+            return None
+
+    def put_cached_embedding(self, key, model, embedding):
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute(
+                    "INSERT INTO embedding_cache (key, model, embedding) VALUES (%s, %s, %s) ON CONFLICT (key) DO NOTHING;",
+                    (key, model, embedding)
+                )
+        except psycopg2.errors.UndefinedTable:
+            self._ensure_embedding_cache_table()
+            self.put_cached_embedding(key, model, embedding)
+
+    # Analysis Cache
+    def get_cached_analysis(self, key):
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute(
+                    "UPDATE analysis_cache SET last_used_at = CURRENT_TIMESTAMP WHERE key = %s RETURNING analysis;",
+                    (key,)
+                )
+                row = cur.fetchone()
+                return row[0] if row else None
+        except psycopg2.errors.UndefinedTable:
+            self._ensure_analysis_cache_table()
+            return None
+
+    def put_cached_analysis(self, key, project, model, analysis):
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute(
+                    "INSERT INTO analysis_cache (key, project, model, analysis) VALUES (%s, %s, %s, %s) "
+                    "ON CONFLICT (key) DO UPDATE SET analysis = EXCLUDED.analysis, last_used_at = CURRENT_TIMESTAMP;",
+                    (key, project.lower(), model, analysis)
+                )
+        except psycopg2.errors.UndefinedTable:
+            self._ensure_analysis_cache_table()
+            self.put_cached_analysis(key, project, model, analysis)
+
+    def prune_analysis_cache(self, max_rows):
+        """Evicts the least recently used analyses beyond `max_rows`. Returns the number removed."""
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                DELETE FROM analysis_cache WHERE key IN (
+                    SELECT key FROM analysis_cache ORDER BY last_used_at DESC OFFSET %s
+                );
+            """, (max_rows,))
+            return cur.rowcount
+
+    def invalidate_cached_analyses(self, project):
+        """Drops the cached analyses of a project, e.g. after its requirements changed."""
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute("DELETE FROM analysis_cache WHERE project = %s;", (project.lower(),))
+                return cur.rowcount
+        except psycopg2.errors.UndefinedTable:
+            return 0
+
+    def _search_settings_sql(self):
+        if VECTOR_INDEX == "hnsw":
+            sql = f"SET hnsw.ef_search = {HNSW_EF_SEARCH};"
+            if HNSW_ITERATIVE_SCAN:
+                sql += f" SET hnsw.iterative_scan = {HNSW_ITERATIVE_SCAN};"
+            return sql
+        if VECTOR_INDEX == "ivfflat":
+            return f"SET ivfflat.probes = {IVFFLAT_PROBES};"
+        return ""
+
+    def find_similar(self, environment_id, embedding, threshold=0.9, limit=5, exact=None, quantization=None):
+        """
+        Returns up to `limit` prompts in the environment whose cosine similarity exceeds `threshold`.
+
+        The nearest neighbours are fetched with `ORDER BY embedding <=> q LIMIT k`, the only
+        shape pgvector can answer from an ANN index, and the threshold is applied afterwards.
+        `exact=True` (or VECTOR_EXACT_SEARCH) fences the distance computation off from the
+        ORDER BY, which forces an exact scan; use it to measure the index's recall.
+
+        With `quantization` (default VECTOR_QUANTIZATION) set to halfvec or binary, the
+        compact column is searched for `limit` * VECTOR_RERANK_OVERSAMPLE candidates,
+        which are then reranked by exact cosine similarity on the full vectors.
+        """
         dim = len(embedding)
+        exact = VECTOR_EXACT_SEARCH if exact is None else exact
+        quantization = (quantization or VECTOR_QUANTIZATION).lower()
+        if quantization != "none" and not exact:
+            try:
+                return self._find_similar_quantized(environment_id, embedding, threshold, limit, quantization)
+            except psycopg2.errors.UndefinedColumn:
+                # Not prepared yet, or dropped by a re-embedding swap until ensure_quantization runs.
+                pass
+        # The query vector is bound once; ordering by its `distance` alias keeps the ANN-compatible shape.
+        nearest = """
+            SELECT id, prompt_text, created_at, embedding <=> %(embedding)s AS distance
+            FROM prompts
+            WHERE environment_id = %(environment_id)s
+        """
+        if exact:
+            # OFFSET 0 keeps the planner from pushing the ORDER BY into an index scan.
+            nearest = f"SELECT * FROM ({nearest} OFFSET 0) scan"
+        try:
+            with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(("" if exact else self._search_settings_sql()) + f"""
+                    SELECT id, prompt_text, created_at, 1 - distance AS similarity
+                    FROM ({nearest} ORDER BY distance LIMIT %(limit)s) nearest
+                    WHERE 1 - distance > %(threshold)s
+                    ORDER BY distance;
+                """, {"embedding": Vector(embedding), "environment_id": environment_id, "limit": limit, "threshold": threshold})
+                return cur.fetchall()
+        except psycopg2.errors.UndefinedTable:
+            return []
+        except psycopg2.Error as e:
+            if _is_dimension_error(e):
+                raise RuntimeError(f"Dimension mismatch: Current model uses {dim} dimensions, but database expects a different size. Reset recommended.")
+            raise e
+
+    def _compact_distance(self, mode, query):
+        """SQL distance from the mode's compact column to the `query` expression, and the query's encoder."""
+        column = QUANTIZED_COLUMNS[mode]
+        if mode == "halfvec":
+            return f"{column} <=> {query}", HalfVector
+        if self.pgvector_version() >= (0, 7):
+            return f"{column} <~> {query}", Bits
+        # No Hamming operator before pgvector 0.7: scan the 1-bit column with XOR + popcount.
+        return f"bit_count({column} # {query})", Bits
+
+    def _find_similar_quantized(self, environment_id, embedding, threshold, limit, mode):
+        candidates = limit * VECTOR_RERANK_OVERSAMPLE
+        order, encode = self._compact_distance(mode, "%(compact)s")
+        compact = encode(embedding)
         try:
             with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
+                # ef_search below the candidate count would silently cap the candidate set.
+                cur.execute(f"SET hnsw.ef_search = {max(HNSW_EF_SEARCH, candidates)};" + f"""
+                    SELECT id, prompt_text, created_at, 1 - distance AS similarity
+                    FROM (
+                        SELECT id, prompt_text, created_at, embedding <=> %(embedding)s AS distance
+                        FROM (
+                            SELECT id, prompt_text, created_at, embedding
+                            FROM prompts
+                            WHERE environment_id = %(environment_id)s
+                            ORDER BY {order}
+                            LIMIT %(candidates)s
+                        ) candidates
+                        ORDER BY distance
+                        LIMIT %(limit)s
+                    ) nearest
+                    WHERE 1 - distance > %(threshold)s
+                    ORDER BY distance;
+                """, {"embedding": Vector(embedding), "compact": compact, "environment_id": environment_id,
+                      "candidates": candidates, "limit": limit, "threshold": threshold})
+                return cur.fetchall()
+        except psycopg2.errors.UndefinedTable:
+            return []
+        except psycopg2.errors.UndefinedColumn:
+            raise
+        except psycopg2.Error as e:
+            if _is_dimension_error(e):
+                raise RuntimeError(f"Dimension mismatch: Current model uses {len(embedding)} dimensions, but database expects a different size. Reset recommended.")
+            raise e
+
+    def find_lexical_matches(self, environment_id, prompt_text, threshold=None, limit=5):
+        """
+        Returns prompts in the environment that are verbatim or near-verbatim copies of `prompt_text`.
+
+        Exact matches come from the normalized-text hash; near matches are LSH candidates
+        whose estimated Jaccard similarity (character shingles) reaches `threshold`
+        (LEXICAL_THRESHOLD by default). Each match carries `similarity` and `match`
+        ("exact" or "near"). No model call is needed, so this runs before embedding.
+        """
+        threshold = lexical.LEXICAL_THRESHOLD if threshold is None else threshold
+        text_hash, minhash, buckets = lexical.signature(prompt_text)
+        try:
+            with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
+                # Exact hits first, so a crowd of LSH candidates cannot push them past the LIMIT.
                 cur.execute("""
-                    SELECT id, prompt_text, created_at, 1 - (embedding <=> %s::vector) AS similarity
+                    SELECT id, prompt_text, created_at, text_hash, minhash
                     FROM prompts
-                    WHERE environment_id = %s
-                    AND 1 - (embedding <=> %s::vector) > %s
-                    ORDER BY similarity DESC
-                    LIMIT %s;
-                """, (embedding, environment_id, embedding, threshold, limit))
-                return cur.fetchall()
+                    WHERE environment_id = %(environment_id)s
+                      AND (text_hash = %(text_hash)s OR lsh_buckets && %(buckets)s::bigint[])
+                    ORDER BY text_hash = %(text_hash)s DESC
+                    LIMIT 200;
+                """, {"environment_id": environment_id, "text_hash": text_hash, "buckets": buckets})
+                candidates = cur.fetchall()
         except psycopg2.errors.UndefinedTable:
             return []
+        except psycopg2.errors.UndefinedColumn:
+            # A table from before the lexical tier: add the columns; existing rows are
+            # unsigned until backfill_lexical_signatures() runs, so nothing can match yet.
+            self._add_prompt_columns()
+            return []
+        matches = []
+        for row in candidates:
+            exact = row.pop('text_hash') == text_hash
+            similarity = 1.0 if exact else lexical.jaccard(minhash, row.pop('minhash'))
+            row.pop('minhash', None)
+            if similarity >= threshold:
+                matches.append({**row, "similarity": similarity, "match": "exact" if exact else "near"})
+        matches.sort(key=lambda m: (m['similarity'], m['created_at']), reverse=True)
+        return matches[:limit]
+
+    def backfill_lexical_signatures(self, batch_size=500):
+        """Computes lexical signatures for prompts saved before the lexical tier existed. Returns the row count."""
+        total = 0
+        while True:
+            with self.conn.cursor() as cur:
+                cur.execute("SELECT id, prompt_text FROM prompts WHERE text_hash IS NULL LIMIT %s;", (batch_size,))
+                rows = cur.fetchall()
+                if not rows:
+                    return total
+                execute_values(cur, """
+                    UPDATE prompts SET text_hash = v.text_hash, minhash = v.minhash, lsh_buckets = v.lsh_buckets
+                    FROM (VALUES %s) AS v(id, text_hash, minhash, lsh_buckets)
+                    WHERE prompts.id = v.id;
+                """, [(pid, *lexical.signature(text)) for pid, text in rows], template="(%s, %s, %s::bigint[], %s::bigint[])")
+                total += len(rows)
+
+    def find_similar_batch(self, environment_id, embeddings, threshold=0.9, limit=5, quantization=None):
+        """
+        find_similar for many query vectors in a single round-trip.
+
+        Returns one list of matches per input embedding, in input order. Quantization
+        works as in find_similar: each query's candidates come from the compact column
+        and are reranked on the full vectors.
+        """
+        if not embeddings:
+            return []
+        quantization = (quantization or VECTOR_QUANTIZATION).lower()
+        if quantization != "none":
+            try:
+                return self._find_similar_batch_quantized(environment_id, embeddings, threshold, limit, quantization)
+            except psycopg2.errors.UndefinedColumn:
+                pass
+        dim = len(embeddings[0])
+        results = [[] for _ in embeddings]
+        try:
+            with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(self._search_settings_sql() + """
+                    SELECT q.idx, nearest.id, nearest.prompt_text, nearest.created_at, nearest.similarity
+                    FROM unnest(%(embeddings)s::vector[]) WITH ORDINALITY AS q(embedding, idx)
+                    CROSS JOIN LATERAL (
+                        SELECT id, prompt_text, created_at, 1 - (p.embedding <=> q.embedding) AS similarity
+                        FROM prompts p
+                        WHERE p.environment_id = %(environment_id)s
+                        ORDER BY p.embedding <=> q.embedding
+                        LIMIT %(limit)s
+                    ) nearest
+                    WHERE nearest.similarity > %(threshold)s
+                    ORDER BY q.idx, nearest.similarity DESC;
+                """, {
+                    "embeddings": [Vector(e) for e in embeddings],
+                    "environment_id": environment_id,
+                    "limit": limit,
+                    "threshold": threshold
+                })
+                for row in cur.fetchall():
+                    results[row.pop('idx') - 1].append(row)
+                return results
+        except psycopg2.errors.UndefinedTable:
+            return results
         except psycopg2.Error as e:
-            if "dimensions" in str(e).lower():
+            if _is_dimension_error(e):
                 raise RuntimeError(f"Dimension mismatch: Current model uses {dim} dimensions, but database expects a different size. Reset recommended.")
             raise e
 
+    def _find_similar_batch_quantized(self, environment_id, embeddings, threshold, limit, mode):
+        dim = len(embeddings[0])
+        candidates = limit * VECTOR_RERANK_OVERSAMPLE
+        # Bit strings travel as varbit (a bare bit[] would truncate them to one bit).
+        order, encode = self._compact_distance(mode, "q.compact" if mode == "halfvec" else f"q.compact::bit({dim})")
+        results = [[] for _ in embeddings]
+        try:
+            with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(f"SET hnsw.ef_search = {max(HNSW_EF_SEARCH, candidates)};" + f"""
+                    SELECT q.idx, nearest.id, nearest.prompt_text, nearest.created_at, nearest.similarity
+                    FROM unnest(%(embeddings)s::vector[], %(compact)s::{"halfvec" if mode == "halfvec" else "varbit"}[])
+                        WITH ORDINALITY AS q(embedding, compact, idx)
+                    CROSS JOIN LATERAL (
+                        SELECT id, prompt_text, created_at, 1 - (c.embedding <=> q.embedding) AS similarity
+                        FROM (
+                            SELECT p.id, p.prompt_text, p.created_at, p.embedding
+                            FROM prompts p
+                            WHERE p.environment_id = %(environment_id)s
+                            ORDER BY {order}
+                            LIMIT %(candidates)s
+                        ) c
+                        ORDER BY c.embedding <=> q.embedding
+                        LIMIT %(limit)s
+                    ) nearest
+                    WHERE nearest.similarity > %(threshold)s
+                    ORDER BY q.idx, nearest.similarity DESC;
+                """, {
+                    "embeddings": [Vector(e) for e in embeddings],
+                    "compact": [encode(e) for e in embeddings],
+                    "environment_id": environment_id,
+                    "candidates": candidates,
+                    "limit": limit,
+                    "threshold": threshold
+                })
+                for row in cur.fetchall():
+                    results[row.pop('idx') - 1].append(row)
+                return results
+        except psycopg2.errors.UndefinedTable:
+            return results
+        except psycopg2.errors.UndefinedColumn:
+            raise
+        except psycopg2.Error as e:
+            if _is_dimension_error(e):
+                raise RuntimeError(f"Dimension mismatch: Current model uses {dim} dimensions, but database expects a different size. Reset recommended.")
+            raise e
+
+    # Duplicate Audit
+    def export_embeddings(self, environment_id):
+        """
+        All (ids, embeddings) of an environment as an int64 array and a float32 matrix.
+
+        The rows are streamed with binary COPY straight into the matrix, so a large
+        environment never exists as parsed text or Python lists. The row count that
+        sizes the matrix and the COPY share one REPEATABLE READ snapshot, so prompts
+        saved meanwhile are left out of both.
+        """
+        with self.conn.cursor() as cur:
+            try:
+                cur.execute("SELECT atttypmod FROM pg_attribute WHERE attrelid = 'prompts'::regclass AND attname = 'embedding';")
+            except psycopg2.errors.UndefinedTable:
+                return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32)
+            dim = cur.fetchone()[0]
+            cur.execute("BEGIN ISOLATION LEVEL REPEATABLE READ READ ONLY;")
+            try:
+                cur.execute("SELECT count(*) FROM prompts WHERE environment_id = %s AND embedding IS NOT NULL;", (environment_id,))
+                reader = VectorCopyReader(cur.fetchone()[0], dim)
+                cur.copy_expert(cur.mogrify(
+                    "COPY (SELECT id, embedding FROM prompts WHERE environment_id = %s AND embedding IS NOT NULL ORDER BY id) "
+                    "TO STDOUT WITH (FORMAT BINARY)", (environment_id,)
+                ).decode(), reader)
+                cur.execute("COMMIT;")
+            except BaseException:
+                cur.execute("ROLLBACK;")
+                raise
+            return reader.result()
+
+    def get_prompts_by_ids(self, ids):
+        """{id: {id, prompt_text, created_at}} for the given prompt ids."""
+        with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("SELECT id, prompt_text, created_at FROM prompts WHERE id = ANY(%s);", ([int(i) for i in ids],))
+            return {row['id']: row for row in cur.fetchall()}
+
     # Deletion
+    # Prompts go with their environment's partition; the cascading DELETE then finds none.
     def delete_project(self, name):
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT e.id FROM environments e JOIN projects p ON e.project_id = p.id WHERE p.name = %s;", (name.lower(),))
+            environment_ids = [row[0] for row in cur.fetchall()]
+        for environment_id in environment_ids:
+            self._drop_prompt_partition(environment_id)
         with self.conn.cursor() as cur:
             cur.execute("DELETE FROM projects WHERE name = %s;", (name.lower(),))
+        self._metadata_changed(name)
 
     def delete_environment(self, project_name, env_name):
         project = self.get_project(project_name)
         if not project:
             return
         with self.conn.cursor() as cur:
-            cur.execute("DELETE FROM environments WHERE project_id = %s AND name = %s;", (project['id'], env_name.lower()))
+            cur.execute("SELECT id FROM environments WHERE project_id = %s AND name = %s;", (project['id'], env_name.lower()))
+            row = cur.fetchone()
+        if not row:
+            return
+        self._drop_prompt_partition(row[0])
+        with self.conn.cursor() as cur:
+            cur.execute("DELETE FROM environments WHERE id = %s;", (row[0],))
+        self._metadata_changed(project_name, env_name)
 
     def delete_environment_prompts(self, project_name, env_name):
         env = self.get_environment_by_name(project_name, env_name)
         if not env:
             return
         with self.conn.cursor() as cur:
-            cur.execute("DELETE FROM prompts WHERE environment_id = %s;", (env['id'],))
+            try:
+                cur.execute(f"TRUNCATE {_partition_name(env['id'])};")
+            except psycopg2.errors.UndefinedTable:
+                # No partition yet (or a table from before partitioning).
+                cur.execute("DELETE FROM prompts WHERE environment_id = %s;", (env['id'],))
 
     def close(self):
-        self.conn.close()
+        if self._pool is not None:
+            self._pool.putconn(self.conn)
+        else:
+            self.conn.close()
+
+
+def _timed_method(name, method):
+    @functools.wraps(method)
+    def timed(*args, **kwargs):
+        with metrics.timed_db(name):
+            return method(*args, **kwargs)
+    return timed
+
+
+# Every public DBManager method is timed per method name into metrics.DB_QUERY_SECONDS.
+for _name, _attr in list(vars(DBManager).items()):
+    if callable(_attr) and not _name.startswith("_") and _name != "close":
+        setattr(DBManager, _name, _timed_method(_name, _attr))
+del _name, _attr
+
+
+class AsyncDBManager:
+    """
+    Awaitable mirror of a DBManager: every public method is exposed as a coroutine.
+
+    psycopg2 is a blocking driver, so each call runs in a worker thread and the
+    event loop keeps serving other requests while Postgres works.
+    """
+    def __init__(self, db):
+        self.db = db
+
+    @property
+    def conn(self):
+        return self.db.conn
+
+    def __getattr__(self, name):
+        attr = getattr(self.db, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            return await asyncio.to_thread(attr, *args, **kwargs)
+        call.__name__ = name
+        return call
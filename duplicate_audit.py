@@ -0,0 +1,258 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from db_manager import DBManager
+
+AUDIT_THRESHOLD = float(os.getenv("AUDIT_THRESHOLD", "0.95"))
+AUDIT_BLOCK_SIZE = int(os.getenv("AUDIT_BLOCK_SIZE", "2048"))  # rows per block; a block pair holds block_size**2 float32
+AUDIT_EXACT_MAX = int(os.getenv("AUDIT_EXACT_MAX", "50000"))  # above this many prompts "auto" switches to LSH
+# Random-hyperplane LSH: a pair shares a band when all its ROWS sign bits agree. Bits agree
+# with probability 1 - angle/pi, so at cosine 0.95 a pair is found in at least one of 20
+# bands of 12 bits with >99% probability, while unrelated pairs (angle ~90 deg) collide
+# in a band 1 in 4096 times.
+AUDIT_LSH_BANDS = int(os.getenv("AUDIT_LSH_BANDS", "20"))
+AUDIT_LSH_ROWS = int(os.getenv("AUDIT_LSH_ROWS", "12"))
+
+
+class EnvironmentNotFound(ValueError):
+    pass
+
+
+class UnionFind:
+    """Disjoint sets over 0..n-1 with path halving and union by size."""
+    def __init__(self, n):
+        self.parent = np.arange(n)
+        self.size = np.ones(n, dtype=np.int64)
+
+    def find(self, i):
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(self, i, j):
+        a, b = self.find(i), self.find(j)
+        if a == b:
+            return
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+
+    def groups(self):
+        """Sets with more than one member, as arrays of indices."""
+        roots = self.parent
+        while True:  # pointer jumping resolves every root at once
+            parents = roots[roots]
+            if np.array_equal(parents, roots):
+                break
+            roots = parents
+        order = np.argsort(roots, kind="stable")
+        boundaries = np.flatnonzero(np.diff(roots[order])) + 1
+        return [group for group in np.split(order, boundaries) if len(group) > 1]
+
+
+def normalize(matrix):
+    """Scales rows to unit length in place so dot products are cosine similarities."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+def _union_pairs(uf, i, j):
+    """
+    Unions the pairs (i[k], j[k]). The pairs are first reduced to their connected
+    components with vectorized min-label propagation, so a dense cluster costs one
+    union per member instead of one per pair.
+    """
+    if not len(i):
+        return
+    nodes, inverse = np.unique(np.concatenate([i, j]), return_inverse=True)
+    a, b = inverse[:len(i)], inverse[len(i):]
+    label = np.arange(len(nodes))
+    while True:
+        new = label.copy()
+        np.minimum.at(new, a, label[b])
+        np.minimum.at(new, b, label[a])
+        new = new[new]
+        if np.array_equal(new, label):
+            break
+        label = new
+    for node, root in zip(nodes, nodes[label]):
+        if node != root:
+            uf.union(node, root)
+
+
+def _blocked(matrix, threshold, block_size, uf, index=None):
+    """
+    Unions every pair with similarity above `threshold`, one block_size x block_size
+    tile of the similarity matrix at a time. Only tiles on or above the diagonal are
+    computed, so each pair is visited once. Returns the number of pairs found.
+    """
+    n = len(matrix)
+    pairs = 0
+    for a in range(0, n, block_size):
+        left = matrix[a:a + block_size]
+        for b in range(a, n, block_size):
+            tile = left @ matrix[b:b + block_size].T
+            if a == b:
+                tile = np.triu(tile, k=1)
+            rows, cols = np.nonzero(tile > threshold)
+            pairs += len(rows)
+            rows, cols = rows + a, cols + b
+            if index is not None:
+                rows, cols = index[rows], index[cols]
+            _union_pairs(uf, rows, cols)
+    return pairs
+
+
+def _lsh(matrix, threshold, block_size, uf, bands, rows, seed=0):
+    """
+    Unions pairs above `threshold` among LSH candidates: prompts sharing a band of
+    random-hyperplane sign bits. Each bucket is verified exactly with _blocked, so
+    there are no false positives; a true pair is missed only if it shares no band.
+    Returns the number of (not deduplicated) pairs found.
+    """
+    planes = np.random.default_rng(seed).standard_normal((matrix.shape[1], bands * rows)).astype(np.float32)
+    weights = 1 << np.arange(rows, dtype=np.int64)
+    pairs = 0
+    for band in range(bands):
+        keys = np.empty(len(matrix), dtype=np.int64)
+        for start in range(0, len(matrix), block_size * 8):
+            bits = matrix[start:start + block_size * 8] @ planes[:, band * rows:(band + 1) * rows] > 0
+            keys[start:start + len(bits)] = bits @ weights
+        order = np.argsort(keys, kind="stable")
+        boundaries = np.flatnonzero(np.diff(keys[order])) + 1
+        for bucket in np.split(order, boundaries):
+            if len(bucket) > 1:
+                pairs += _blocked(matrix[bucket], threshold, block_size, uf, index=bucket)
+    return pairs
+
+
+def find_clusters(matrix, threshold=None, method="auto", block_size=None, bands=None, rows=None):
+    """
+    Groups near-duplicate rows of `matrix` (unit-length embeddings) into clusters.
+
+    Two rows are linked when their cosine similarity exceeds `threshold`; clusters are
+    the connected components, so a chain a~b~c forms one cluster even if a and c are
+    further apart. "blocked" compares all pairs tile by tile (memory bounded by
+    `block_size`), "lsh" only compares rows sharing a random-hyperplane bucket and
+    "auto" picks "lsh" above AUDIT_EXACT_MAX rows. Returns (clusters, method, pairs)
+    where clusters is a list of row-index arrays.
+    """
+    threshold = AUDIT_THRESHOLD if threshold is None else threshold
+    block_size = block_size or AUDIT_BLOCK_SIZE
+    if method == "auto":
+        method = "lsh" if len(matrix) > AUDIT_EXACT_MAX else "blocked"
+    uf = UnionFind(len(matrix))
+    if method == "blocked":
+        pairs = _blocked(matrix, threshold, block_size, uf)
+    elif method == "lsh":
+        pairs = _lsh(matrix, threshold, block_size, uf, bands or AUDIT_LSH_BANDS, rows or AUDIT_LSH_ROWS)
+    else:
+        raise ValueError(f"Unknown audit method '{method}'. Use auto, blocked or lsh.")
+    return uf.groups(), method, pairs
+
+
+def audit_environment(db, project_name, env_name, threshold=None, method="auto", limit=50, block_size=None):
+    """
+    Near-duplicate report for one environment.
+
+    Clusters are ranked by size, then by how tight they are. Each lists its oldest
+    prompt as the one to keep and every other member's similarity to it; at most
+    `limit` clusters are returned, but the totals cover all of them.
+    """
+    env = db.get_environment_by_name(project_name, env_name)
+    if not env:
+        raise EnvironmentNotFound(f"Environment '{env_name}' for project '{project_name}' not found.")
+    threshold = AUDIT_THRESHOLD if threshold is None else threshold
+    start = time.perf_counter()
+    ids, matrix = db.export_embeddings(env['id'])
+    loaded = time.perf_counter()
+    normalize(matrix)
+    groups, method, pairs = find_clusters(matrix, threshold, method, block_size)
+
+    clusters = []
+    for group in groups:
+        group = np.sort(group)  # ids ascend with insertion order, so the first member is the oldest
+        similarity = matrix[group[1:]] @ matrix[group[0]]
+        clusters.append((group, similarity))
+    clusters.sort(key=lambda c: (-len(c[0]), -float(c[1].mean())))
+
+    shown = clusters[:limit]
+    prompts = db.get_prompts_by_ids([ids[i] for group, _ in shown for i in group]) if shown else {}
+    report = []
+    for group, similarity in shown:
+        keep = prompts[int(ids[group[0]])]
+        report.append({
+            "size": len(group),
+            "keep": keep,
+            "duplicates": [
+                {**prompts[int(ids[i])], "similarity": round(float(s), 4)}
+                for i, s in sorted(zip(group[1:], similarity), key=lambda m: -m[1])
+            ],
+            "min_similarity": round(float(similarity.min()), 4),
+            "mean_similarity": round(float(similarity.mean()), 4),
+        })
+    return {
+        "project": project_name,
+        "environment": env_name,
+        "threshold": threshold,
+        "method": method,
+        "prompts": len(ids),
+        "pairs": pairs,
+        "clusters": len(clusters),
+        "redundant_prompts": sum(len(group) - 1 for group, _ in clusters),
+        "timings": {
+            "load_ms": round((loaded - start) * 1000, 1),
+            "cluster_ms": round((time.perf_counter() - loaded) * 1000, 1),
+        },
+        "results": report,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report clusters of near-duplicate prompts in an environment")
+    parser.add_argument("--project", required=True, help="Project name")
+    parser.add_argument("--environment", required=True, help="Environment name")
+    parser.add_argument("--threshold", type=float, default=AUDIT_THRESHOLD, help="Cosine similarity linking two prompts")
+    parser.add_argument("--method", choices=["auto", "blocked", "lsh"], default="auto",
+                        help="All-pairs blocks, LSH candidates, or auto by environment size")
+    parser.add_argument("--limit", type=int, default=20, help="Clusters to list")
+    parser.add_argument("--block-size", type=int, help="Rows per similarity block (memory vs. speed)")
+    parser.add_argument("--json", action="store_true", help="Print the full report as JSON")
+    args = parser.parse_args()
+
+    try:
+        db = DBManager()
+        try:
+            report = audit_environment(db, args.project, args.environment, args.threshold, args.method, args.limit, args.block_size)
+        finally:
+            db.close()
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    if args.json:
+        print(json.dumps(report, indent=2, default=str))
+        return
+    print(f"[+] {report['prompts']} prompts, {report['clusters']} clusters, {report['redundant_prompts']} redundant "
+          f"(threshold {report['threshold']}, {report['method']}, "
+          f"{report['timings']['load_ms'] + report['timings']['cluster_ms']:.0f} ms)")
+    for n, cluster in enumerate(report["results"], 1):
+        keep = cluster["keep"]
+        print(f"\n#{n}: {cluster['size']} prompts, similarity {cluster['min_similarity']}-{max(d['similarity'] for d in cluster['duplicates'])}")
+        print(f"    keep [{keep['id']}] {keep['prompt_text'][:100]}")
+        for dup in cluster["duplicates"]:
+            print(f"    {dup['similarity']:.3f} [{dup['id']}] {dup['prompt_text'][:100]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import asyncio
+import hashlib
+import logging
+import os
+
+import psycopg2
+
+from caching import TTLCache
+from db_manager import DBManager, PoolTimeout
+from lexical import normalize_prompt
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding store keyed by (normalized prompt, model id, base URL).
+
+    The in-memory LRU tier is always on. The Postgres tier (`persistent=True`)
+    survives restarts and is shared between app instances and the CLI; its
+    failures are logged and treated as misses so they never fail an embedding.
+    """
+    def __init__(self, maxsize=2048, ttl=3600.0, persistent=False):
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.persistent = persistent
+        self.persistent_hits = 0
+
+    @staticmethod
+    def key(text, model_name, base_url):
+        material = "\0".join((base_url.rstrip("/"), model_name, normalize_prompt(text)))
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _db_get(self, key):
+        db = DBManager(pooled=True)
+        try:
+            return db.get_cached_embedding(key)
+        finally:
+            db.close()
+
+    def _db_put(self, key, model_name, embedding):
+        db = DBManager(pooled=True)
+        try:
+            db.put_cached_embedding(key, model_name, embedding)
+        finally:
+            db.close()
+
+    def get(self, key):
+        embedding = self.memory.get(key)
+        if embedding is None and self.persistent:
+            try:
+                embedding = self._db_get(key)
+            except (psycopg2.Error, PoolTimeout) as e:
+                logger.warning("Embedding cache lookup failed: %s", e)
+            if embedding is not None:
+                self.persistent_hits += 1
+                self.memory.set(key, embedding)
+        return embedding
+
+    def put(self, key, model_name, embedding):
+        self.memory.set(key, embedding)
+        if self.persistent:
+            try:
+                self._db_put(key, model_name, embedding)
+            except (psycopg2.Error, PoolTimeout) as e:
+                logger.warning("Embedding cache write failed: %s", e)
+
+    async def aget(self, key):
+        embedding = self.memory.get(key)
+        if embedding is None and self.persistent:
+            try:
+                embedding = await asyncio.to_thread(self._db_get, key)
+            except (psycopg2.Error, PoolTimeout) as e:
+                logger.warning("Embedding cache lookup failed: %s", e)
+            if embedding is not None:
+                self.persistent_hits += 1
+                self.memory.set(key, embedding)
+        return embedding
+
+    async def aput(self, key, model_name, embedding):
+        self.memory.set(key, embedding)
+        if self.persistent:
+            try:
+                await asyncio.to_thread(self._db_put, key, model_name, embedding)
+            except (psycopg2.Error, PoolTimeout) as e:
+                logger.warning("Embedding cache write failed: %s", e)
+
+    def clear(self):
+        return self.memory.clear()
+
+    def stats(self):
+        memory = self.memory.stats()
+        # A memory miss that the Postgres tier answered is still a cache hit overall.
+        return {
+            "memory_hits": memory["hits"],
+            "persistent_hits": self.persistent_hits,
+            "misses": memory["misses"] - self.persistent_hits,
+            "size": memory["size"],
+            "maxsize": memory["maxsize"],
+            "persistent": self.persistent,
+        }
+
+
+embedding_cache = EmbeddingCache(
+    maxsize=int(os.getenv("EMBEDDING_CACHE_SIZE", "2048")),
+    ttl=float(os.getenv("EMBEDDING_CACHE_TTL", "3600")),
+    persistent=os.getenv("EMBEDDING_CACHE_PERSIST", "").lower() in ("1", "true", "yes"),
+)
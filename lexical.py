@@ -0,0 +1,64 @@
+import hashlib
+import os
+import re
+import unicodedata
+import zlib
+
+import numpy as np
+
+# MinHash / LSH parameters. NUM_PERM = BANDS * ROWS; with 16 bands of 4 rows a pair
+# becomes an LSH candidate with ~50% probability at Jaccard 0.5 and >99% at 0.8.
+SHINGLE_SIZE = int(os.getenv("LEXICAL_SHINGLE_SIZE", "5"))
+LSH_BANDS = 16
+LSH_ROWS = 4
+NUM_PERM = LSH_BANDS * LSH_ROWS
+LEXICAL_THRESHOLD = float(os.getenv("LEXICAL_THRESHOLD", "0.9"))
+
+_MERSENNE_PRIME = (1 << 61) - 1
+# Fixed seed: signatures are persisted, so the permutations must never change between runs.
+_rng = np.random.RandomState(1)
+_PERM_A = _rng.randint(1, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.randint(0, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+
+
+def normalize_prompt(text):
+    """Canonical form used for content addressing: NFC, trimmed, whitespace runs collapsed."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+
+def text_hash(text):
+    """SHA-256 of the case-folded normalized text; equal hashes mean a verbatim resubmission."""
+    return hashlib.sha256(normalize_prompt(text).casefold().encode("utf-8")).hexdigest()
+
+
+def minhash(text):
+    """MinHash signature (NUM_PERM uint32 values) over the character shingles of the normalized text."""
+    normalized = normalize_prompt(text).casefold()
+    if len(normalized) <= SHINGLE_SIZE:
+        shingles = {normalized}
+    else:
+        shingles = {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+    # a*x + b stays below 2**64 because a, b and x are all 32-bit.
+    permuted = (np.outer(hashes, _PERM_A) + _PERM_B) % _MERSENNE_PRIME & np.uint64(0xFFFFFFFF)
+    return permuted.min(axis=0)
+
+
+def lsh_buckets(signature):
+    """One signed 64-bit bucket key per LSH band (band index included, so bands never collide)."""
+    bands = np.asarray(signature, dtype=np.uint32).reshape(LSH_BANDS, LSH_ROWS)
+    return [
+        int.from_bytes(hashlib.blake2b(band.tobytes(), digest_size=8, salt=i.to_bytes(2, "big")).digest(), "big", signed=True)
+        for i, band in enumerate(bands)
+    ]
+
+
+def signature(text):
+    """(text_hash, minhash, lsh_buckets) for storing alongside a prompt."""
+    sig = minhash(text)
+    return text_hash(text), [int(v) for v in sig], lsh_buckets(sig)
+
+
+def jaccard(sig_a, sig_b):
+    """Jaccard similarity estimated from two MinHash signatures."""
+    return float(np.mean(np.asarray(sig_a) == np.asarray(sig_b)))
@@ -0,0 +1,535 @@
+import asyncio
+import contextlib
+import logging
+import os
+import threading
+import time
+
+import httpx
+
+import metrics
+from lm_scheduler import OPERATIONS, lm_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Transport-level failures that mean the request never reached the model, so retrying is safe.
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)
+RETRYABLE_STATUSES = {502, 503, 504}
+
+
+class _Outcome:
+    response = None
+
+
+@contextlib.contextmanager
+def _observed(path, kwargs):
+    """Records one logical call (retries included) in metrics.LM_REQUEST_SECONDS."""
+    body = kwargs.get("json")
+    model = body.get("model") if isinstance(body, dict) else None
+    outcome = _Outcome()
+    start = time.perf_counter()
+    status = "error"
+    try:
+        yield outcome
+        status = str(outcome.response.status_code) if outcome.response is not None else "error"
+    except asyncio.CancelledError:
+        status = "cancelled"  # the caller went away, e.g. a closed stream
+        raise
+    except Exception as e:
+        status = type(e).__name__
+        raise
+    finally:
+        metrics.observe_lm(path, model, status, time.perf_counter() - start)
+
+
+@contextlib.asynccontextmanager
+async def _scheduled(path):
+    operation = OPERATIONS.get(path)
+    if operation is None:
+        yield
+        return
+    async with lm_scheduler.slot(operation):
+        yield
+
+
+class LMClient:
+    """
+    Keep-alive HTTP client for one OpenAI-compatible base URL (normally LM Studio).
+
+    Holds a sync and an async connection pool (created on first use) sharing the
+    same limits, timeouts and retry policy. Failed connections and 502/503/504
+    responses are retried with exponential backoff; any other response is
+    returned to the caller untouched. Async embedding and chat calls first wait
+    for a slot from lm_scheduler; the blocking methods (CLI tools, worker
+    threads) are not scheduled.
+    """
+    def __init__(self, base_url, max_connections=10, connect_timeout=5.0, read_timeout=120.0,
+                 retries=2, backoff=0.5):
+        self.base_url = base_url.rstrip("/")
+        self.retries = retries
+        self.backoff = backoff
+        self._limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self._sync = None
+        self._async = None
+        self._lock = threading.Lock()
+
+    def _sync_client(self):
+        with self._lock:
+            if self._sync is None or self._sync.is_closed:
+                self._sync = httpx.Client(base_url=self.base_url, limits=self._limits, timeout=self._timeout)
+            return self._sync
+
+    def _async_client(self):
+        with self._lock:
+            if self._async is None or self._async.is_closed:
+                self._async = httpx.AsyncClient(base_url=self.base_url, limits=self._limits, timeout=self._timeout)
+            return self._async
+
+    def _delay(self, attempt):
+        return self.backoff * (2 ** attempt)
+
+    def request(self, method, path, **kwargs):
+        with _observed(path, kwargs) as outcome:
+            outcome.response = self._request(method, path, **kwargs)
+            return outcome.response
+
+    def _request(self, method, path, **kwargs):
+        client = self._sync_client()
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            try:
+                response = client.request(method, path, **kwargs)
+            except RETRYABLE_ERRORS:
+                if last_attempt:
+                    raise
+            else:
+                if response.status_code not in RETRYABLE_STATUSES or last_attempt:
+                    return response
+            time.sleep(self._delay(attempt))
+
+    async def arequest(self, method, path, **kwargs):
+        # Queue time is outside _observed: lm_request_seconds measures the model, not the backlog.
+        async with _scheduled(path):
+            with _observed(path, kwargs) as outcome:
+                outcome.response = await self._arequest(method, path, **kwargs)
+                return outcome.response
+
+    async def _arequest(self, method, path, **kwargs):
+        client = self._async_client()
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            try:
+                response = await client.request(method, path, **kwargs)
+            except RETRYABLE_ERRORS:
+                if last_attempt:
+                    raise
+            else:
+                if response.status_code not in RETRYABLE_STATUSES or last_attempt:
+                    return response
+            await asyncio.sleep(self._delay(attempt))
+
+    @contextlib.asynccontextmanager
+    async def astream(self, method, path, **kwargs):
+        """
+        Async context manager yielding a response whose body has not been read yet.
+
+        Retries follow `arequest`: connection failures and 502/503/504 are retried before
+        any body is consumed; once the response is handed out it is never retried. The
+        scheduler slot is held until the body has been read.
+        """
+        async with _scheduled(path), self._astream(method, path, **kwargs) as response:
+            yield response
+
+    @contextlib.asynccontextmanager
+    async def _astream(self, method, path, **kwargs):
+        with _observed(path, kwargs) as outcome:
+            client = self._async_client()
+            for attempt in range(self.retries + 1):
+                last_attempt = attempt == self.retries
+                try:
+                    response = await client.send(client.build_request(method, path, **kwargs), stream=True)
+                except RETRYABLE_ERRORS:
+                    if last_attempt:
+                        raise
+                else:
+                    if response.status_code not in RETRYABLE_STATUSES or last_attempt:
+                        break
+                    await response.aclose()
+                await asyncio.sleep(self._delay(attempt))
+            outcome.response = response
+            try:
+                yield response
+            finally:
+                await response.aclose()
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    async def aget(self, path, **kwargs):
+        return await self.arequest("GET", path, **kwargs)
+
+    async def apost(self, path, **kwargs):
+        return await self.arequest("POST", path, **kwargs)
+
+    def close(self):
+        if self._sync is not None:
+            self._sync.close()
+
+    async def aclose(self):
+        if self._async is not None:
+            await self._async.aclose()
+        self.close()
+
+
+class _Backend:
+    """One member of a BackendPool: its client, load and health."""
+    def __init__(self, client):
+        self.client = client
+        self.url = client.base_url
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0  # consecutive; reset by any success
+        self.ejected_until = 0.0
+        self.ejections = 0
+        self.last_error = None
+        self.models = None  # listing from the last successful probe
+        self.embedding = None  # (model, dimension) measured by the last consistency check
+        self.serves_embeddings = True
+
+    def available(self, now):
+        return now >= self.ejected_until
+
+    def stats(self, now):
+        return {
+            "url": self.url,
+            "available": self.available(now),
+            "ejected_for_s": round(max(self.ejected_until - now, 0.0), 1),
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "ejections": self.ejections,
+            "last_error": self.last_error,
+            "models": [m['id'] for m in self.models] if self.models is not None else None,
+            "embedding_model": self.embedding[0] if self.embedding else None,
+            "dimension": self.embedding[1] if self.embedding else None,
+            "serves_embeddings": self.serves_embeddings,
+        }
+
+
+class BackendPool:
+    """
+    Spreads calls for one base URL over several OpenAI-compatible backends.
+
+    Each call goes to the available backend with the fewest requests in flight
+    (ties go to the one that has served fewest). A backend that fails
+    `max_failures` times in a row (connection errors or 502/503/504 after its
+    client's retries) is ejected for `eject_seconds`; the call fails over to the
+    next backend. `probe()` lists /models on every backend, reinstates those that
+    answer, and, given `pick_embedding_model`, embeds a probe text to confirm each
+    backend serves the same embedding model and dimension as the first available
+    one; backends that do not are kept out of /embeddings traffic. /models itself
+    is answered by that reference backend, so model discovery stays consistent.
+
+    Quacks like LMClient, so get_client() can hand it out for the pooled URL.
+    """
+    def __init__(self, clients, max_failures=3, eject_seconds=30.0, probe_timeout=5.0, pick_embedding_model=None):
+        if not clients:
+            raise ValueError("A backend pool needs at least one backend.")
+        self.backends = [_Backend(client) for client in clients]
+        self.max_failures = max_failures
+        self.eject_seconds = eject_seconds
+        self.probe_timeout = probe_timeout
+        self.pick_embedding_model = pick_embedding_model
+        self.embedding_model = None
+        self.dimension = None
+        self.probes = 0
+        self._lock = threading.Lock()
+        self._task = None
+
+    def _eligible(self, backend, path, model):
+        if path == "/embeddings" and not backend.serves_embeddings:
+            return False
+        if path == "/models":
+            return backend.serves_embeddings
+        return model is None or backend.models is None or any(m['id'] == model for m in backend.models)
+
+    def _choose(self, path, kwargs, tried):
+        """The backend for the next attempt, or None when every candidate has been tried."""
+        body = kwargs.get("json")
+        model = body.get("model") if isinstance(body, dict) else None
+        now = time.monotonic()
+        untried = [b for b in self.backends if b not in tried]
+        candidates = [b for b in untried if self._eligible(b, path, model)]
+        if not candidates and not tried:
+            candidates = untried  # nobody lists the model: let a backend answer "not found"
+        # With every candidate ejected, trying one beats failing the call outright.
+        candidates = [b for b in candidates if b.available(now)] or candidates
+        if not candidates:
+            return None
+        if path == "/models":
+            return candidates[0]
+        return min(candidates, key=lambda b: (b.outstanding, b.requests))
+
+    def _acquire(self, path, kwargs, tried):
+        """Chooses a backend and counts the call against it; also says whether it is the last one to try."""
+        with self._lock:
+            backend = self._choose(path, kwargs, tried)
+            backend.outstanding += 1
+            backend.requests += 1
+            tried.append(backend)
+            return backend, self._choose(path, kwargs, tried) is None
+
+    def _release(self, backend):
+        with self._lock:
+            backend.outstanding -= 1
+
+    def _succeeded(self, backend):
+        with self._lock:
+            backend.failures = 0
+            backend.ejected_until = 0.0
+
+    def _failed(self, backend, error):
+        with self._lock:
+            backend.failures += 1
+            backend.last_error = error
+            if backend.failures < self.max_failures:
+                return
+            if backend.available(time.monotonic()):
+                backend.ejections += 1
+                metrics.LM_BACKEND_EJECTIONS.inc(backend=backend.url)
+                logger.warning("Ejecting LM backend %s for %ss: %s", backend.url, self.eject_seconds, error)
+            backend.ejected_until = time.monotonic() + self.eject_seconds
+
+    def _record(self, backend, response):
+        """Books the outcome of one attempt; True when the call should fail over to another backend."""
+        if response.status_code in RETRYABLE_STATUSES:
+            self._failed(backend, f"HTTP {response.status_code}")
+            return True
+        self._succeeded(backend)
+        return False
+
+    def request(self, method, path, **kwargs):
+        tried = []
+        while True:
+            backend, last = self._acquire(path, kwargs, tried)
+            try:
+                response = backend.client.request(method, path, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                self._failed(backend, repr(e))
+                if last:
+                    raise
+                continue
+            finally:
+                self._release(backend)
+            if not self._record(backend, response) or last:
+                return response
+
+    async def arequest(self, method, path, **kwargs):
+        async with _scheduled(path):
+            tried = []
+            while True:
+                backend, last = self._acquire(path, kwargs, tried)
+                try:
+                    with _observed(path, kwargs) as outcome:
+                        outcome.response = await backend.client._arequest(method, path, **kwargs)
+                except RETRYABLE_ERRORS as e:
+                    self._failed(backend, repr(e))
+                    if last:
+                        raise
+                    continue
+                finally:
+                    self._release(backend)
+                if not self._record(backend, outcome.response) or last:
+                    return outcome.response
+
+    @contextlib.asynccontextmanager
+    async def astream(self, method, path, **kwargs):
+        """Like LMClient.astream; fails over only before the response is handed out."""
+        async with _scheduled(path):
+            tried = []
+            while True:
+                backend, last = self._acquire(path, kwargs, tried)
+                handed_out = False
+                try:
+                    async with backend.client._astream(method, path, **kwargs) as response:
+                        if self._record(backend, response) and not last:
+                            continue
+                        handed_out = True
+                        yield response
+                        return
+                except RETRYABLE_ERRORS as e:
+                    if handed_out:
+                        raise
+                    self._failed(backend, repr(e))
+                    if last:
+                        raise
+                finally:
+                    self._release(backend)
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    async def aget(self, path, **kwargs):
+        return await self.arequest("GET", path, **kwargs)
+
+    async def apost(self, path, **kwargs):
+        return await self.arequest("POST", path, **kwargs)
+
+    async def _probe(self, backend):
+        try:
+            response = await backend.client._async_client().get("/models", timeout=self.probe_timeout)
+            response.raise_for_status()
+            backend.models = response.json().get('data', [])
+        except Exception as e:
+            self._failed(backend, repr(e))
+            return
+        self._succeeded(backend)
+
+    async def _dimension(self, backend, model):
+        response = await backend.client._async_client().post(
+            "/embeddings", json={"model": model, "input": "dimension probe"}, timeout=self.probe_timeout)
+        response.raise_for_status()
+        return len(response.json()['data'][0]['embedding'])
+
+    async def _check_embeddings(self):
+        """Keeps /embeddings on backends serving the reference (first available) backend's model and dimension."""
+        now = time.monotonic()
+        reference = None
+        for backend in self.backends:
+            if backend.models is None or not backend.available(now):
+                continue
+            try:
+                model = reference[0] if reference else self.pick_embedding_model(backend.models)
+                if not any(m['id'] == model for m in backend.models):
+                    serves = False
+                else:
+                    if not backend.embedding or backend.embedding[0] != model:
+                        backend.embedding = (model, await self._dimension(backend, model))
+                    reference = reference or backend.embedding
+                    serves = backend.embedding == reference
+            except Exception as e:
+                self._failed(backend, repr(e))
+                continue
+            if backend.serves_embeddings and not serves:
+                logger.warning("LM backend %s does not serve %s at %s dimensions; sending it no embeddings",
+                               backend.url, *reference)
+            backend.serves_embeddings = serves
+        if reference and reference != (self.embedding_model, self.dimension):
+            logger.info("LM backend pool embeds with %s (%s dimensions)", *reference)
+        self.embedding_model, self.dimension = reference or (None, None)
+
+    async def probe(self):
+        """Health-checks every backend once (and re-checks embedding consistency)."""
+        await asyncio.gather(*(self._probe(b) for b in self.backends))
+        if self.pick_embedding_model is not None:
+            await self._check_embeddings()
+        self.probes += 1
+
+    async def _probe_loop(self, interval):
+        while True:
+            try:
+                await self.probe()
+            except Exception as e:
+                logger.warning("LM backend probe failed: %s", e)
+            await asyncio.sleep(interval)
+
+    def start(self, interval):
+        """Probes now and every `interval` seconds on the running loop until stop()."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._probe_loop(interval))
+        return self
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            "embedding_model": self.embedding_model,
+            "dimension": self.dimension,
+            "probes": self.probes,
+            "backends": [b.stats(now) for b in self.backends],
+        }
+
+    def close(self):
+        for backend in self.backends:
+            backend.client.close()
+
+    async def aclose(self):
+        await self.stop()
+        for backend in self.backends:
+            await backend.client.aclose()
+
+
+_clients = {}
+_pools = {}
+_clients_lock = threading.Lock()
+
+def _new_client(base_url):
+    return LMClient(
+        base_url,
+        max_connections=int(os.getenv("LM_MAX_CONNECTIONS", "10")),
+        connect_timeout=float(os.getenv("LM_CONNECT_TIMEOUT", "5")),
+        read_timeout=float(os.getenv("LM_READ_TIMEOUT", "120")),
+        retries=int(os.getenv("LM_RETRIES", "2")),
+        backoff=float(os.getenv("LM_RETRY_BACKOFF", "0.5")),
+    )
+
+def get_client(base_url):
+    """
+    Returns the shared client for `base_url`, configured from LM_* environment variables:
+    the BackendPool registered for it, otherwise one LMClient per URL.
+    """
+    key = base_url.rstrip("/")
+    with _clients_lock:
+        client = _pools.get(key) or _clients.get(key)
+        if client is None:
+            client = _clients[key] = _new_client(key)
+        return client
+
+def create_pool(urls, **kwargs):
+    """BackendPool over `urls` with pool settings from LM_BACKEND_* environment variables."""
+    settings = {
+        "max_failures": int(os.getenv("LM_BACKEND_MAX_FAILURES", "3")),
+        "eject_seconds": float(os.getenv("LM_BACKEND_EJECT_SECONDS", "30")),
+        "probe_timeout": float(os.getenv("LM_BACKEND_PROBE_TIMEOUT", "5")),
+    }
+    return BackendPool([_new_client(url.rstrip("/")) for url in urls], **{**settings, **kwargs})
+
+def register_pool(base_url, pool):
+    """Routes calls for `base_url` through `pool` from now on."""
+    with _clients_lock:
+        _pools[base_url.rstrip("/")] = pool
+    return pool
+
+def backend_stats():
+    with _clients_lock:
+        pools = dict(_pools)
+    return {url: pool.stats() for url, pool in pools.items()}
+
+def close_clients():
+    with _clients_lock:
+        clients = list(_clients.values()) + list(_pools.values())
+        _clients.clear()
+        _pools.clear()
+    for client in clients:
+        client.close()
+
+async def aclose_clients():
+    with _clients_lock:
+        clients = list(_clients.values()) + list(_pools.values())
+        _clients.clear()
+        _pools.clear()
+    for client in clients:
+        await client.aclose()
@@ -0,0 +1,185 @@
+import asyncio
+import bisect
+import contextlib
+import contextvars
+import itertools
+import math
+import os
+import time
+from collections import deque
+
+import metrics
+
+# Lower value = served first. Interactive work is rejected with QueueFull when the queue
+# is full; the other classes back off and retry, since nobody is waiting on a 429.
+PRIORITIES = {"interactive": 0, "batch": 1, "background": 2}
+
+LM_EMBEDDING_CONCURRENCY = int(os.getenv("LM_EMBEDDING_CONCURRENCY", "4"))
+LM_CHAT_CONCURRENCY = int(os.getenv("LM_CHAT_CONCURRENCY", "2"))
+LM_QUEUE_SIZE = int(os.getenv("LM_QUEUE_SIZE", "32"))  # waiting calls per operation
+
+# Which requests are scheduled, by path; anything else (e.g. /models) goes straight through.
+OPERATIONS = {"/embeddings": "embedding", "/chat/completions": "chat"}
+
+_priority = contextvars.ContextVar("lm_priority", default="interactive")
+
+
+class QueueFull(Exception):
+    """The LM request queue for an operation is full; retry after `retry_after` seconds."""
+    def __init__(self, operation, retry_after):
+        super().__init__(f"LM Studio is busy: the {operation} queue is full. Retry in {retry_after}s.")
+        self.operation = operation
+        self.retry_after = retry_after
+
+
+@contextlib.contextmanager
+def priority(name):
+    """Runs LM calls made in this context (and tasks started from it) at priority `name`."""
+    if name not in PRIORITIES:
+        raise ValueError(f"Unknown priority '{name}'. Use {', '.join(PRIORITIES)}.")
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority():
+    return _priority.get()
+
+
+class _Lane:
+    """Concurrency limit and priority queue for one operation."""
+    def __init__(self, operation, limit, max_queue):
+        self.operation = operation
+        self.limit = limit
+        self.max_queue = max_queue
+        self.running = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.evicted = 0
+        self._waiters = []  # sorted (rank, seq, priority, future)
+        self._seq = itertools.count()
+        self._service = None  # moving average of seconds a call holds its slot
+        self._waits = deque(maxlen=1000)  # recent queue waits in seconds
+
+    def retry_after(self):
+        """Seconds until the queue has likely drained by one slot's worth, for Retry-After."""
+        service = self._service or 1.0
+        return max(1, math.ceil(service * (len(self._waiters) + 1) / self.limit))
+
+    def _grant(self):
+        while self._waiters and self.running < self.limit:
+            *_, future = self._waiters.pop(0)
+            if not future.done():
+                self.running += 1
+                future.set_result(None)
+
+    async def acquire(self, name):
+        rank = PRIORITIES[name]
+        if self.running < self.limit and not self._waiters:
+            self.running += 1
+            self.admitted += 1
+            self._waits.append(0.0)
+            return
+        if len(self._waiters) >= self.max_queue:
+            # A full queue makes room for more urgent work by bumping its newest, least urgent entry.
+            if not self._waiters or self._waiters[-1][0] <= rank:
+                self.rejected += 1
+                metrics.LM_QUEUE_REJECTED.inc(operation=self.operation, priority=name)
+                raise QueueFull(self.operation, self.retry_after())
+            *_, victim = self._waiters.pop()
+            self.evicted += 1
+            victim.set_exception(QueueFull(self.operation, self.retry_after()))
+        future = asyncio.get_running_loop().create_future()
+        entry = (rank, next(self._seq), name, future)
+        bisect.insort(self._waiters, entry)
+        start = time.perf_counter()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                # Granted just as the caller went away: pass the slot on.
+                self.release(None)
+            elif entry in self._waiters:
+                self._waiters.remove(entry)
+            raise
+        waited = time.perf_counter() - start
+        self.admitted += 1
+        self._waits.append(waited)
+        metrics.LM_QUEUE_WAIT_SECONDS.observe(waited, operation=self.operation, priority=name)
+
+    def release(self, held):
+        self.running -= 1
+        if held is not None:
+            self._service = held if self._service is None else 0.8 * self._service + 0.2 * held
+        self._grant()
+
+    def stats(self):
+        waits = sorted(self._waits)
+        queued = {name: 0 for name in PRIORITIES}
+        for *_, name, _ in self._waiters:
+            queued[name] += 1
+        return {
+            "limit": self.limit,
+            "running": self.running,
+            "queued": len(self._waiters),
+            "queued_by_priority": queued,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "evicted": self.evicted,
+            "wait_p50_ms": round(waits[len(waits) // 2] * 1000, 1) if waits else 0.0,
+            "wait_p95_ms": round(waits[int(len(waits) * 0.95)] * 1000, 1) if waits else 0.0,
+            "service_ms": round(self._service * 1000, 1) if self._service is not None else None,
+        }
+
+
+class LMScheduler:
+    """
+    Admission control for LM Studio calls made from the event loop.
+
+    Each operation ("embedding", "chat") has its own concurrency limit, so a burst
+    of slow completions cannot starve embeddings. Calls beyond the limit wait in a
+    bounded queue, served by priority class (PRIORITIES, taken from the calling
+    context) and then in arrival order. When the queue is full, interactive calls
+    fail fast with QueueFull (the web app answers 429 with Retry-After), while
+    batch and background calls back off and retry.
+    """
+    def __init__(self, limits=None, max_queue=None):
+        limits = limits or {"embedding": LM_EMBEDDING_CONCURRENCY, "chat": LM_CHAT_CONCURRENCY}
+        max_queue = LM_QUEUE_SIZE if max_queue is None else max_queue
+        self.lanes = {operation: _Lane(operation, limit, max_queue) for operation, limit in limits.items()}
+
+    @contextlib.asynccontextmanager
+    async def slot(self, operation, priority=None):
+        """Holds one of `operation`'s concurrency slots for the duration of the block."""
+        lane = self.lanes[operation]
+        name = priority or current_priority()
+        while True:
+            try:
+                await lane.acquire(name)
+                break
+            except QueueFull as e:
+                if name == "interactive":
+                    raise
+                await asyncio.sleep(e.retry_after)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            lane.release(time.perf_counter() - start)
+
+    def configure(self, operation, limit=None, max_queue=None):
+        lane = self.lanes[operation]
+        if limit is not None:
+            lane.limit = limit
+        if max_queue is not None:
+            lane.max_queue = max_queue
+        lane._grant()
+
+    def stats(self):
+        return {operation: lane.stats() for operation, lane in self.lanes.items()}
+
+
+lm_scheduler = LMScheduler()
@@ -0,0 +1,59 @@
+import argparse
+import asyncio
+import sys
+from db_manager import DBManager
+from lm_client import aclose_clients
+from reembed import ReembedJob
+from similarity_check import LM_STUDIO_DEFAULT_URL
+
+async def _reembed(args):
+    job = ReembedJob(args.url, args.model, args.batch_size, args.pause).start()
+    try:
+        while job.running:
+            await asyncio.sleep(5)
+            p = job.to_dict()
+            eta = f", ETA {p['eta_seconds']}s" if p['eta_seconds'] is not None else ""
+            print(f"[~] {p['status']}: {p['done']}/{p['total']} prompts ({p['percent']}%), {p['rate_per_sec']}/s{eta}")
+        return job.to_dict()
+    finally:
+        await aclose_clients()
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the prompt embedding index for Prompt Similarity Detector")
+    parser.add_argument("--kind", choices=["hnsw", "ivfflat", "none"], help="Index type (defaults to VECTOR_INDEX or hnsw)")
+    parser.add_argument("--rebuild", action="store_true", help="Build a fresh index and swap it in (after a reset or bulk load)")
+    parser.add_argument("--migrate", action="store_true", help="Upgrade the schema; partitions a prompts table created before per-environment partitions")
+    parser.add_argument("--backfill-lexical", action="store_true", help="Compute lexical duplicate signatures for prompts saved before they existed")
+    parser.add_argument("--quantize", choices=["none", "halfvec", "binary"], help="Add (and backfill) or drop a compact embedding column for two-phase search")
+    parser.add_argument("--reembed", action="store_true", help="Re-embed every prompt with another model online, then swap the embeddings in")
+    parser.add_argument("--url", default=LM_STUDIO_DEFAULT_URL, help="LM Studio API base URL (for --reembed)")
+    parser.add_argument("--model", help="Embedding model for --reembed (auto-discovered if omitted)")
+    parser.add_argument("--batch-size", type=int, help="Prompts per re-embedding batch")
+    parser.add_argument("--pause", type=float, help="Seconds to wait between re-embedding batches")
+    
+    args = parser.parse_args()
+    
+    try:
+        db = DBManager()
+        if args.migrate:
+            print("[+] Schema up to date." if db.upgrade_schema() else "[+] No prompts table yet; nothing to migrate.")
+        result = db.ensure_vector_index(args.kind, rebuild=args.rebuild)
+        print(f"[+] {result['message']}")
+        if args.backfill_lexical:
+            db.upgrade_schema()
+            print(f"[+] Backfilled lexical signatures for {db.backfill_lexical_signatures()} prompts.")
+        if args.quantize:
+            print(f"[+] {db.ensure_quantization(args.quantize)['message']}")
+        db.close()
+        if args.reembed:
+            # Interrupting keeps the partial results; running the same command again resumes.
+            result = asyncio.run(_reembed(args))
+            if result["status"] != "done":
+                raise RuntimeError(result["error"] or f"Re-embedding {result['status']}")
+            print(f"[+] Re-embedded {result['total']} prompts with '{result['model']}' ({result['dimensions']} dimensions).")
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+import contextvars
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds; LM calls need the long tail, DB queries the short end.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+SERVER_TIMING = os.getenv("SERVER_TIMING", "").lower() in ("1", "true", "yes")
+
+# Per-request {name: [seconds, count]} collected for the Server-Timing header. Set by the
+# HTTP middleware; asyncio tasks and to_thread calls inherit it from the request context.
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(str(labels.get(n, "")) for n in self.labelnames), 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[i] += 1
+            series[-2] += seconds
+            series[-1] += 1
+
+    def count(self, **labels):
+        series = self._series.get(tuple(str(labels.get(n, "")) for n in self.labelnames))
+        return series[-1] if series else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    le = f'le="{_format_value(bound)}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [le])} {count}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(series[-2])}")
+                lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+registry = Registry()
+
+CHECK_STAGE_SECONDS = registry.register(Histogram(
+    "prompt_check_stage_seconds", "Duration of prompt check stages.", ["stage"]))
+LM_REQUEST_SECONDS = registry.register(Histogram(
+    "lm_request_seconds", "Duration of LM Studio API calls, including retries.", ["endpoint", "model", "status"]))
+DB_QUERY_SECONDS = registry.register(Histogram(
+    "db_query_seconds", "Duration of DBManager method calls.", ["method"]))
+HTTP_REQUEST_SECONDS = registry.register(Histogram(
+    "http_request_seconds", "Duration of API requests (until the response starts for streams).", ["method", "route", "status"]))
+PROMPTS_SAVED = registry.register(Counter(
+    "prompts_autosaved_total", "Checked prompts saved automatically because no similar prompt existed."))
+DUPLICATES_FOUND = registry.register(Counter(
+    "duplicates_found_total", "Checks that found an existing similar prompt, by tier.", ["kind"]))
+LM_QUEUE_WAIT_SECONDS = registry.register(Histogram(
+    "lm_queue_wait_seconds", "Time LM Studio calls waited for a concurrency slot.", ["operation", "priority"]))
+LM_QUEUE_REJECTED = registry.register(Counter(
+    "lm_queue_rejected_total", "LM Studio calls turned away because the operation's queue was full.", ["operation", "priority"]))
+LM_BACKEND_EJECTIONS = registry.register(Counter(
+    "lm_backend_ejections_total", "Times an LM backend was taken out of its pool after repeated failures.", ["backend"]))
+COALESCED_CALLS = registry.register(Counter(
+    "coalesced_calls_total", "Calls that joined an identical call already in flight instead of running again.", ["operation"]))
+ERRORS = registry.register(Counter(
+    "errors_total", "Failures by source and exception type or HTTP status.", ["source", "type"]))
+
+
+def add_timing(name, seconds):
+    """Adds `seconds` under `name` to the current request's Server-Timing entries, if one is being collected."""
+    timings = _request_timings.get()
+    if timings is not None:
+        entry = timings.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+
+def observe_stage(stage, seconds):
+    CHECK_STAGE_SECONDS.observe(seconds, stage=stage)
+    add_timing(stage, seconds)
+
+
+def observe_stages(timings_ms):
+    """Records a pipeline `timings` dict (milliseconds per stage)."""
+    for stage, ms in timings_ms.items():
+        observe_stage(stage, ms / 1000)
+
+
+def record_check_outcome(similar_prompts, lexical_match, saved):
+    if saved:
+        PROMPTS_SAVED.inc()
+    elif similar_prompts:
+        DUPLICATES_FOUND.inc(kind=f"lexical_{lexical_match}" if lexical_match else "semantic")
+
+
+@contextmanager
+def timed_db(method):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        ERRORS.inc(source="db", type=type(e).__name__)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        DB_QUERY_SECONDS.observe(elapsed, method=method)
+        add_timing("db", elapsed)
+
+
+def observe_lm(path, model, status, seconds):
+    endpoint = path.rstrip("/").rsplit("/", 1)[-1] or path
+    LM_REQUEST_SECONDS.observe(seconds, endpoint=endpoint, model=model or "", status=status)
+    add_timing(f"lm-{endpoint}", seconds)
+    if status != "cancelled" and (not status.isdigit() or int(status) >= 400):
+        ERRORS.inc(source="lm", type=status)
+
+
+def start_request():
+    """Begins collecting Server-Timing entries for the current context; returns a token to reset it."""
+    return _request_timings.set({})
+
+
+def _server_timing_header(timings):
+    return ", ".join(
+        f"{name};dur={seconds * 1000:.1f}" + (f';desc="{count} calls"' if count > 1 else "")
+        for name, (seconds, count) in timings.items()
+    )
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request by route template and status.
+
+    With `server_timing`, responses carry a Server-Timing header summing the stage, DB and
+    LM Studio time spent before the response started. For streaming endpoints that is only
+    the work done before the first byte; their stage timings are part of the stream.
+    """
+    def __init__(self, app, server_timing=None):
+        self.app = app
+        self.server_timing = server_timing  # None follows SERVER_TIMING
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        token = start_request()
+        start = time.perf_counter()
+        server_timing = SERVER_TIMING if self.server_timing is None else self.server_timing
+
+        async def send_with_metrics(message):
+            if message["type"] == "http.response.start":
+                route = scope.get("route")
+                status = message["status"]
+                HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, method=scope["method"],
+                                             route=getattr(route, "path", "other"), status=status)
+                if status >= 400:
+                    ERRORS.inc(source="http", type=status)
+                if server_timing:
+                    timings = _request_timings.get()
+                    if timings:
+                        header = _server_timing_header(timings)
+                        message = {**message, "headers": list(message.get("headers", [])) + [(b"server-timing", header.encode("latin-1"))]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        except Exception as e:
+            ERRORS.inc(source="http", type=type(e).__name__)
+            raise
+        finally:
+            _request_timings.reset(token)
@@ -0,0 +1,199 @@
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pdfplumber
+
+PDF_MAX_UPLOAD_MB = float(os.getenv("PDF_MAX_UPLOAD_MB", "25"))
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "500"))
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+PDF_JOB_TTL = float(os.getenv("PDF_JOB_TTL", "900"))
+
+_SPOOL_CHUNK = 1024 * 1024
+
+
+class PdfLimitError(ValueError):
+    """The upload exceeds PDF_MAX_UPLOAD_MB or PDF_MAX_PAGES."""
+
+
+def spool_upload(source, max_bytes=None):
+    """
+    Copies a file object to a named temporary file in 1 MB chunks and returns its path.
+
+    Worker processes open the PDF by path, so the upload is never held in memory as
+    a whole. Raises PdfLimitError (and removes the partial file) past `max_bytes`.
+    """
+    max_bytes = max_bytes if max_bytes is not None else int(PDF_MAX_UPLOAD_MB * 1024 * 1024)
+    fd, path = tempfile.mkstemp(prefix="pdf-import-", suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            size = 0
+            while chunk := source.read(_SPOOL_CHUNK):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise PdfLimitError(f"PDF exceeds the {max_bytes / (1024 * 1024):g} MB upload limit.")
+                out.write(chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path
+
+
+def count_pages(path):
+    with pdfplumber.open(path) as pdf:
+        return len(pdf.pages)
+
+
+def extract_pages(path, start, stop):
+    """Text of pages [start, stop) of the PDF at `path`; runs in a worker process."""
+    texts = []
+    with pdfplumber.open(path) as pdf:
+        for page in pdf.pages[start:stop]:
+            texts.append(page.extract_text() or "")
+            # Drop the parsed layout, otherwise every page of a long document stays in memory.
+            page.flush_cache()
+    return texts
+
+
+class PdfJob:
+    """Progress and result of one background extraction."""
+    def __init__(self, filename):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.status = "queued"  # queued -> running -> done | error
+        self.pages_total = None
+        self.pages_done = 0
+        self.text = None
+        self.error = None
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "status": self.status,
+            "pages_total": self.pages_total,
+            "pages_done": self.pages_done,
+            "text": self.text,
+            "error": self.error,
+        }
+
+
+class PdfExtractor:
+    """
+    Extracts PDF text in a process pool, one task per range of `pages_per_task` pages.
+
+    pdfplumber is pure Python and CPU-bound, so a thread would still hold the GIL
+    and stall every other request. Workers open the spooled file themselves; only
+    page ranges and extracted text cross the process boundary. Finished jobs are
+    kept for `job_ttl` seconds so clients can collect the result.
+    """
+    def __init__(self, workers=None, pages_per_task=None, max_pages=None, job_ttl=None):
+        self.workers = workers or PDF_WORKERS
+        self.pages_per_task = pages_per_task or PDF_PAGES_PER_TASK
+        self.max_pages = max_pages or PDF_MAX_PAGES
+        self.job_ttl = job_ttl if job_ttl is not None else PDF_JOB_TTL
+        self.jobs = {}
+        self._tasks = set()
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn, not fork: the app process runs DB pool and to_thread workers whose
+                # locks a forked child could inherit mid-acquire.
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def _discard_pool(self, pool):
+        with self._lock:
+            if self._executor is pool:
+                self._executor = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    async def extract(self, path, job=None):
+        """Extracts the text of the PDF at `path`, updating `job` as page ranges finish."""
+        loop = asyncio.get_running_loop()
+        pool = self._pool()
+        try:
+            total = await loop.run_in_executor(pool, count_pages, path)
+            if total > self.max_pages:
+                raise PdfLimitError(f"PDF has {total} pages; the limit is {self.max_pages}.")
+            if job:
+                job.pages_total = total
+                job.status = "running"
+            futures = [
+                loop.run_in_executor(pool, extract_pages, path, start, min(start + self.pages_per_task, total))
+                for start in range(0, total, self.pages_per_task)
+            ]
+            try:
+                for finished in asyncio.as_completed(futures):
+                    pages = await finished
+                    if job:
+                        job.pages_done += len(pages)
+            finally:
+                for future in futures:
+                    future.cancel()
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory on a hostile file); start a fresh pool next time.
+            self._discard_pool(pool)
+            raise
+        return "\n".join(text for future in futures for text in future.result() if text).strip()
+
+    async def _run(self, job, path):
+        try:
+            job.text = await self.extract(path, job)
+            job.status = "done"
+        except Exception as e:
+            job.status = "error"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.monotonic()
+            os.unlink(path)
+
+    def submit(self, path, filename):
+        """Starts extracting the spooled file at `path` in the background; the file is removed afterwards."""
+        self._prune()
+        job = PdfJob(filename)
+        self.jobs[job.id] = job
+        task = asyncio.create_task(self._run(job, path))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def get(self, job_id):
+        self._prune()
+        return self.jobs.get(job_id)
+
+    def _prune(self):
+        now = time.monotonic()
+        for job_id, job in list(self.jobs.items()):
+            if job.finished_at is not None and now - job.finished_at > self.job_ttl:
+                del self.jobs[job_id]
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "pool_started": self._executor is not None,
+            "jobs_running": sum(1 for job in self.jobs.values() if job.finished_at is None),
+            "jobs_kept": len(self.jobs),
+        }
+
+    def shutdown(self):
+        for task in list(self._tasks):
+            task.cancel()
+        with self._lock:
+            pool, self._executor = self._executor, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+pdf_extractor = PdfExtractor()
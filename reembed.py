@@ -0,0 +1,147 @@
+import asyncio
+import os
+import time
+
+import psycopg2
+
+from db_manager import VECTOR_QUANTIZATION, DBManager, AsyncDBManager
+from lm_scheduler import priority
+from similarity_check import get_embeddings_async, resolve_model_async
+
+REEMBED_BATCH_SIZE = int(os.getenv("REEMBED_BATCH_SIZE", "64"))
+REEMBED_PAUSE = float(os.getenv("REEMBED_PAUSE", "0.2"))  # seconds between batches, leaves LM Studio to live checks
+SWAP_ATTEMPTS = 10
+
+
+class ReembedJob:
+    """
+    Re-embeds the whole prompt library with another model without taking it offline.
+
+    New vectors go to the prompts.embedding_next shadow column in throttled batches
+    (`batch_size` prompts, then `pause` seconds) while checks keep searching the old
+    column. Once every prompt has a new vector, the ANN index is built on the shadow
+    column concurrently and DBManager.swap_reembedding swaps column and index in one
+    short transaction. Progress is kept in the shadow column, so a restarted job for
+    the same model resumes instead of starting over.
+    """
+    def __init__(self, base_url, model_name=None, batch_size=None, pause=None):
+        self.base_url = base_url
+        self.model_name = model_name
+        self.batch_size = batch_size or REEMBED_BATCH_SIZE
+        self.pause = pause if pause is not None else REEMBED_PAUSE
+        self.status = "pending"  # pending -> embedding -> indexing -> swapping [-> quantizing] -> done | error | cancelled
+        self.dimensions = None
+        self.total = 0
+        self.done = 0
+        self.processed = 0  # embedded by this run (excludes rows resumed from an earlier run)
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self._task = None
+
+    async def _call(self, method, *args):
+        # A pooled connection per step: the job runs for hours and must not pin one.
+        db = AsyncDBManager(await asyncio.to_thread(DBManager, pooled=True))
+        try:
+            return await getattr(db, method)(*args)
+        finally:
+            await db.close()
+
+    async def _embed(self, rows):
+        embeddings = await get_embeddings_async([text for _, text in rows], self.base_url, self.model_name, self.batch_size)
+        await self._call("save_reembedded", [(pid, emb) for (pid, _), emb in zip(rows, embeddings)])
+        self.processed += len(rows)
+        self.done += len(rows)
+        # Prompts saved since the job started are embedded too.
+        self.total = max(self.total, self.done)
+
+    async def run(self):
+        self.started_at = time.time()
+        try:
+            self.model_name = self.model_name or await resolve_model_async(self.base_url, "embedding")
+            probe = await get_embeddings_async(["dimension probe"], self.base_url, self.model_name)
+            self.dimensions = len(probe[0])
+            counts = await self._call("prepare_reembedding", self.dimensions, self.model_name)
+            self.total, self.done = counts["total"], counts["done"]
+
+            self.status = "embedding"
+            after_id = 0
+            while rows := await self._call("next_reembedding_batch", after_id, self.batch_size):
+                await self._embed(rows)
+                # Prompts saved meanwhile get higher ids and are picked up by later batches.
+                after_id = rows[-1][0]
+                await asyncio.sleep(self.pause)
+
+            self.status = "indexing"
+            await self._call("build_reembedding_index")
+
+            self.status = "swapping"
+            for _ in range(SWAP_ATTEMPTS):
+                try:
+                    stragglers = await self._call("swap_reembedding", self.batch_size)
+                except psycopg2.errors.LockNotAvailable:
+                    await asyncio.sleep(1)
+                    continue
+                if not stragglers:
+                    break
+                await self._embed(stragglers)
+            else:
+                raise RuntimeError("Could not swap in the new embeddings; prompts kept arriving or the table stayed locked.")
+            if VECTOR_QUANTIZATION != "none":
+                # The swap drops the compact column of the old embeddings; searches use the
+                # full vectors until it is rebuilt.
+                self.status = "quantizing"
+                await self._call("ensure_quantization")
+            self.status = "done"
+        except asyncio.CancelledError:
+            self.status = "cancelled"
+            raise
+        except Exception as e:
+            self.status = "error"
+            self.error = str(e)
+        finally:
+            self.finished_at = time.time()
+
+    def start(self):
+        # The task inherits the priority, so its LM Studio calls queue behind interactive checks.
+        with priority("background"):
+            self._task = asyncio.create_task(self.run())
+        return self
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def stop(self):
+        """Stops the job but keeps the shadow column, so a new job for the same model resumes it."""
+        if self.running:
+            self._task.cancel()
+
+    async def cancel(self):
+        """Stops the job and drops the shadow column; the live embeddings are untouched."""
+        if self.running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self.status != "done":
+            await self._call("abort_reembedding")
+            self.status = "cancelled"
+
+    def to_dict(self):
+        elapsed = (self.finished_at or time.time()) - self.started_at if self.started_at else 0.0
+        rate = self.processed / elapsed if elapsed > 0 else 0.0
+        remaining = max(0, self.total - self.done)
+        return {
+            "status": self.status,
+            "model": self.model_name,
+            "dimensions": self.dimensions,
+            "total": self.total,
+            "done": self.done,
+            "percent": round(100.0 * self.done / self.total, 1) if self.total else (100.0 if self.status == "done" else 0.0),
+            "rate_per_sec": round(rate, 1),
+            "eta_seconds": round(remaining / rate) if rate and self.status == "embedding" else None,
+            "elapsed_seconds": round(elapsed, 1),
+            "error": self.error,
+        }
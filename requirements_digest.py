@@ -0,0 +1,134 @@
+import hashlib
+import math
+import os
+import re
+from collections import Counter
+
+import numpy as np
+
+from lexical import normalize_prompt
+
+# Requirements above the budget are compiled into chunks; a check then inlines only the
+# chunks most similar to the prompt, up to the budget.
+REQUIREMENTS_TOKEN_BUDGET = int(os.getenv("REQUIREMENTS_TOKEN_BUDGET", "1500"))
+REQUIREMENTS_CHUNK_TOKENS = int(os.getenv("REQUIREMENTS_CHUNK_TOKENS", "200"))
+
+_BULLET = re.compile(r"^(?:[-*•▪◦]|\(?\d+(?:\.\d+)*[.)]|\(?[a-zA-Z][.)])\s+")
+_SENTENCE_END = re.compile(r"(?<=[.!?;])\s+")
+# Short lines repeated this often are usually page headers/footers left over from PDF extraction.
+_BOILERPLATE_REPEATS = 3
+_BOILERPLATE_MAX_CHARS = 120
+
+
+def count_tokens(text):
+    """Approximate token count (~4 characters per token for English text with BPE tokenizers)."""
+    return _tokens_for_chars(len(text or ""))
+
+
+def _tokens_for_chars(chars):
+    return math.ceil(chars / 4)
+
+
+def requirements_hash(requirements):
+    return hashlib.sha256((requirements or "").encode("utf-8")).hexdigest()
+
+
+def _units(text):
+    """Paragraphs and list items; short lines that keep repeating (page headers/footers) are kept once."""
+    lines = [line.strip() for line in text.splitlines()]
+    repeats = Counter(normalize_prompt(line).casefold() for line in lines if line)
+    kept = set()
+    units, current = [], []
+
+    def flush():
+        if current:
+            units.append(" ".join(current))
+            current.clear()
+
+    for line in lines:
+        if not line:
+            flush()
+            continue
+        key = normalize_prompt(line).casefold()
+        if repeats[key] >= _BOILERPLATE_REPEATS and len(line) <= _BOILERPLATE_MAX_CHARS:
+            if key in kept:
+                continue
+            kept.add(key)
+        if _BULLET.match(line):
+            flush()
+        current.append(line)
+    flush()
+    return units
+
+
+def _split_long(unit, max_tokens):
+    """Breaks a unit over the chunk budget at sentence boundaries, then at word boundaries."""
+    if count_tokens(unit) <= max_tokens:
+        return [unit]
+    pieces = []
+    for sentence in _SENTENCE_END.split(unit):
+        if count_tokens(sentence) <= max_tokens:
+            pieces.append(sentence)
+            continue
+        current, length = [], 0
+        for word in sentence.split():
+            if current and _tokens_for_chars(length + 1 + len(word)) > max_tokens:
+                pieces.append(" ".join(current))
+                current, length = [], 0
+            current.append(word)
+            length += len(word) + (1 if length else 0)
+        if current:
+            pieces.append(" ".join(current))
+    return pieces
+
+
+def compile_chunks(requirements, max_tokens=None):
+    """
+    Splits requirements into deduplicated chunks of at most `max_tokens` tokens.
+
+    Paragraphs and list items are kept whole where possible and packed together in
+    document order; exact duplicates (after whitespace/case normalization) are
+    dropped and repeated page headers/footers kept once. Returns a list of chunk strings.
+    """
+    max_tokens = max_tokens or REQUIREMENTS_CHUNK_TOKENS
+    seen = set()
+    pieces = []
+    for unit in _units(requirements or ""):
+        for piece in _split_long(unit, max_tokens):
+            key = normalize_prompt(piece).casefold()
+            if key and key not in seen:
+                seen.add(key)
+                pieces.append(piece)
+
+    chunks, current = [], []
+    for piece in pieces:
+        if current and count_tokens("\n".join(current + [piece])) > max_tokens:
+            chunks.append("\n".join(current))
+            current = []
+        current.append(piece)
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def select_chunks(chunks, embeddings, prompt_embedding, budget=None):
+    """
+    Picks the chunks most similar to the prompt until `budget` tokens are used.
+
+    `chunks` is a list of (text, tokens) pairs aligned with `embeddings`. The best
+    match is always included. Returns the chosen indices in document order.
+    """
+    budget = budget or REQUIREMENTS_TOKEN_BUDGET
+    vectors = np.array(embeddings, dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    query = np.array(prompt_embedding, dtype=np.float32)
+    query /= max(float(np.linalg.norm(query)), 1e-12)
+
+    chosen, used = [], 0
+    for i in np.argsort(-(vectors @ query)):
+        tokens = chunks[i][1]
+        if chosen and used + tokens > budget:
+            continue
+        chosen.append(int(i))
+        used += tokens
+    return sorted(chosen)
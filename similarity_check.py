@@ -1,102 +1,773 @@
 import argparse
-import requests
+import asyncio
+import hashlib
 import json
+import os
+import re
 import sys
-from db_manager import DBManager
+import logging
+import time
+import numpy as np
+import metrics
+from analysis_cache import analysis_cache
+from caching import SingleFlight, TTLCache
+from db_manager import DBManager, AsyncDBManager
+from embedding_cache import embedding_cache
+from lm_client import get_client, aclose_clients
+from lm_scheduler import QueueFull
+from requirements_digest import REQUIREMENTS_TOKEN_BUDGET, compile_chunks, count_tokens, requirements_hash, select_chunks
+
+logger = logging.getLogger(__name__)
 
 LM_STUDIO_DEFAULT_URL = "http://localhost:1234/v1"
 
+SYSTEM_PROMPT = (
+    "You are a Quality Assurance assistant. Compare the user's prompt against the project requirements and focus areas. "
+    "Every response MUST follow this structured format exactly:\n\n"
+    "STATUS: [PASSED or ISSUES FOUND]\n"
+    "SUMMARY: [Concise summary of alignment with requirements]\n"
+    "WORKFLOW: [Step-by-step breakdown of the possible actions/logic in the prompt]\n"
+    "ISSUES: [Brief bulleted list of specific conflicts or missing elements, IF status is ISSUES FOUND]\n\n"
+    "Be extremely concise and avoid any introductory or concluding text."
+)
+# Part of every analysis cache key, so editing SYSTEM_PROMPT retires previously cached analyses.
+SYSTEM_PROMPT_VERSION = hashlib.sha256(SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+def pick_embedding_model(models):
+    """Embedding model ID to use from a /models listing (also how the LM backend pool picks its reference)."""
+    # Prefer models with 'embed' in the name
+    embedding_models = [m['id'] for m in models if 'embed' in m['id'].lower()]
+    if embedding_models:
+        return embedding_models[0]
+    elif models:
+        return models[0]['id']
+    raise RuntimeError("No models found in LM Studio.")
+
+def pick_chat_model(models):
+    # For simplicity, we'll try to use the same model as embedding OR a chat model
+    # But usually you need a chat/instruct model for analysis. 
+    # LM Studio often lists chat models in /models too.
+    chat_models = [m['id'] for m in models if 'embed' not in m['id'].lower()]
+    if chat_models:
+        return chat_models[0]
+    return models[0]['id']
+
+def _analysis_payload(prompt, requirements, model_name, project_focus=None):
+    requirements_text = f"CORE REQUIREMENTS:\n{requirements}"
+    if project_focus:
+        requirements_text += f"\n\nPROJECT FOCUS AREAS:\n{project_focus}"
+        
+    user_message = f"{requirements_text}\n\nUSER PROMPT TO CHECK:\n{prompt}\n\nIssues found (if any):"
+    
+    return {
+        "model": model_name,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": user_message}
+        ],
+        "temperature": 0.0
+    }
+
+def _analysis_error(status_code, error_body):
+    if "context length" in error_body.lower() or "tokens to keep" in error_body.lower():
+        return (
+            "Requirement analysis error: Context limit exceeded. \n"
+            "Tip: Increase 'Context Length (n_ctx)' in LM Studio settings (e.g., to 8192 or 16384) "
+            "or use a high-context model like 'Phi-3-mini-128k-instruct'."
+        )
+    return f"Requirement analysis error: {status_code} - {error_body}"
+
+def parse_analysis(text):
+    """Splits a structured analysis into its STATUS / SUMMARY / WORKFLOW / ISSUES sections."""
+    text = text or ""
+    def section(pattern):
+        match = re.search(pattern, text, re.IGNORECASE)
+        return match.group(1).strip() if match else ""
+    return {
+        "status": "PASSED" if "STATUS: PASSED" in text else "CONFLICTS",
+        "summary": section(r"SUMMARY:\s*([\s\S]*?)(?=WORKFLOW:|$)"),
+        "workflow": section(r"WORKFLOW:\s*([\s\S]*?)(?=ISSUES:|$)"),
+        "issues": section(r"ISSUES:\s*([\s\S]*?)$"),
+    }
+
+# Model listings per base URL, so checks skip the /models round-trips.
+_model_cache = TTLCache(maxsize=64, ttl=float(os.getenv("LM_MODEL_CACHE_TTL", "300")))
+
+_PICKERS = {"embedding": pick_embedding_model, "chat": pick_chat_model}
+
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+
+def _models_from_response(response):
+    response.raise_for_status()
+    return response.json().get('data', [])
+
+def _is_model_not_found(response):
+    if response.status_code < 400:
+        return False
+    body = response.text.lower()
+    return response.status_code == 404 or ("model" in body and "not found" in body)
+
+def resolve_model(base_url, kind, refresh=False):
+    """Returns the model ID to use for `kind` ('embedding' or 'chat') at `base_url`, via the TTL cache."""
+    key = base_url.rstrip("/")
+    models = None if refresh else _model_cache.get(key)
+    if models is None:
+        models = _models_from_response(get_client(base_url).get("/models"))
+        if models:
+            _model_cache.set(key, models)
+    return _PICKERS[kind](models)
+
+async def resolve_model_async(base_url, kind, refresh=False):
+    key = base_url.rstrip("/")
+    models = None if refresh else _model_cache.get(key)
+    if models is None:
+        models = _models_from_response(await get_client(base_url).aget("/models"))
+        if models:
+            _model_cache.set(key, models)
+    return _PICKERS[kind](models)
+
+def invalidate_models(base_url=None):
+    """Drops cached model listings for `base_url`, or for every URL when omitted. Returns the number dropped."""
+    if base_url is None:
+        return _model_cache.clear()
+    return 0 if _model_cache.pop(base_url.rstrip("/")) is None else 1
+
+def cached_models():
+    return [
+        {"url": url, "models": [m['id'] for m in models]}
+        for url, models in _model_cache.items()
+    ]
+
+async def warm_model_cache(base_url):
+    """Fetches the model listing up front so the first check does not pay for discovery."""
+    await resolve_model_async(base_url, "embedding", refresh=True)
+
 def get_embedding(prompt, base_url, model_name=None):
-    if not model_name:
+    client = get_client(base_url)
+    auto_model = not model_name
+    if auto_model:
         # Try to find an embedding model
         try:
-            models_resp = requests.get(f"{base_url}/models")
-            models_resp.raise_for_status()
-            models = models_resp.json().get('data', [])
-            # Prefer models with 'embed' in the name
-            embedding_models = [m['id'] for m in models if 'embed' in m['id'].lower()]
-            if embedding_models:
-                model_name = embedding_models[0]
-            elif models:
-                model_name = models[0]['id']
-            else:
-                raise RuntimeError("No models found in LM Studio.")
+            model_name = resolve_model(base_url, "embedding")
         except Exception as e:
             raise RuntimeError(f"Error fetching models from LM Studio: {e}")
 
-    url = f"{base_url}/embeddings"
-    payload = {
-        "input": prompt,
-        "model": model_name
-    }
+    cache_key = embedding_cache.key(prompt, model_name, base_url)
+    cached = embedding_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
     try:
-        response = requests.post(url, json=payload)
+        response = client.post("/embeddings", json={"input": prompt, "model": model_name})
+        if auto_model and _is_model_not_found(response):
+            # The cached model was unloaded since discovery; look it up again once.
+            model_name = resolve_model(base_url, "embedding", refresh=True)
+            cache_key = embedding_cache.key(prompt, model_name, base_url)
+            response = client.post("/embeddings", json={"input": prompt, "model": model_name})
         response.raise_for_status()
         data = response.json()
-        return data['data'][0]['embedding']
+        embedding = data['data'][0]['embedding']
     except Exception as e:
         raise RuntimeError(f"Error getting embedding from LM Studio (Model: {model_name}): {e}")
+    embedding_cache.put(cache_key, model_name, embedding)
+    return embedding
+
+def get_embeddings(prompts, base_url, model_name=None, batch_size=None):
+    """Blocking counterpart of get_embeddings_async, for CLI tools and worker threads."""
+    batch_size = batch_size or EMBEDDING_BATCH_SIZE
+    client = get_client(base_url)
+    auto_model = not model_name
+    if auto_model:
+        try:
+            model_name = resolve_model(base_url, "embedding")
+        except Exception as e:
+            raise RuntimeError(f"Error fetching models from LM Studio: {e}")
+
+    embeddings = [embedding_cache.get(embedding_cache.key(p, model_name, base_url)) for p in prompts]
+    missing = [i for i, e in enumerate(embeddings) if e is None]
 
-def analyze_requirements(prompt, requirements, base_url, model_name=None, project_focus=None):
+    for start in range(0, len(missing), batch_size):
+        chunk = missing[start:start + batch_size]
+        payload = {"input": [prompts[i] for i in chunk], "model": model_name}
+        try:
+            response = client.post("/embeddings", json=payload)
+            if auto_model and _is_model_not_found(response):
+                model_name = resolve_model(base_url, "embedding", refresh=True)
+                payload["model"] = model_name
+                response = client.post("/embeddings", json=payload)
+            response.raise_for_status()
+            data = sorted(response.json()['data'], key=lambda item: item.get('index', 0))
+        except Exception as e:
+            raise RuntimeError(f"Error getting embedding from LM Studio (Model: {model_name}): {e}")
+        if len(data) != len(chunk):
+            raise RuntimeError(f"LM Studio returned {len(data)} embeddings for {len(chunk)} inputs (Model: {model_name}).")
+        for i, item in zip(chunk, data):
+            embeddings[i] = item['embedding']
+            embedding_cache.put(embedding_cache.key(prompts[i], model_name, base_url), model_name, embeddings[i])
+    return embeddings
+
+def analyze_requirements(prompt, requirements, base_url, model_name=None, project_focus=None,
+                         project="", cache_info=None):
+    """
+    Checks `prompt` against the project requirements with a chat completion.
+
+    Successful analyses are cached per (prompt, requirements, focus, model, system
+    prompt version); `project` tags the entry for invalidation. If `cache_info` is a
+    dict, its "cached" key reports whether the result came from the cache.
+    """
     if not requirements or requirements.strip() == "":
         return None
     
-    if not model_name:
-        # For simplicity, we'll try to use the same model as embedding OR a chat model
-        # But usually you need a chat/instruct model for analysis. 
-        # LM Studio often lists chat models in /models too.
+    client = get_client(base_url)
+    auto_model = not model_name
+    if auto_model:
         try:
-            models_resp = requests.get(f"{base_url}/models")
-            models = models_resp.json().get('data', [])
-            chat_models = [m['id'] for m in models if 'embed' not in m['id'].lower()]
-            if chat_models:
-                model_name = chat_models[0]
-            else:
-                model_name = models[0]['id']
-        except:
+            model_name = resolve_model(base_url, "chat")
+        except Exception:
             return "Internal Error: Could not fetch models for requirement analysis."
 
-    url = f"{base_url}/chat/completions"
-    system_prompt = (
-        "You are a Quality Assurance assistant. Compare the user's prompt against the project requirements and focus areas. "
-        "Every response MUST follow this structured format exactly:\n\n"
-        "STATUS: [PASSED or ISSUES FOUND]\n"
-        "SUMMARY: [Concise summary of alignment with requirements]\n"
-        "WORKFLOW: [Step-by-step breakdown of the possible actions/logic in the prompt]\n"
-        "ISSUES: [Brief bulleted list of specific conflicts or missing elements, IF status is ISSUES FOUND]\n\n"
-        "Be extremely concise and avoid any introductory or concluding text."
-    )
-    
-    requirements_text = f"CORE REQUIREMENTS:\n{requirements}"
-    if project_focus:
-        requirements_text += f"\n\nPROJECT FOCUS AREAS:\n{project_focus}"
-        
-    user_message = f"{requirements_text}\n\nUSER PROMPT TO CHECK:\n{prompt}\n\nIssues found (if any):"
-    
-    payload = {
-        "model": model_name,
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_message}
-        ],
-        "temperature": 0.0
-    }
-    
+    cache_key = analysis_cache.key(prompt, requirements, project_focus, model_name, SYSTEM_PROMPT_VERSION)
+    cached = analysis_cache.get(cache_key)
+    if cache_info is not None:
+        cache_info["cached"] = cached is not None
+    if cached is not None:
+        return cached
+
     try:
-        response = requests.post(url, json=payload)
+        response = client.post("/chat/completions", json=_analysis_payload(prompt, requirements, model_name, project_focus))
+        if auto_model and _is_model_not_found(response):
+            model_name = resolve_model(base_url, "chat", refresh=True)
+            cache_key = analysis_cache.key(prompt, requirements, project_focus, model_name, SYSTEM_PROMPT_VERSION)
+            response = client.post("/chat/completions", json=_analysis_payload(prompt, requirements, model_name, project_focus))
         if response.status_code != 200:
-            error_body = response.text
-            if "context length" in error_body.lower() or "tokens to keep" in error_body.lower():
-                return (
-                    "Requirement analysis error: Context limit exceeded. \n"
-                    "Tip: Increase 'Context Length (n_ctx)' in LM Studio settings (e.g., to 8192 or 16384) "
-                    "or use a high-context model like 'Phi-3-mini-128k-instruct'."
-                )
-            return f"Requirement analysis error: {response.status_code} - {error_body}"
+            return _analysis_error(response.status_code, response.text)
         data = response.json()
-        return data['choices'][0]['message']['content']
+        analysis = data['choices'][0]['message']['content']
     except Exception as e:
         return f"Requirement analysis error (Exception): {e}"
+    analysis_cache.put(cache_key, project, model_name, analysis)
+    return analysis
+
+embedding_flight = SingleFlight()
+
+async def get_embedding_async(prompt, base_url, model_name=None):
+    """Non-blocking counterpart of get_embedding for use inside the web app."""
+    client = get_client(base_url)
+    auto_model = not model_name
+    if auto_model:
+        try:
+            model_name = await resolve_model_async(base_url, "embedding")
+        except Exception as e:
+            raise RuntimeError(f"Error fetching models from LM Studio: {e}")
+
+    cache_key = embedding_cache.key(prompt, model_name, base_url)
+    cached = await embedding_cache.aget(cache_key)
+    if cached is not None:
+        return cached
+
+    async def fetch():
+        model, key = model_name, cache_key
+        try:
+            response = await client.apost("/embeddings", json={"input": prompt, "model": model})
+            if auto_model and _is_model_not_found(response):
+                model = await resolve_model_async(base_url, "embedding", refresh=True)
+                key = embedding_cache.key(prompt, model, base_url)
+                response = await client.apost("/embeddings", json={"input": prompt, "model": model})
+            response.raise_for_status()
+            embedding = response.json()['data'][0]['embedding']
+        except QueueFull:
+            raise
+        except Exception as e:
+            raise RuntimeError(f"Error getting embedding from LM Studio (Model: {model}): {e}")
+        await embedding_cache.aput(key, model, embedding)
+        return embedding
+
+    # Identical prompts embedded concurrently (by any endpoint) share one LM Studio call.
+    embedding, shared = await embedding_flight.run(cache_key, fetch)
+    if shared:
+        metrics.COALESCED_CALLS.inc(operation="embedding")
+    return embedding
+
+async def get_embeddings_async(prompts, base_url, model_name=None, batch_size=None):
+    """
+    Embeds many prompts, sending cache misses to LM Studio as array `input` requests of up to
+    `batch_size` texts (EMBEDDING_BATCH_SIZE by default). Returns embeddings in input order.
+    """
+    batch_size = batch_size or EMBEDDING_BATCH_SIZE
+    client = get_client(base_url)
+    auto_model = not model_name
+    if auto_model:
+        try:
+            model_name = await resolve_model_async(base_url, "embedding")
+        except Exception as e:
+            raise RuntimeError(f"Error fetching models from LM Studio: {e}")
+
+    embeddings = [None] * len(prompts)
+    missing = []
+    for i, prompt in enumerate(prompts):
+        embeddings[i] = await embedding_cache.aget(embedding_cache.key(prompt, model_name, base_url))
+        if embeddings[i] is None:
+            missing.append(i)
+
+    for start in range(0, len(missing), batch_size):
+        chunk = missing[start:start + batch_size]
+        payload = {"input": [prompts[i] for i in chunk], "model": model_name}
+        try:
+            response = await client.apost("/embeddings", json=payload)
+            if auto_model and _is_model_not_found(response):
+                model_name = await resolve_model_async(base_url, "embedding", refresh=True)
+                payload["model"] = model_name
+                response = await client.apost("/embeddings", json=payload)
+            response.raise_for_status()
+            # The OpenAI format tags each vector with the position of its input.
+            data = sorted(response.json()['data'], key=lambda item: item.get('index', 0))
+        except QueueFull:
+            raise
+        except Exception as e:
+            raise RuntimeError(f"Error getting embedding from LM Studio (Model: {model_name}): {e}")
+        if len(data) != len(chunk):
+            raise RuntimeError(f"LM Studio returned {len(data)} embeddings for {len(chunk)} inputs (Model: {model_name}).")
+        for i, item in zip(chunk, data):
+            embeddings[i] = item['embedding']
+            await embedding_cache.aput(embedding_cache.key(prompts[i], model_name, base_url), model_name, embeddings[i])
+    return embeddings
+
+async def analyze_requirements_async(prompt, requirements, base_url, model_name=None, project_focus=None,
+                                     project="", cache_info=None):
+    """Non-blocking counterpart of analyze_requirements for use inside the web app."""
+    if not requirements or requirements.strip() == "":
+        return None
+
+    client = get_client(base_url)
+    auto_model = not model_name
+    if auto_model:
+        try:
+            model_name = await resolve_model_async(base_url, "chat")
+        except Exception:
+            return "Internal Error: Could not fetch models for requirement analysis."
+
+    cache_key = analysis_cache.key(prompt, requirements, project_focus, model_name, SYSTEM_PROMPT_VERSION)
+    cached = await analysis_cache.aget(cache_key)
+    if cache_info is not None:
+        cache_info["cached"] = cached is not None
+    if cached is not None:
+        return cached
+
+    try:
+        response = await client.apost("/chat/completions", json=_analysis_payload(prompt, requirements, model_name, project_focus))
+        if auto_model and _is_model_not_found(response):
+            model_name = await resolve_model_async(base_url, "chat", refresh=True)
+            cache_key = analysis_cache.key(prompt, requirements, project_focus, model_name, SYSTEM_PROMPT_VERSION)
+            response = await client.apost("/chat/completions", json=_analysis_payload(prompt, requirements, model_name, project_focus))
+        if response.status_code != 200:
+            return _analysis_error(response.status_code, response.text)
+        analysis = response.json()['choices'][0]['message']['content']
+    except QueueFull:
+        raise  # answered with 429 rather than reported as the analysis
+    except Exception as e:
+        return f"Requirement analysis error (Exception): {e}"
+    await analysis_cache.aput(cache_key, project, model_name, analysis)
+    return analysis
+
+async def analyze_requirements_stream_async(prompt, requirements, base_url, model_name=None, project_focus=None,
+                                            project="", cache_info=None):
+    """
+    Streaming counterpart of analyze_requirements_async: yields the analysis text in
+    chunks as LM Studio generates it (`stream: true`). A cached analysis is yielded
+    as a single chunk; errors are yielded as the analysis text, as in the other variants.
+    """
+    if not requirements or requirements.strip() == "":
+        return
+
+    client = get_client(base_url)
+    auto_model = not model_name
+    if auto_model:
+        try:
+            model_name = await resolve_model_async(base_url, "chat")
+        except Exception:
+            yield "Internal Error: Could not fetch models for requirement analysis."
+            return
+
+    cache_key = analysis_cache.key(prompt, requirements, project_focus, model_name, SYSTEM_PROMPT_VERSION)
+    cached = await analysis_cache.aget(cache_key)
+    if cache_info is not None:
+        cache_info["cached"] = cached is not None
+    if cached is not None:
+        yield cached
+        return
+
+    parts = []
+    try:
+        for attempt in range(2):
+            payload = {**_analysis_payload(prompt, requirements, model_name, project_focus), "stream": True}
+            async with client.astream("POST", "/chat/completions", json=payload) as response:
+                if response.status_code != 200:
+                    await response.aread()
+                    if attempt == 0 and auto_model and _is_model_not_found(response):
+                        model_name = await resolve_model_async(base_url, "chat", refresh=True)
+                        cache_key = analysis_cache.key(prompt, requirements, project_focus, model_name, SYSTEM_PROMPT_VERSION)
+                        continue
+                    yield _analysis_error(response.status_code, response.text)
+                    return
+                # OpenAI-style SSE: "data: {...}" lines carrying choices[0].delta.content, then "data: [DONE]".
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = json.loads(data)['choices'][0].get('delta', {}).get('content')
+                    if chunk:
+                        parts.append(chunk)
+                        yield chunk
+            break
+    except QueueFull:
+        raise
+    except Exception as e:
+        yield f"Requirement analysis error (Exception): {e}"
+        return
+    await analysis_cache.aput(cache_key, project, model_name, "".join(parts))
+
+async def compile_requirements_async(db, project_id, requirements, base_url, model_name=None):
+    """
+    Compiles a project's requirements into embedded chunks and stores them.
+
+    Returns the stored chunks as dicts shaped like DBManager.get_requirement_chunks rows.
+    """
+    model_name = model_name or await resolve_model_async(base_url, "embedding")
+    texts = compile_chunks(requirements)
+    embeddings = await get_embeddings_async(texts, base_url, model_name) if texts else []
+    chunks = [(text, count_tokens(text), emb) for text, emb in zip(texts, embeddings)]
+    digest = requirements_hash(requirements)
+    await db.save_requirement_chunks(project_id, digest, model_name, chunks)
+    return [
+        {"position": i, "chunk_text": text, "tokens": tokens, "embedding": emb,
+         "model": model_name, "requirements_hash": digest}
+        for i, (text, tokens, emb) in enumerate(chunks)
+    ]
+
+async def load_requirements_digest(db, env_data, base_url, model_name=None):
+    """
+    Compiled chunks for the environment's project, or None when the requirements fit the budget.
+
+    Missing or stale chunks (requirements edited, different embedding model) are
+    recompiled on the spot. If compiling fails the check falls back to the full text.
+    """
+    requirements = env_data['requirements']
+    if count_tokens(requirements) <= REQUIREMENTS_TOKEN_BUDGET:
+        return None
+    try:
+        model = model_name or await resolve_model_async(base_url, "embedding")
+        chunks = await db.get_requirement_chunks(env_data['project_id'])
+        if not chunks or chunks[0]['requirements_hash'] != requirements_hash(requirements) or chunks[0]['model'] != model:
+            chunks = await compile_requirements_async(db, env_data['project_id'], requirements, base_url, model)
+        return chunks or None
+    except Exception as e:
+        logger.warning("Requirements digest unavailable for project '%s', using full text: %s", env_data['project_name'], e)
+        return None
+
+def select_requirements(env_data, digest, prompt_embedding):
+    """
+    (requirements text to inline, token report) for one prompt.
+
+    With a digest, only the chunks most similar to the prompt are inlined, up to
+    REQUIREMENTS_TOKEN_BUDGET tokens; otherwise the full requirements are used.
+    """
+    requirements = env_data['requirements']
+    full = count_tokens(requirements)
+    if not digest or prompt_embedding is None or len(digest[0]['embedding']) != len(prompt_embedding):
+        return requirements, {"full": full, "selected": full}
+    chosen = select_chunks([(c['chunk_text'], c['tokens']) for c in digest], [c['embedding'] for c in digest], prompt_embedding)
+    text = "\n\n".join(digest[i]['chunk_text'] for i in chosen)
+    return text, {
+        "full": full,
+        "compiled": sum(c['tokens'] for c in digest),
+        "selected": count_tokens(text),
+        "chunks": len(chosen),
+        "total_chunks": len(digest),
+    }
+
+async def _requirements_for_prompt(db, env_data, base_url, model_name, embedding_task):
+    """Loads the digest while the prompt embedding is computed, then selects chunks with it."""
+    digest = await load_requirements_digest(db, env_data, base_url, model_name)
+    return select_requirements(env_data, digest, await embedding_task if digest else None)
+
+async def run_check_pipeline(db, env_data, prompt, base_url, model_name=None, threshold=0.85, lexical=True):
+    """
+    Runs the compliance analysis concurrently with embedding + similarity search.
+
+    `db` is an AsyncDBManager. The vector search starts as soon as the embedding
+    arrives, so total latency is roughly the slower of the two branches rather than
+    the sum of all stages. Returns the stage results plus per-stage `timings` in ms.
+
+    With `lexical`, a verbatim or near-verbatim match found by the lexical tier is
+    returned straight away (`lexical_match` set, no analysis and no embedding)
+    without calling the model at all.
+
+    Requirements longer than REQUIREMENTS_TOKEN_BUDGET are narrowed to the compiled
+    chunks closest to the prompt embedding; `requirements_tokens` reports the sizes.
+    """
+    timings = {}
+    start = time.perf_counter()
+
+    if lexical:
+        matches = await db.find_lexical_matches(env_data['id'], prompt)
+        timings["lexical"] = round((time.perf_counter() - start) * 1000, 1)
+        if matches:
+            timings["total"] = timings["lexical"]
+            metrics.observe_stages(timings)
+            return {
+                "requirement_analysis": None,
+                "embedding": None,
+                "similar_prompts": matches,
+                "lexical_match": matches[0]["match"],
+                "analysis_cached": False,
+                "requirements_tokens": None,
+                "timings": timings,
+            }
+
+    async def timed(stage, awaitable):
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            timings[stage] = round((time.perf_counter() - start) * 1000, 1)
+
+    embedding_task = asyncio.create_task(timed("embedding", get_embedding_async(prompt, base_url, model_name)))
+
+    async def search():
+        embedding = await embedding_task
+        similar = await timed("similarity_search", db.find_similar(env_data['id'], embedding, threshold=threshold))
+        return embedding, similar
+
+    analysis_info = {}
+    requirements_tokens = {}
+
+    async def analysis():
+        requirements, tokens = await _requirements_for_prompt(db, env_data, base_url, model_name, embedding_task)
+        requirements_tokens.update(tokens)
+        return await analyze_requirements_async(
+            prompt,
+            requirements,
+            base_url,
+            model_name=model_name,
+            project_focus=env_data.get('project_focus'),
+            project=env_data['project_name'],
+            cache_info=analysis_info
+        )
+
+    analysis_task = asyncio.create_task(timed("analysis", analysis()))
+    try:
+        embedding, similar = await search()
+        analysis = await analysis_task
+    finally:
+        for task in (embedding_task, analysis_task):
+            if not task.done():
+                task.cancel()
+    timings["total"] = round((time.perf_counter() - start) * 1000, 1)
+    metrics.observe_stages(timings)
+
+    return {
+        "requirement_analysis": analysis,
+        "embedding": embedding,
+        "similar_prompts": similar,
+        "lexical_match": None,
+        "analysis_cached": analysis_info.get("cached", False),
+        "requirements_tokens": requirements_tokens,
+        "timings": timings,
+    }
+
+async def stream_check_pipeline(db, env_data, prompt, base_url, model_name=None, threshold=0.85, lexical=True):
+    """
+    Event-by-event variant of run_check_pipeline plus auto-save, for streaming responses.
+
+    Yields (event, payload) pairs as soon as each piece is known: "similarity" once the
+    vector search (and auto-save) finishes, "token" for every analysis chunk, "analysis"
+    with the parsed sections when the completion ends, and finally "done" with the
+    stage timings. A failure yields a single "error" event and ends the stream.
+    """
+    timings = {}
+    start = time.perf_counter()
+
+    def elapsed(since):
+        return round((time.perf_counter() - since) * 1000, 1)
+
+    if lexical:
+        matches = await db.find_lexical_matches(env_data['id'], prompt)
+        timings["lexical"] = elapsed(start)
+        if matches:
+            metrics.record_check_outcome(matches, matches[0]["match"], saved=False)
+            yield "similarity", {"similar_prompts": matches, "lexical_match": matches[0]["match"], "was_saved": False}
+            timings["total"] = elapsed(start)
+            metrics.observe_stages(timings)
+            yield "done", {"timings": timings}
+            return
+
+    queue = asyncio.Queue()
+
+    embedding_task = asyncio.create_task(get_embedding_async(prompt, base_url, model_name))
+
+    async def analysis():
+        stage_start = time.perf_counter()
+        requirements, requirements_tokens = await _requirements_for_prompt(db, env_data, base_url, model_name, embedding_task)
+        info = {}
+        parts = []
+        async for chunk in analyze_requirements_stream_async(
+            prompt,
+            requirements,
+            base_url,
+            model_name=model_name,
+            project_focus=env_data.get('project_focus'),
+            project=env_data['project_name'],
+            cache_info=info
+        ):
+            parts.append(chunk)
+            await queue.put(("token", {"text": chunk}))
+        timings["analysis"] = elapsed(stage_start)
+        text = "".join(parts) or None
+        await queue.put(("analysis", {
+            "requirement_analysis": text,
+            **(parse_analysis(text) if text else {}),
+            "analysis_cached": info.get("cached", False),
+            "requirements_tokens": requirements_tokens,
+        }))
+
+    async def search():
+        stage_start = time.perf_counter()
+        embedding = await embedding_task
+        timings["embedding"] = elapsed(stage_start)
+        stage_start = time.perf_counter()
+        similar = await db.find_similar(env_data['id'], embedding, threshold=threshold)
+        timings["similarity_search"] = elapsed(stage_start)
+        if not similar:
+            stage_start = time.perf_counter()
+            await db.save_prompt(env_data['id'], prompt, embedding)
+            timings["save"] = elapsed(stage_start)
+        metrics.record_check_outcome(similar, None, saved=not similar)
+        await queue.put(("similarity", {"similar_prompts": similar, "lexical_match": None, "was_saved": not similar}))
+
+    async def run(stage):
+        try:
+            await stage()
+        except QueueFull as e:
+            await queue.put(("error", {"detail": str(e), "retry_after": e.retry_after}))
+        except Exception as e:
+            await queue.put(("error", {"detail": str(e)}))
+        finally:
+            await queue.put((None, None))
+
+    tasks = [asyncio.create_task(run(analysis)), asyncio.create_task(run(search))]
+    try:
+        running = len(tasks)
+        while running:
+            event, payload = await queue.get()
+            if event is None:
+                running -= 1
+                continue
+            yield event, payload
+            if event == "error":
+                return
+        timings["total"] = elapsed(start)
+        metrics.observe_stages(timings)
+        yield "done", {"timings": timings}
+    finally:
+        # Also reached when the client disconnects mid-stream.
+        for task in tasks + [embedding_task]:
+            task.cancel()
+
+BATCH_ANALYSIS_CONCURRENCY = int(os.getenv("BATCH_ANALYSIS_CONCURRENCY", "4"))
+
+def unit_rows(embeddings):
+    """Float32 matrix of the embeddings scaled to unit length, so dot products are cosine similarities."""
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+async def run_batch_pipeline(db, env_data, prompts, base_url, model_name=None, threshold=0.85,
+                             batch_size=None, analyze=True, save=True):
+    """
+    Checks many prompts for one environment, yielding one result dict per prompt.
+
+    Prompts are processed in chunks of `batch_size`. Each chunk makes one batched
+    embedding request and one similarity round-trip. It is also compared against every
+    earlier prompt of the same submission to flag in-batch near-duplicates, and its
+    unique prompts are saved in one multi-row insert. With `analyze`, compliance
+    analyses run with bounded concurrency and results are yielded as they finish.
+    """
+    batch_size = batch_size or EMBEDDING_BATCH_SIZE
+    semaphore = asyncio.Semaphore(BATCH_ANALYSIS_CONCURRENCY)
+    seen = None  # unit vectors of every prompt processed so far
+    digest = await load_requirements_digest(db, env_data, base_url, model_name) if analyze else None
+
+    async def with_analysis(result, embedding):
+        requirements, result["requirements_tokens"] = select_requirements(env_data, digest, embedding)
+        async with semaphore:
+            result["requirement_analysis"] = await analyze_requirements_async(
+                result["prompt_text"],
+                requirements,
+                base_url,
+                model_name=model_name,
+                project_focus=env_data.get('project_focus'),
+                project=env_data['project_name']
+            )
+        return result
+
+    for start in range(0, len(prompts), batch_size):
+        texts = prompts[start:start + batch_size]
+        embeddings = await get_embeddings_async(texts, base_url, model_name, batch_size)
+        similar = await db.find_similar_batch(env_data['id'], embeddings, threshold=threshold)
+
+        vectors = unit_rows(embeddings)
+        earlier = vectors @ seen.T if seen is not None else np.empty((len(texts), 0))
+        within = vectors @ vectors.T
+        seen = vectors if seen is None else np.vstack([seen, vectors])
+
+        results = []
+        for k, text in enumerate(texts):
+            duplicates = [(j, earlier[k, j]) for j in np.flatnonzero(earlier[k] > threshold)]
+            duplicates += [(start + m, within[k, m]) for m in range(k) if within[k, m] > threshold]
+            results.append({
+                "index": start + k,
+                "prompt_text": text,
+                "similar_prompts": similar[k],
+                "batch_duplicates": [
+                    {"index": int(j), "similarity": round(float(sim), 4)}
+                    for j, sim in sorted(duplicates, key=lambda d: -d[1])
+                ],
+                "was_saved": False,
+            })
+
+        if save:
+            unique = [r for r in results if not r["similar_prompts"] and not r["batch_duplicates"]]
+            await db.save_prompts(env_data['id'], [(r["prompt_text"], embeddings[r["index"] - start]) for r in unique])
+            for r in unique:
+                r["was_saved"] = True
+        for r in results:
+            if r["batch_duplicates"] and not r["similar_prompts"]:
+                metrics.DUPLICATES_FOUND.inc(kind="batch")
+            else:
+                metrics.record_check_outcome(r["similar_prompts"], None, r["was_saved"])
+
+        if analyze:
+            tasks = [asyncio.create_task(with_analysis(r, embeddings[r["index"] - start])) for r in results]
+            try:
+                for finished in asyncio.as_completed(tasks):
+                    yield await finished
+            finally:
+                # Stop outstanding analyses if the client went away mid-stream.
+                for task in tasks:
+                    task.cancel()
+        else:
+            for r in results:
+                yield r
+
+async def _run_cli_pipeline(db, env_data, args, prompt_text):
+    try:
+        return await run_check_pipeline(AsyncDBManager(db), env_data, prompt_text, args.url, args.model, args.threshold,
+                                        lexical=not args.full_analysis)
+    finally:
+        await aclose_clients()
 
 def main():
     parser = argparse.ArgumentParser(description="Detailed Prompt Similarity Detector")
@@ -106,6 +777,7 @@ def main():
     parser.add_argument("--url", default=LM_STUDIO_DEFAULT_URL, help="LM Studio API Base URL")
     parser.add_argument("--threshold", type=float, default=0.85, help="Similarity threshold (0.0 to 1.0)")
     parser.add_argument("--model", help="Specific model name to use (embeddings and analysis)")
+    parser.add_argument("--full-analysis", action="store_true", help="Run the model analysis even for verbatim/near-verbatim duplicates")
     
     args = parser.parse_args()
 
@@ -132,10 +804,26 @@ def main():
         print(f"Error connecting to database or fetching data: {e}")
         sys.exit(1)
 
-    # 3. Requirement Analysis
-    print(f"\n[~] Analyzing prompt against requirements for project '{args.project}'...")
-    req_analysis = analyze_requirements(prompt_text, env_data['requirements'], args.url, args.model)
-    if req_analysis:
+    # 3. Requirement analysis, embedding and similarity search run concurrently
+    print(f"\n[~] Analyzing prompt against requirements for project '{args.project}' and checking for similar prompts in environment '{args.environment}'...")
+    try:
+        result = asyncio.run(_run_cli_pipeline(db, env_data, args, prompt_text))
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        db.close()
+        sys.exit(1)
+    req_analysis = result["requirement_analysis"]
+    embedding = result["embedding"]
+    similar_prompts = result["similar_prompts"]
+    print("[i] Stage timings (ms): " + ", ".join(f"{stage} {ms}" for stage, ms in result["timings"].items()))
+    tokens = result["requirements_tokens"]
+    if tokens and "chunks" in tokens:
+        print(f"[i] Requirements: {tokens['selected']} of {tokens['full']} tokens inlined "
+              f"({tokens['chunks']}/{tokens['total_chunks']} compiled chunks).")
+
+    if result["lexical_match"]:
+        print(f"[i] {result['lexical_match'].capitalize()} lexical duplicate found; model analysis skipped (use --full-analysis to run it).")
+    elif req_analysis:
         if "NO ISSUES" not in req_analysis.upper():
             print("\n[!] REQUIREMENT ISSUES DETECTED:")
             print("-" * 30)
@@ -154,14 +842,7 @@ def main():
     else:
         print("[i] No requirements defined for this project.")
 
-    # 4. Get embedding
-    print(f"\n[~] Generating embedding for prompt...")
-    embedding = get_embedding(prompt_text, args.url, args.model)
-    
-    # 5. Check for similarity
-    print(f"[~] Checking for similar prompts in environment '{args.environment}'...")
-    similar_prompts = db.find_similar(env_data['id'], embedding, threshold=args.threshold)
-
+    # 4. Report similarity results
     if similar_prompts:
         print("\n[!] WARNING: Similar prompts found in this environment:")
         similar_map = {p['id']: p for p in similar_prompts}
@@ -196,9 +877,11 @@ def main():
     else:
         print("[+] No similar prompts found in this environment.")
 
-    # 6. Save to database
+    # 5. Save to database
     print("\n[~] Saving prompt to database...")
     try:
+        if embedding is None:
+            embedding = get_embedding(prompt_text, args.url, args.model)
         db.save_prompt(env_data['id'], prompt_text, embedding)
         print("[+] Prompt saved successfully.")
     except Exception as e:
@@ -70,6 +70,7 @@ async function init() {
         await selectProject(projects[0]);
     }
     switchView('checker');
+    pollReembedding();  // resume the progress line if a job is already running
 }
 
 // --- Navigation ---
@@ -283,7 +284,7 @@ window.deleteEnvironment = async (projectName, envName) => {
 };
 
 // --- Checker Logic ---
-async function runAnalysis() {
+async function runAnalysis(fullAnalysis = false) {
     if (!currentProject || !currentEnv) {
         resultsArea.innerHTML = `
             <div class="card animated" style="padding: 32px; text-align: center; border: 1px dashed var(--border);">
@@ -301,19 +302,26 @@ async function runAnalysis() {
         return;
     }
 
-    resultsArea.innerHTML = '<div class="loading">Analyzing Prompt Quality & Similarity...</div>';
+    resultsArea.innerHTML = '';
+    // Results arrive as Server-Sent Events and fill these slots independently
+    const analysisSlot = document.createElement('div');
+    const similaritySlot = document.createElement('div');
+    analysisSlot.innerHTML = '<div class="loading">Analyzing Prompt Quality...</div>';
+    similaritySlot.innerHTML = '<div class="loading">Checking Similarity...</div>';
+    resultsArea.append(analysisSlot, similaritySlot);
     runCheckBtn.disabled = true;
     runCheckBtn.textContent = 'Analyzing...';
 
     try {
-        const response = await fetch('/api/check', {
+        const response = await fetch('/api/check/stream', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
                 project: currentProject.name,
                 environment: currentEnv,
                 prompt: prompt,
-                url: lmStudioUrlInput.value
+                url: lmStudioUrlInput.value,
+                full_analysis: fullAnalysis === true
             })
         });
 
@@ -322,13 +330,43 @@ async function runAnalysis() {
             throw new Error(errData.detail || 'Analysis failed');
         }
 
-        const data = await response.json();
-        renderResults(data);
+        let streamedText = '';
+        let liveText = null;
+        await readEvents(response, (event, data) => {
+            if (event === 'similarity') {
+                similaritySlot.innerHTML = '';
+                if (data.lexical_match) {
+                    analysisSlot.innerHTML = '';
+                    renderLexicalCard(data.lexical_match, analysisSlot);
+                }
+                renderSimilarityCard({ ...data, prompt_text: prompt }, similaritySlot);
+            } else if (event === 'token') {
+                if (!liveText) {
+                    analysisSlot.innerHTML = `
+                        <div class="result-card card animated">
+                            <div class="card-header"><h3>Requirement Compliance</h3></div>
+                            <div class="card-body" style="padding: 24px;">
+                                <p class="live-analysis" style="white-space: pre-wrap; font-size: 0.95rem; line-height: 1.6; color: var(--text-dim);"></p>
+                            </div>
+                        </div>
+                    `;
+                    liveText = analysisSlot.querySelector('.live-analysis');
+                }
+                streamedText += data.text;
+                liveText.textContent = streamedText;
+            } else if (event === 'analysis') {
+                analysisSlot.innerHTML = '';
+                renderAnalysisCards(data.requirement_analysis || "", data.analysis_cached, analysisSlot, data.requirements_tokens);
+            } else if (event === 'error') {
+                throw new Error(data.detail);
+            }
+        });
     } catch (error) {
         let errorMsg = error.message;
         let actionBtn = '';
         if (errorMsg.includes('Dimension mismatch')) {
-            actionBtn = `<button class="primary-btn sm" style="margin-top: 12px; background: #ef4444;" onclick="resetPromptDatabase()">Reset Prompt Database</button>`;
+            actionBtn = `<button class="primary-btn sm" style="margin-top: 12px;" onclick="startReembedding()">Re-embed Prompt Library</button>
+                <button class="primary-btn sm" style="margin-top: 12px; background: #ef4444;" onclick="resetPromptDatabase()">Reset Prompt Database</button>`;
         }
         resultsArea.innerHTML = `
             <div class="card animated" style="padding: 24px; color: #f87171; text-align: center;">
@@ -365,11 +403,63 @@ window.resetPromptDatabase = async () => {
     }
 };
 
-function renderResults(data) {
-    resultsArea.innerHTML = '';
+window.startReembedding = async () => {
+    if (!confirm("Re-embed every saved prompt with the current embedding model? Checks keep working with the old embeddings until the job finishes.")) return;
+    try {
+        const response = await fetch('/api/debug/reembed', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ url: lmStudioUrlInput.value })
+        });
+        const data = await response.json();
+        if (!response.ok) throw new Error(data.detail);
+        pollReembedding();
+    } catch (error) {
+        alert("Re-embedding failed to start: " + error.message);
+    }
+};
 
+async function pollReembedding() {
+    const statusLine = document.getElementById('reembed-status');
+    while (true) {
+        const job = await (await fetch('/api/debug/reembed')).json();
+        if (job.status === 'idle') return;
+        const eta = job.eta_seconds != null ? `, about ${Math.ceil(job.eta_seconds / 60)} min left` : '';
+        statusLine.textContent = `Re-embedding (${job.model || 'model'}): ${job.status}, ${job.done}/${job.total} prompts (${job.percent}%)${eta}`;
+        if (job.status === 'done' || job.status === 'error' || job.status === 'cancelled') {
+            if (job.error) statusLine.textContent += ` - ${job.error}`;
+            return;
+        }
+        await new Promise(resolve => setTimeout(resolve, 2000));
+    }
+}
+
+async function readEvents(response, onEvent) {
+    // Minimal SSE parser over fetch's ReadableStream (EventSource cannot POST a body)
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const frame = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            let event = 'message';
+            let data = '';
+            frame.split('\n').forEach(line => {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            });
+            if (data) onEvent(event, JSON.parse(data));
+        }
+    }
+}
+
+function renderAnalysisCards(analysisText, cached, target = resultsArea, requirementsTokens = null) {
     // Requirements Analysis Parsing
-    const analysisText = data.requirement_analysis || "";
     const sections = {
         status: analysisText.includes('STATUS: PASSED') ? 'PASSED' : 'CONFLICTS',
         summary: '',
@@ -394,7 +484,11 @@ function renderResults(data) {
     reqCard.innerHTML = `
         <div class="card-header" style="display: flex; justify-content: space-between; align-items: center;">
             <h3>Requirement Compliance</h3>
-            <span class="badge ${isPass ? 'success' : 'warning'}">${sections.status}</span>
+            <div style="display: flex; gap: 8px; align-items: center;">
+                ${cached ? '<span class="badge" title="Served from the analysis cache">CACHED</span>' : ''}
+                ${requirementsTokens && requirementsTokens.chunks ? `<span class="badge" title="${requirementsTokens.selected} of ${requirementsTokens.full} requirement tokens inlined">${requirementsTokens.chunks}/${requirementsTokens.total_chunks} CHUNKS</span>` : ''}
+                <span class="badge ${isPass ? 'success' : 'warning'}">${sections.status}</span>
+            </div>
         </div>
         <div class="card-body" style="padding: 24px;">
             <div style="margin-bottom: 20px;">
@@ -409,7 +503,7 @@ function renderResults(data) {
             ` : ''}
         </div>
     `;
-    resultsArea.appendChild(reqCard);
+    target.appendChild(reqCard);
 
     // Possible Workflow Card
     const workflowCard = document.createElement('div');
@@ -422,9 +516,28 @@ function renderResults(data) {
             <p style="white-space: pre-wrap; font-size: 0.95rem; line-height: 1.6; color: var(--text-dim);">${sections.workflow || "No workflow detected."}</p>
         </div>
     `;
-    resultsArea.appendChild(workflowCard);
+    target.appendChild(workflowCard);
+}
+
+function renderLexicalCard(lexicalMatch, target = resultsArea) {
+    // Verbatim / near-verbatim resubmission: the server skipped the model calls
+    const lexCard = document.createElement('div');
+    lexCard.className = 'result-card card animated';
+    lexCard.innerHTML = `
+        <div class="card-header" style="display: flex; justify-content: space-between; align-items: center;">
+            <h3>Duplicate Detected</h3>
+            <span class="badge warning">${lexicalMatch === 'exact' ? 'EXACT' : 'NEAR'} MATCH</span>
+        </div>
+        <div class="card-body" style="padding: 24px;">
+            <p style="font-size: 0.95rem; line-height: 1.6; margin-bottom: 16px;">This prompt ${lexicalMatch === 'exact' ? 'is identical to' : 'is a near-verbatim copy of'} an existing prompt in this environment, so the compliance analysis was skipped.</p>
+            <button id="full-analysis-btn" class="secondary-btn" style="padding: 4px 12px; font-size: 0.75rem;">Run Full Analysis</button>
+        </div>
+    `;
+    target.appendChild(lexCard);
+    document.getElementById('full-analysis-btn').onclick = () => runAnalysis(true);
+}
 
-    // Similarity
+function renderSimilarityCard(data, target = resultsArea) {
     const simCard = document.createElement('div');
     simCard.className = 'result-card card animated';
     const wasSaved = data.was_saved;
@@ -459,7 +572,7 @@ function renderResults(data) {
             </div>
         </div>
     `;
-    resultsArea.appendChild(simCard);
+    target.appendChild(simCard);
 
     // Attach save event if not already saved
     const saveBtn = document.getElementById('save-to-db-btn');
@@ -561,7 +674,7 @@ function setupEventListeners() {
             await fetch('/api/projects', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ name, requirements, project_focus: projectFocus || null })
+                body: JSON.stringify({ name, requirements, project_focus: projectFocus || null, url: lmStudioUrlInput.value })
             });
             projectModal.style.display = 'none';
             await fetchProjects();
@@ -593,12 +706,27 @@ function setupEventListeners() {
         if (!file) return;
         const formData = new FormData();
         formData.append('file', file);
-        importPdfBtn.textContent = 'Extracting...';
+        importPdfBtn.textContent = 'Uploading...';
         try {
-            const resp = await fetch('/api/projects/import-pdf', { method: 'POST', body: formData });
-            const res = await resp.json();
-            if (res.text) modalProjectReqs.value = res.text;
-        } catch (err) { console.error(err); }
+            const resp = await fetch('/api/projects/import-pdf/jobs', { method: 'POST', body: formData });
+            let job = await resp.json();
+            if (!resp.ok) throw new Error(job.detail);
+            // Extraction runs server-side in the background; poll for page progress.
+            while (job.status === 'queued' || job.status === 'running') {
+                importPdfBtn.textContent = job.pages_total
+                    ? `Extracting... ${job.pages_done}/${job.pages_total} pages`
+                    : 'Extracting...';
+                await new Promise(resolve => setTimeout(resolve, 500));
+                const poll = await fetch(`/api/projects/import-pdf/jobs/${job.job_id}`);
+                job = await poll.json();
+                if (!poll.ok) throw new Error(job.detail);
+            }
+            if (job.status === 'error') throw new Error(job.error);
+            if (job.text) modalProjectReqs.value = job.text;
+        } catch (err) {
+            console.error(err);
+            alert(`PDF import failed: ${err.message}`);
+        }
         finally { importPdfBtn.textContent = 'Import PDF'; pdfUpload.value = ''; }
     };
 }
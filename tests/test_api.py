@@ -8,13 +8,14 @@ client = TestClient(app)
 @pytest.fixture
 def mock_llm(mocker):
     """Mocks the LLM services in similarity_check."""
-    mocker.patch("app.get_embedding", return_value=[0.1] * 1536)
+    mocker.patch("app.get_embedding_async", return_value=[0.1] * 1536)
+    mocker.patch("similarity_check.get_embedding_async", return_value=[0.1] * 1536)
     structured_analysis = (
         "STATUS: PASSED\n"
         "SUMMARY: The prompt is excellent.\n"
         "WORKFLOW: 1. Do something.\n2. Do something else."
     )
-    mocker.patch("app.analyze_requirements", return_value=structured_analysis)
+    mocker.patch("similarity_check.analyze_requirements_async", return_value=structured_analysis)
 
 def test_get_info():
     response = client.get("/api/info")
@@ -74,3 +75,180 @@ def test_check_prompt_flow(db, mock_llm):
     assert "STATUS: PASSED" in data['requirement_analysis']
     assert "SUMMARY:" in data['requirement_analysis']
     assert "WORKFLOW:" in data['requirement_analysis']
+    assert {"analysis", "embedding", "similarity_search", "save", "total"} <= set(data['timings'])
+
+def test_check_short_circuits_lexical_duplicates(db, mocker, mock_llm):
+    db.create_project("p1", "some requirements")
+    env_id = db.create_environment("p1", "dev")
+    original = "Summarize the attached quarterly report for the finance team, highlighting revenue trends and risks."
+    db.save_prompt(env_id, original, [0.1] * 1536)
+    analyze = mocker.patch("similarity_check.analyze_requirements_async", return_value="STATUS: PASSED")
+    payload = {"project": "p1", "environment": "dev", "url": "http://localhost:1234/v1"}
+
+    data = client.post("/api/check", json={**payload, "prompt": "  " + original.upper()}).json()
+    assert data['lexical_match'] == "exact"
+    assert data['requirement_analysis'] is None
+    assert data['was_saved'] is False
+    assert data['similar_prompts'][0]['similarity'] == 1.0
+
+    data = client.post("/api/check", json={**payload, "prompt": original.replace("risks.", "risks!")}).json()
+    assert data['lexical_match'] == "near"
+    assert analyze.call_count == 0
+
+    data = client.post("/api/check", json={**payload, "prompt": original, "full_analysis": True}).json()
+    assert data['lexical_match'] is None
+    assert data['requirement_analysis'] == "STATUS: PASSED"
+    assert analyze.call_count == 1
+
+def test_check_inlines_only_relevant_requirement_chunks(db, mocker, mock_llm):
+    topics = ["billing", "privacy", "tone", "citations", "latency", "safety", "format", "language"]
+    requirements = "\n\n".join(
+        f"- The {topic} rules: " + " ".join(f"Rule {i}: every response about {topic} must follow the {topic} policy." for i in range(16))
+        for topic in topics
+    )
+    db.create_project("p1", requirements)
+    db.create_environment("p1", "dev")
+    mocker.patch("similarity_check.resolve_model_async", return_value="embed-model")
+    embed = mocker.patch("similarity_check.get_embeddings_async",
+                         side_effect=lambda texts, *a, **k: [[0.1] * 1536 for _ in texts])
+    analyze = mocker.patch("similarity_check.analyze_requirements_async", return_value="STATUS: PASSED")
+    payload = {"project": "p1", "environment": "dev", "url": "http://localhost:1234/v1"}
+
+    tokens = client.post("/api/check", json={**payload, "prompt": "Explain our billing rules."}).json()['requirements_tokens']
+    assert tokens['selected'] <= 1500 < tokens['full']
+    assert tokens['chunks'] < tokens['total_chunks']
+    assert len(analyze.call_args.args[1]) < len(requirements)
+
+    # The compiled chunks are stored, so later checks only embed the prompt.
+    client.post("/api/check", json={**payload, "prompt": "Explain our privacy rules."})
+    assert embed.call_count == 1
+    assert len(db.get_requirement_chunks(db.get_project("p1")['id'])) == tokens['total_chunks']
+
+def test_check_stream_emits_events_in_order(db, mocker):
+    db.create_project("p1", "some requirements")
+    db.create_environment("p1", "dev")
+    mocker.patch("similarity_check.get_embedding_async", return_value=[0.1] * 1536)
+
+    async def fake_stream(*args, **kwargs):
+        for chunk in ["STATUS: PASSED\n", "SUMMARY: Good.\n", "WORKFLOW: 1. Step."]:
+            yield chunk
+    mocker.patch("similarity_check.analyze_requirements_stream_async", fake_stream)
+
+    payload = {"project": "p1", "environment": "dev", "prompt": "Stream me", "url": "http://localhost:1234/v1"}
+    with client.stream("POST", "/api/check/stream", json=payload) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        frames = [f for f in response.read().decode().split("\n\n") if f]
+
+    events = [(f.split("\n")[0].removeprefix("event: "), json.loads(f.split("\n")[1].removeprefix("data: "))) for f in frames]
+    names = [name for name, _ in events]
+    assert names.count("token") == 3
+    assert names.index("analysis") > max(i for i, n in enumerate(names) if n == "token")
+    assert names[-1] == "done"
+    similarity = dict(events)["similarity"]
+    assert similarity["was_saved"] is True
+    analysis = dict(events)["analysis"]
+    assert analysis["status"] == "PASSED"
+    assert analysis["summary"] == "Good."
+    assert analysis["workflow"] == "1. Step."
+
+def test_check_batch_flags_in_batch_duplicates(db, mocker):
+    db.create_project("p1", "some requirements")
+    db.create_environment("p1", "dev")
+    base = [0.0] * 1536
+    vectors = {"alpha": base[:], "alpha again": base[:], "beta": base[:]}
+    vectors["alpha"][0] = vectors["alpha again"][0] = 1.0
+    vectors["beta"][1] = 1.0
+    mocker.patch("similarity_check.get_embeddings_async", side_effect=lambda prompts, *a, **k: [vectors[p] for p in prompts])
+
+    payload = {"project": "p1", "environment": "dev", "prompts": list(vectors), "analyze": False, "batch_size": 2}
+    response = client.post("/api/check/batch", json=payload)
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    items = {item["prompt_text"]: item for item in lines[:-1]}
+
+    assert items["alpha"]["was_saved"] is True
+    assert items["alpha again"]["batch_duplicates"][0]["index"] == 0
+    assert items["alpha again"]["was_saved"] is False
+    assert items["beta"]["was_saved"] is True
+    assert lines[-1]["summary"] == {"total": 3, "saved": 2, "similar_in_environment": 0, "duplicates_in_batch": 1}
+
+def test_check_batch_reports_database_errors_in_the_stream(db, mocker):
+    import psycopg2
+    db.create_project("p1", "some requirements")
+    db.create_environment("p1", "dev")
+    mocker.patch("similarity_check.get_embeddings_async", side_effect=lambda prompts, *a, **k: [[0.1] * 1536 for _ in prompts])
+    mocker.patch("db_manager.DBManager.find_similar_batch", side_effect=psycopg2.OperationalError("server closed the connection"))
+
+    response = client.post("/api/check/batch", json={"project": "p1", "environment": "dev", "prompts": ["a", "b"], "analyze": False})
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert response.status_code == 200
+    assert lines[-1] == {"error": "OperationalError: server closed the connection"}
+
+def test_duplicates_endpoint(db):
+    db.create_project("p1", "reqs")
+    env_id = db.create_environment("p1", "dev")
+    db.save_prompts(env_id, [("one", [1.0] + [0.0] * 1535), ("one!", [1.0] + [0.0] * 1535), ("two", [0.0, 1.0] + [0.0] * 1534)])
+
+    response = client.get("/api/projects/p1/environments/dev/duplicates", params={"threshold": 0.9})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["clusters"] == 1
+    assert data["results"][0]["keep"]["prompt_text"] == "one"
+    assert client.get("/api/projects/p1/environments/nope/duplicates").status_code == 404
+    assert client.get("/api/projects/p1/environments/dev/duplicates", params={"method": "magic"}).status_code == 400
+
+def test_concurrent_identical_checks_are_coalesced(db, mocker):
+    import asyncio
+    import httpx
+    db.create_project("p1", "reqs")
+    env_id = db.create_environment("p1", "dev")
+    calls = []
+
+    async def slow_pipeline(db, env_data, prompt, *args, **kwargs):
+        calls.append(prompt)
+        await asyncio.sleep(0.05)
+        return {"requirement_analysis": "STATUS: PASSED", "embedding": [0.1] * 1536, "similar_prompts": [],
+                "lexical_match": None, "analysis_cached": False, "requirements_tokens": {}, "timings": {}}
+    mocker.patch("app.run_check_pipeline", side_effect=slow_pipeline)
+
+    async def check_three():
+        async with httpx.AsyncClient(app=app, base_url="http://test") as ac:
+            payload = {"project": "p1", "environment": "dev", "prompt": "Same template"}
+            return await asyncio.gather(
+                ac.post("/api/check", json=payload),
+                ac.post("/api/check", json={**payload, "prompt": "Same  template "}),
+                ac.post("/api/check", json={**payload, "threshold": 0.5}),
+            )
+    responses = [r.json() for r in asyncio.run(check_three())]
+
+    # Same prompt and settings share one run; a different threshold is a separate check.
+    assert len(calls) == 2
+    assert [r["coalesced"] for r in responses] == [False, True, False]
+    assert responses[1]["prompt_text"] == "Same  template "
+    with db.conn.cursor() as cur:
+        cur.execute("SELECT count(*) FROM prompts WHERE environment_id = %s;", (env_id,))
+        assert cur.fetchone()[0] == 2
+
+def test_check_answers_429_when_lm_queue_is_full(db, mocker):
+    from lm_scheduler import QueueFull
+    db.create_project("p1", "reqs")
+    db.create_environment("p1", "dev")
+    mocker.patch("app.run_check_pipeline", side_effect=QueueFull("chat", 3))
+
+    response = client.post("/api/check", json={"project": "p1", "environment": "dev", "prompt": "Busy"})
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "3"
+    assert "chat queue is full" in response.json()["detail"]
+    queue = client.get("/api/info").json()["lm_queue"]
+    assert {"embedding", "chat"} <= queue.keys() and "wait_p95_ms" in queue["chat"]
+
+def test_reset_prompts_answers_429_when_lm_queue_is_full(db, mocker):
+    from lm_scheduler import QueueFull
+    mocker.patch("app.get_embedding_async", side_effect=QueueFull("embedding", 2))
+    reset = mocker.patch("db_manager.DBManager.reset_prompts_table")
+
+    response = client.request("DELETE", "/api/debug/reset-prompts", json={"project": "p1", "environment": "dev", "prompt": "x"})
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "2"
+    reset.assert_not_called()
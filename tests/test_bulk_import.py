@@ -0,0 +1,38 @@
+import json
+import pytest
+from bulk_import import iter_prompts, iter_batches, load_checkpoint, save_checkpoint
+
+def test_iter_prompts_sources(tmp_path):
+    (tmp_path / "prompts").mkdir()
+    (tmp_path / "prompts" / "b.txt").write_text("second\n")
+    (tmp_path / "prompts" / "a.txt").write_text("  first ")
+    (tmp_path / "prompts" / "notes.md").write_text("ignored")
+    assert list(iter_prompts(tmp_path / "prompts")) == ["first", "second"]
+
+    jsonl = tmp_path / "corpus.jsonl"
+    jsonl.write_text(json.dumps({"text": "one"}) + "\n\n" + json.dumps("two") + "\n")
+    assert list(iter_prompts(jsonl, field="text")) == ["one", "two"]
+
+    csv_file = tmp_path / "corpus.csv"
+    csv_file.write_text('id,prompt\n1,"multi, part"\n2,plain\n')
+    assert list(iter_prompts(csv_file)) == ["multi, part", "plain"]
+
+    with pytest.raises(ValueError):
+        list(iter_prompts(csv_file, field="missing"))
+
+def test_iter_batches_resumes_after_skip():
+    batches = list(iter_batches(iter(["a", "b", "c", "d", "e"]), 2, skip=1))
+    assert batches == [["b", "c"], ["d", "e"]]
+
+def test_checkpoint_rejects_other_imports(tmp_path):
+    path = str(tmp_path / "cp.json")
+    identity = {"source": "/data/a.jsonl", "project": "p1", "environment": "dev"}
+    checkpoint = load_checkpoint(path, identity)
+    checkpoint["processed"] = 128
+    save_checkpoint(path, checkpoint)
+
+    resumed = load_checkpoint(path, identity)
+    assert resumed["processed"] == 128
+    assert resumed["import_id"] == checkpoint["import_id"]
+    with pytest.raises(ValueError):
+        load_checkpoint(path, {**identity, "environment": "prod"})
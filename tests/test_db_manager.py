@@ -1,5 +1,9 @@
+import numpy as np
 import pytest
-from db_manager import DBManager
+import psycopg2
+import time
+from db_manager import DBManager, ConnectionPool, PoolTimeout, metadata_cache
+from vector_codec import Bits, HalfVector, Vector
 
 def test_project_lifecycle(db):
     # Create project
@@ -65,3 +69,309 @@ def test_prompt_persistence_and_similarity(db):
     diff_embedding[100] = 1.0
     similar = db.find_similar(env_id, diff_embedding, threshold=0.8)
     assert len(similar) == 0
+
+def test_bulk_saved_vectors_round_trip_exactly(db):
+    db.create_project("p1", "req1")
+    env_id = db.create_environment("p1", "prod")
+    vectors = [[(i * 7 + j) % 13 / 13 + 1e-7 for j in range(1536)] for i in range(3)]
+
+    ids = db.save_prompts(env_id, [(f"prompt {i}", v) for i, v in enumerate(vectors)])
+    assert len(set(ids)) == 3
+
+    with db.conn.cursor() as cur:
+        cur.execute("SELECT id, prompt_text, embedding::text FROM prompts WHERE id = ANY(%s);", (ids,))
+        stored = {row[0]: (row[1], Vector.from_text(row[2])) for row in cur.fetchall()}
+    for i, pid in enumerate(ids):
+        text, vector = stored[pid]
+        assert text == f"prompt {i}"
+        assert (vector.data == Vector(vectors[i]).data).all()
+
+    assert [m['id'] for m in db.find_similar(env_id, vectors[1], threshold=0.99)][0] == ids[1]
+
+def test_saves_add_columns_missing_from_older_tables(db):
+    db.create_project("p1", "req1")
+    env_id = db.create_environment("p1", "prod")
+    with db.conn.cursor() as cur:
+        cur.execute("ALTER TABLE prompts DROP COLUMN text_hash, DROP COLUMN minhash, DROP COLUMN lsh_buckets;")
+
+    assert db.save_prompt(env_id, "Hello world", [0.1] * 1536)
+    with db.conn.cursor() as cur:
+        cur.execute("ALTER TABLE prompts DROP COLUMN text_hash, DROP COLUMN minhash, DROP COLUMN lsh_buckets;")
+    assert len(db.save_prompts(env_id, [("one", [0.2] * 1536), ("two", [0.3] * 1536)])) == 2
+
+    # A column that cannot be added is reported after one retry instead of recursing.
+    with db.conn.cursor() as cur:
+        cur.execute("ALTER TABLE prompts RENAME COLUMN prompt_text TO prompt_body;")
+    try:
+        with pytest.raises(psycopg2.errors.UndefinedColumn):
+            db.save_prompt(env_id, "Hello again", [0.1] * 1536)
+    finally:
+        with db.conn.cursor() as cur:
+            cur.execute("ALTER TABLE prompts RENAME COLUMN prompt_body TO prompt_text;")
+
+def test_lexical_lookup_upgrades_old_tables_and_keeps_exact_hits(db):
+    import lexical
+    db.create_project("p1", "req1")
+    env_id = db.create_environment("p1", "prod")
+    with db.conn.cursor() as cur:
+        cur.execute("ALTER TABLE prompts DROP COLUMN text_hash, DROP COLUMN minhash, DROP COLUMN lsh_buckets;")
+    assert db.find_lexical_matches(env_id, "Summarize the ticket") == []
+
+    # More LSH candidates than the lookup fetches, all sharing the query's buckets, saved before the exact copy.
+    db.save_prompts(env_id, [(f"unrelated filler {i}", [0.1] * 1536) for i in range(250)])
+    with db.conn.cursor() as cur:
+        cur.execute("UPDATE prompts SET lsh_buckets = %s::bigint[];", (lexical.signature("Summarize the ticket")[2],))
+    db.save_prompt(env_id, "Summarize the  ticket", [0.1] * 1536)
+
+    matches = db.find_lexical_matches(env_id, "Summarize the ticket")
+    assert [m['match'] for m in matches] == ["exact"]
+
+def test_import_checkpoint_commits_with_its_batch(db):
+    db.create_project("p1", "req1")
+    env_id = db.create_environment("p1", "prod")
+    db.save_prompts(env_id, [("one", [0.1] * 1536), ("two", [0.2] * 1536)], checkpoint=("import-1", {"processed": 2}))
+    assert db.get_import_checkpoint("import-1") == {"processed": 2}
+
+    # A failed batch leaves neither rows nor progress behind.
+    with pytest.raises(RuntimeError):
+        db.save_prompts(env_id, [("three", [0.3] * 1536), ("four", [0.4] * 768)], checkpoint=("import-1", {"processed": 4}))
+    assert db.get_import_checkpoint("import-1") == {"processed": 2}
+    assert partition_counts(db) == {f"prompts_env_{env_id}": 2}
+
+    db.delete_import_checkpoint("import-1")
+    assert db.get_import_checkpoint("import-1") is None
+
+def partition_counts(db):
+    with db.conn.cursor() as cur:
+        cur.execute("SELECT tableoid::regclass::text, count(*) FROM prompts GROUP BY 1;")
+        return dict(cur.fetchall())
+
+def test_environments_are_stored_in_their_own_partitions(db):
+    db.create_project("p1", "req1")
+    prod = db.create_environment("p1", "prod")
+    dev = db.create_environment("p1", "dev")
+    embedding = [0.1] * 1536
+    db.save_prompts(prod, [("a", embedding), ("b", embedding)])
+    db.save_prompt(dev, "c", embedding)
+    assert partition_counts(db) == {f"prompts_env_{prod}": 2, f"prompts_env_{dev}": 1}
+
+    # The rebuilt index is built per partition and valid once all are attached.
+    assert db.rebuild_vector_index("hnsw")["index"] == "hnsw"
+    with db.conn.cursor() as cur:
+        cur.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = 'prompts_embedding_hnsw_idx'::regclass;")
+        assert cur.fetchone()[0]
+        cur.execute("SELECT count(*) FROM pg_inherits WHERE inhparent = 'prompts_embedding_hnsw_idx'::regclass;")
+        assert cur.fetchone()[0] == 2
+    assert len(db.find_similar(prod, embedding, threshold=0.99)) == 2
+
+    db.delete_environment_prompts("p1", "prod")
+    assert partition_counts(db) == {f"prompts_env_{dev}": 1}
+    db.delete_environment("p1", "dev")
+    with db.conn.cursor() as cur:
+        cur.execute("SELECT to_regclass(%s);", (f"prompts_env_{dev}",))
+        assert cur.fetchone()[0] is None
+        # A missing partition is created on the next save.
+        cur.execute(f"DROP TABLE prompts_env_{prod};")
+    db.save_prompt(prod, "d", embedding)
+    assert partition_counts(db) == {f"prompts_env_{prod}": 1}
+
+def test_unpartitioned_prompts_table_is_migrated(db):
+    db.create_project("p1", "req1")
+    env_id = db.create_environment("p1", "prod")
+    embedding = [0.1] * 1536
+    with db.conn.cursor() as cur:
+        cur.execute("DROP TABLE prompts;")
+        cur.execute("""
+            CREATE TABLE prompts (
+                id SERIAL PRIMARY KEY,
+                environment_id INTEGER REFERENCES environments(id) ON DELETE CASCADE,
+                prompt_text TEXT NOT NULL,
+                embedding vector(1536),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        cur.execute("INSERT INTO prompts (environment_id, prompt_text, embedding) VALUES (%s, 'old', %s) RETURNING id;",
+                    (env_id, Vector(embedding)))
+        old_id = cur.fetchone()[0]
+
+    # What the app runs at startup.
+    assert db.upgrade_schema()
+    with db.conn.cursor() as cur:
+        cur.execute("SELECT relkind FROM pg_class WHERE oid = 'prompts'::regclass;")
+        assert cur.fetchone()[0] == 'p'
+        cur.execute("SELECT count(*) FROM pg_attribute WHERE attrelid = 'prompts'::regclass AND attname = 'text_hash';")
+        assert cur.fetchone()[0] == 1
+    assert partition_counts(db) == {f"prompts_env_{env_id}": 1}
+    with db.conn.cursor() as cur:
+        # The vector index is built per partition and attached, not across the whole table.
+        cur.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = 'prompts_embedding_hnsw_idx'::regclass;")
+        assert cur.fetchone()[0]
+        cur.execute("SELECT count(*) FROM pg_inherits WHERE inhparent = 'prompts_embedding_hnsw_idx'::regclass;")
+        assert cur.fetchone()[0] == 1
+    assert [m['id'] for m in db.find_similar(env_id, embedding, threshold=0.99)] == [old_id]
+    assert db.save_prompt(env_id, "new", embedding) > old_id
+
+def test_interrupted_partition_detach_is_finalized(db, db_config):
+    db.create_project("p1", "req1")
+    env_id = db.create_environment("p1", "prod")
+    db.save_prompt(env_id, "a", [0.1] * 1536)
+    name = f"prompts_env_{env_id}"
+
+    # A search holding an old snapshot makes the concurrent detach wait; cancelling it
+    # then leaves the partition pending detach.
+    reader = psycopg2.connect(**db_config)
+    try:
+        with reader.cursor() as cur:
+            cur.execute("SELECT count(*) FROM prompts;")
+        with db.conn.cursor() as cur:
+            cur.execute("SET statement_timeout = '500ms';")
+            with pytest.raises(psycopg2.errors.QueryCanceled):
+                cur.execute(f"ALTER TABLE prompts DETACH PARTITION {name} CONCURRENTLY;")
+            cur.execute("RESET statement_timeout;")
+            cur.execute("SELECT inhdetachpending FROM pg_inherits WHERE inhrelid = %s::regclass;", (name,))
+            assert cur.fetchone()[0]
+    finally:
+        reader.close()
+
+    db.delete_environment("p1", "prod")
+    assert db.get_environment_by_name("p1", "prod") is None
+    with db.conn.cursor() as cur:
+        cur.execute("SELECT to_regclass(%s);", (name,))
+        assert cur.fetchone()[0] is None
+
+def test_analysis_cache_invalidation_and_eviction(db):
+    db.create_project("p1", "req1")
+    db.put_cached_analysis("k1", "p1", "chat-model", "STATUS: PASSED")
+    db.put_cached_analysis("k2", "other", "chat-model", "STATUS: PASSED")
+    assert db.get_cached_analysis("k1") == "STATUS: PASSED"
+
+    db.update_project("p1", requirements="req2")
+    assert db.get_cached_analysis("k1") is None
+    assert db.get_cached_analysis("k2") == "STATUS: PASSED"
+
+    db.put_cached_analysis("k3", "other", "chat-model", "STATUS: PASSED")
+    with db.conn.cursor() as cur:
+        cur.execute("UPDATE analysis_cache SET last_used_at = last_used_at - interval '1 hour' WHERE key = 'k2';")
+    assert db.prune_analysis_cache(1) == 1
+    assert db.get_cached_analysis("k2") is None
+    db.invalidate_cached_analyses("other")
+
+def test_binary_quantized_search_reranks_to_exact_results(db):
+    db.create_project("p1", "req1")
+    env_id = db.create_environment("p1", "prod")
+    vectors = [[((i * 31 + j * 17) % 23 - 11) / 11 for j in range(1536)] for i in range(20)]
+    ids = db.save_prompts(env_id, [(f"prompt {i}", v) for i, v in enumerate(vectors)])
+    try:
+        result = db.ensure_quantization("binary")
+        assert result["backfilled"] == 20
+        for i in (0, 7, 19):
+            query = [x + 0.05 for x in vectors[i]]
+            exact = db.find_similar(env_id, query, threshold=0.5, limit=3, exact=True)
+            quantized = db.find_similar(env_id, query, threshold=0.5, limit=3, quantization="binary")
+            assert [m['id'] for m in quantized] == [m['id'] for m in exact]
+            assert quantized[0]['id'] == ids[i]
+            assert quantized[0]['similarity'] == pytest.approx(exact[0]['similarity'])
+
+        queries = [[x + 0.05 for x in vectors[i]] for i in (0, 7, 19)]
+        batch = db.find_similar_batch(env_id, queries, threshold=0.5, limit=3, quantization="binary")
+        for query, matches in zip(queries, batch):
+            exact = db.find_similar(env_id, query, threshold=0.5, limit=3, exact=True)
+            assert [m['id'] for m in matches] == [m['id'] for m in exact]
+            assert matches[0]['similarity'] == pytest.approx(exact[0]['similarity'])
+        with pytest.raises(RuntimeError, match="Dimension mismatch"):
+            db.find_similar_batch(env_id, [[0.1] * 768], quantization="binary")
+    finally:
+        db.ensure_quantization("none")
+    # Without the column the search falls back to the full vectors.
+    assert db.find_similar(env_id, vectors[3], threshold=0.99, quantization="binary")[0]['id'] == ids[3]
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+
+def test_metadata_cache_follows_notifications(db, db_config):
+    db.create_project("p1", "req1")
+    db.create_environment("p1", "dev")
+    assert not metadata_cache.enabled
+    metadata_cache.start_listener(poll_interval=0.05, **db_config)
+    try:
+        wait_for(lambda: metadata_cache.enabled)
+        assert db.get_environment_by_name("P1", "dev")["requirements"] == "req1"
+        assert metadata_cache.get("p1", "dev") is not None
+
+        # A write that bypasses DBManager is not seen until someone notifies...
+        other = DBManager(**db_config)
+        with other.conn.cursor() as cur:
+            cur.execute("UPDATE projects SET requirements = 'req2' WHERE name = 'p1';")
+        assert db.get_environment_by_name("p1", "dev")["requirements"] == "req1"
+        # ...as DBManager does in every process that edits projects or environments.
+        with other.conn.cursor() as cur:
+            cur.execute("""SELECT pg_notify('prompt_metadata', '{"project": "p1", "environment": null}');""")
+        wait_for(lambda: metadata_cache.get("p1", "dev") is None)
+        assert db.get_environment_by_name("p1", "dev")["requirements"] == "req2"
+
+        # Changes made through DBManager invalidate this process's cache right away.
+        other.update_project("p1", requirements="req3")
+        assert db.get_environment_by_name("p1", "dev")["requirements"] == "req3"
+        other.delete_environment("p1", "dev")
+        assert db.get_environment_by_name("p1", "dev") is None
+        other.close()
+    finally:
+        metadata_cache.stop_listener()
+    assert not metadata_cache.enabled and len(metadata_cache.entries) == 0
+
+def test_vector_binary_format_round_trips():
+    vector = Vector([0.25, -1.5, 3.0])
+    assert vector.to_binary()[:4] == b"\x00\x03\x00\x00"
+    assert Vector.from_binary(vector.to_binary()).tolist() == [0.25, -1.5, 3.0]
+    assert vector.getquoted() == b"'[0.25,-1.5,3]'::vector"
+
+def test_compact_vectors_binary_format():
+    bits = Bits([0.5, -1.0, 0.0, 2.0, 1.0, -3.0, 4.0, 0.1, -0.2])
+    assert bits.to_text() == "100110110"
+    assert bits.to_binary() == b"\x00\x00\x00\x09\x9b\x00"
+    assert bits.getquoted() == b"B'100110110'"
+    half = HalfVector([0.25, -1.5, 3.0])
+    assert half.to_binary() == b"\x00\x03\x00\x00" + np.array([0.25, -1.5, 3.0], dtype=">f2").tobytes()
+    assert half.getquoted() == b"'[0.25,-1.5,3]'::halfvec"
+
+@pytest.fixture
+def fake_connect(mocker):
+    """Replaces psycopg2.connect with idle in-memory connections for pool tests."""
+    def make_conn(**kwargs):
+        conn = mocker.MagicMock()
+        conn.closed = 0
+        conn.get_transaction_status.return_value = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        return conn
+    return mocker.patch("db_manager.psycopg2.connect", side_effect=make_conn)
+
+def test_pool_reuses_connections(fake_connect):
+    pool = ConnectionPool(minconn=1, maxconn=2, timeout=0.1)
+    pool.open()
+    assert pool.stats()["idle"] == 1
+
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+    assert fake_connect.call_count == 1
+    assert pool.stats()["in_use"] == 1
+
+def test_pool_checkout_timeout(fake_connect):
+    pool = ConnectionPool(minconn=0, maxconn=1, timeout=0.05)
+    pool.getconn()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    stats = pool.stats()
+    assert stats["total"] == 1 and stats["waiting"] == 0
+
+def test_pool_replaces_dead_idle_connection(fake_connect):
+    pool = ConnectionPool(minconn=0, maxconn=1, timeout=0.1, healthcheck_interval=0)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    conn.cursor.side_effect = psycopg2.OperationalError("server closed the connection")
+
+    fresh = pool.getconn()
+    assert fresh is not conn
+    assert pool.stats()["total"] == 1
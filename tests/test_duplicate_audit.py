@@ -0,0 +1,75 @@
+import numpy as np
+from duplicate_audit import audit_environment, find_clusters, normalize
+
+def planted(n=600, dim=64, seed=3):
+    """Random unit vectors with three planted near-duplicate clusters of sizes 4, 3 and 2."""
+    rng = np.random.default_rng(seed)
+    matrix = rng.standard_normal((n, dim)).astype(np.float32)
+    clusters = [[10, 200, 350, 599], [5, 6, 7], [100, 400]]
+    for members in clusters:
+        matrix[members[1:]] = matrix[members[0]] + 0.02 * rng.standard_normal((len(members) - 1, dim))
+    return normalize(matrix), clusters
+
+def test_blocked_and_lsh_find_the_planted_clusters():
+    matrix, clusters = planted()
+    expected = sorted(sorted(c) for c in clusters)
+    for method in ("blocked", "lsh"):
+        # A small block size makes the pairs span several tiles.
+        groups, used, pairs = find_clusters(matrix, 0.95, method, block_size=64)
+        assert used == method
+        assert sorted(sorted(g.tolist()) for g in groups) == expected
+    assert find_clusters(matrix, 0.95, "blocked")[2] == 6 + 3 + 1
+
+def test_chained_pairs_form_one_cluster():
+    a = np.array([1.0, 0.0], dtype=np.float32)
+    b = np.array([np.cos(0.4), np.sin(0.4)], dtype=np.float32)
+    c = np.array([np.cos(0.8), np.sin(0.8)], dtype=np.float32)
+    groups, _, pairs = find_clusters(np.stack([a, b, c]), 0.9, "blocked")
+    # a~b and b~c are above 0.9, a~c (cos 0.8 = 0.70) is not.
+    assert pairs == 2
+    assert [g.tolist() for g in groups] == [[0, 1, 2]]
+
+def test_audit_environment_ranks_clusters(db):
+    db.create_project("p1", "reqs")
+    env_id = db.create_environment("p1", "dev")
+    base = [0.0] * 1536
+    def vec(*values):
+        v = base[:]
+        v[:len(values)] = values
+        return v
+    db.save_prompts(env_id, [
+        ("Summarize the report", vec(1.0)),
+        ("Summarise the report", vec(0.99, 0.05)),
+        ("Summarize the report!", vec(0.98, 0.08)),
+        ("Translate the email", vec(0.0, 0.0, 1.0)),
+        ("Translate this email", vec(0.0, 0.02, 0.99)),
+        ("Write a poem", vec(0.0, 1.0)),
+    ])
+
+    report = audit_environment(db, "p1", "dev", threshold=0.95)
+    assert (report["prompts"], report["clusters"], report["redundant_prompts"]) == (6, 2, 3)
+    first, second = report["results"]
+    assert first["keep"]["prompt_text"] == "Summarize the report"
+    assert [d["prompt_text"] for d in first["duplicates"]] == ["Summarise the report", "Summarize the report!"]
+    assert second["size"] == 2 and second["min_similarity"] > 0.95
+
+def test_export_ignores_prompts_saved_during_the_copy(db, db_config, mocker):
+    import db_manager
+    from db_manager import DBManager
+    db.create_project("p1", "req1")
+    env_id = db.create_environment("p1", "dev")
+    db.save_prompts(env_id, [(f"prompt {i}", [0.1 + i] * 1536) for i in range(3)])
+    other = DBManager(**db_config)
+    reader = db_manager.VectorCopyReader
+
+    def sized_then_saved(rows, dim):
+        # Another session saves a prompt after the count, before the COPY.
+        other.save_prompt(env_id, "late arrival", [0.5] * 1536)
+        return reader(rows, dim)
+
+    mocker.patch("db_manager.VectorCopyReader", side_effect=sized_then_saved)
+    try:
+        ids, matrix = db.export_embeddings(env_id)
+    finally:
+        other.close()
+    assert len(ids) == 3 and matrix.shape == (3, 1536)
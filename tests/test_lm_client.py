@@ -0,0 +1,241 @@
+import asyncio
+import httpx
+import pytest
+from lm_client import BackendPool, LMClient, backend_stats, get_client, close_clients, register_pool
+from lm_scheduler import LMScheduler, QueueFull
+
+def make_client(handler, retries=2, base_url="http://lm.test/v1"):
+    client = LMClient(base_url, retries=retries, backoff=0)
+    client._sync = httpx.Client(base_url=client.base_url, transport=httpx.MockTransport(handler))
+    client._async = httpx.AsyncClient(base_url=client.base_url, transport=httpx.MockTransport(handler))
+    return client
+
+def test_retries_transient_status_then_succeeds():
+    calls = []
+    def handler(request):
+        calls.append(request.url.path)
+        return httpx.Response(503 if len(calls) < 2 else 200, json={"data": []})
+
+    response = make_client(handler).get("/models")
+    assert response.status_code == 200
+    assert calls == ["/v1/models", "/v1/models"]
+
+def test_does_not_retry_client_or_server_errors():
+    calls = []
+    def handler(request):
+        calls.append(1)
+        return httpx.Response(500, text="context length exceeded")
+
+    response = make_client(handler).post("/chat/completions", json={})
+    assert response.status_code == 500
+    assert len(calls) == 1
+
+def test_connection_errors_are_bounded():
+    calls = []
+    def handler(request):
+        calls.append(1)
+        raise httpx.ConnectError("connection refused", request=request)
+
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(make_client(handler, retries=1).apost("/embeddings", json={}))
+    assert len(calls) == 2
+
+def test_stream_retries_before_the_body_is_read():
+    calls = []
+    def handler(request):
+        calls.append(1)
+        if len(calls) == 1:
+            return httpx.Response(502)
+        return httpx.Response(200, text="data: one\n\ndata: two\n\n")
+
+    async def read_lines():
+        async with make_client(handler).astream("POST", "/chat/completions", json={}) as response:
+            return [line async for line in response.aiter_lines() if line]
+
+    assert asyncio.run(read_lines()) == ["data: one", "data: two"]
+    assert len(calls) == 2
+
+def test_clients_are_shared_per_base_url():
+    try:
+        assert get_client("http://lm.test/v1") is get_client("http://lm.test/v1/")
+        assert get_client("http://lm.test/v1") is not get_client("http://other.test/v1")
+    finally:
+        close_clients()
+
+def test_calls_are_timed_per_endpoint_and_model():
+    from metrics import ERRORS, LM_REQUEST_SECONDS
+    def handler(request):
+        return httpx.Response(200 if request.url.path.endswith("embeddings") else 500, json={})
+
+    client = make_client(handler)
+    before = LM_REQUEST_SECONDS.count(endpoint="embeddings", model="embed-a", status="200")
+    errors = ERRORS.value(source="lm", type="500")
+    asyncio.run(client.apost("/embeddings", json={"model": "embed-a", "input": "x"}))
+    client.post("/chat/completions", json={"model": "chat-b"})
+    assert LM_REQUEST_SECONDS.count(endpoint="embeddings", model="embed-a", status="200") == before + 1
+    assert ERRORS.value(source="lm", type="500") == errors + 1
+
+def test_scheduler_limits_concurrency_and_serves_by_priority():
+    scheduler = LMScheduler({"chat": 1}, max_queue=4)
+    order = []
+
+    async def call(priority, label):
+        async with scheduler.slot("chat", priority):
+            order.append(label)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        first = asyncio.create_task(call("interactive", "first"))
+        await asyncio.sleep(0)
+        queued = [asyncio.create_task(call(p, p)) for p in ("background", "batch", "interactive")]
+        await asyncio.sleep(0)
+        stats = scheduler.stats()["chat"]
+        await asyncio.gather(first, *queued)
+        return stats
+
+    stats = asyncio.run(main())
+    assert stats["running"] == 1
+    assert stats["queued_by_priority"] == {"interactive": 1, "batch": 1, "background": 1}
+    assert order == ["first", "interactive", "batch", "background"]
+    assert scheduler.stats()["chat"]["admitted"] == 4
+
+def test_full_queue_bumps_lower_priority_then_rejects_interactive():
+    scheduler = LMScheduler({"embedding": 1}, max_queue=1)
+
+    async def main():
+        release = asyncio.Event()
+
+        async def call(priority):
+            async with scheduler.slot("embedding", priority):
+                await release.wait()
+
+        holder = asyncio.create_task(call("interactive"))
+        await asyncio.sleep(0)
+        batch = asyncio.create_task(call("batch"))
+        await asyncio.sleep(0)
+        # The interactive call takes the batch call's place; the batch call backs off to retry.
+        interactive = asyncio.create_task(call("interactive"))
+        await asyncio.sleep(0)
+        with pytest.raises(QueueFull) as rejected:
+            async with scheduler.slot("embedding", "interactive"):
+                pass
+        stats = scheduler.stats()["embedding"]
+        release.set()
+        await asyncio.gather(holder, interactive)
+        batch.cancel()
+        return rejected.value, stats
+
+    rejected, stats = asyncio.run(main())
+    assert rejected.retry_after >= 1
+    assert stats["evicted"] == 1 and stats["rejected"] == 1
+    assert stats["queued_by_priority"]["interactive"] == 1
+    assert scheduler.stats()["embedding"]["running"] == 0
+
+def test_client_calls_wait_for_a_scheduler_slot(mocker):
+    scheduler = LMScheduler({"embedding": 1, "chat": 1}, max_queue=0)
+    mocker.patch("lm_client.lm_scheduler", scheduler)
+    client = make_client(lambda request: httpx.Response(200, json={"data": []}))
+
+    async def main():
+        async with scheduler.slot("embedding"):
+            # Model discovery is not scheduled; a second embedding call finds the queue full.
+            assert (await client.aget("/models")).status_code == 200
+            with pytest.raises(QueueFull):
+                await client.apost("/embeddings", json={})
+        return (await client.apost("/embeddings", json={})).status_code
+
+    assert asyncio.run(main()) == 200
+
+def test_pool_sends_calls_to_the_backend_with_fewest_in_flight():
+    served = []
+
+    async def main():
+        release = asyncio.Event()
+
+        async def slow(request):
+            served.append("a")
+            await release.wait()
+            return httpx.Response(200, json={})
+
+        async def fast(request):
+            served.append("b")
+            return httpx.Response(200, json={})
+
+        pool = BackendPool([make_client(slow, base_url="http://a.test/v1"), make_client(fast, base_url="http://b.test/v1")])
+        first = asyncio.create_task(pool.apost("/embeddings", json={}))
+        await asyncio.sleep(0.01)
+        await pool.apost("/embeddings", json={})
+        await pool.apost("/embeddings", json={})
+        stats = pool.stats()
+        release.set()
+        await first
+        return stats
+
+    stats = asyncio.run(main())
+    assert served == ["a", "b", "b"]
+    assert [b["outstanding"] for b in stats["backends"]] == [1, 0]
+
+def test_failing_backend_is_ejected_then_reinstated_by_a_probe():
+    calls = []
+    down = True
+    def flaky(request):
+        calls.append(("a", request.url.path))
+        if down:
+            raise httpx.ConnectError("connection refused", request=request)
+        return httpx.Response(200, json={"data": [{"id": "embed"}]})
+    def healthy(request):
+        calls.append(("b", request.url.path))
+        return httpx.Response(200, json={"data": [{"id": "embed"}]})
+
+    pool = BackendPool([make_client(flaky, retries=0, base_url="http://a.test/v1"),
+                        make_client(healthy, retries=0, base_url="http://b.test/v1")],
+                       max_failures=1, eject_seconds=60)
+    first = asyncio.run(pool.apost("/embeddings", json={}))
+    pool.post("/embeddings", json={})
+    ejected = pool.stats()["backends"][0]
+    down = False
+    asyncio.run(pool.probe())
+
+    assert first.status_code == 200
+    assert calls[:3] == [("a", "/v1/embeddings"), ("b", "/v1/embeddings"), ("b", "/v1/embeddings")]
+    assert not ejected["available"] and ejected["ejections"] == 1 and "ConnectError" in ejected["last_error"]
+    assert pool.stats()["backends"][0]["available"]
+
+def test_probe_keeps_embeddings_on_backends_matching_the_reference_model_and_dimension():
+    from similarity_check import pick_embedding_model
+    def backend(models, dim):
+        def handler(request):
+            if request.url.path.endswith("/models"):
+                return httpx.Response(200, json={"data": [{"id": m} for m in models]})
+            if request.url.path.endswith("/embeddings"):
+                return httpx.Response(200, json={"data": [{"embedding": [0.1] * dim}]})
+            return httpx.Response(200, json={"choices": []})
+        return handler
+
+    pool = BackendPool([
+        make_client(backend(["text-embed-a", "chat-x"], 4), base_url="http://a.test/v1"),
+        make_client(backend(["text-embed-a", "chat-x"], 8), base_url="http://b.test/v1"),
+        make_client(backend(["text-embed-b", "chat-x"], 4), base_url="http://c.test/v1"),
+    ], pick_embedding_model=pick_embedding_model)
+    asyncio.run(pool.probe())
+    for _ in range(3):
+        pool.post("/embeddings", json={"model": "text-embed-a", "input": "x"})
+    for _ in range(2):
+        pool.post("/chat/completions", json={"model": "chat-x"})
+
+    stats = pool.stats()
+    assert (stats["embedding_model"], stats["dimension"]) == ("text-embed-a", 4)
+    assert [b["serves_embeddings"] for b in stats["backends"]] == [True, False, False]
+    assert [b["dimension"] for b in stats["backends"]] == [4, 8, None]
+    assert [b["requests"] for b in stats["backends"]] == [3, 1, 1]
+
+def test_pooled_url_is_served_by_its_pool():
+    pool = BackendPool([make_client(lambda request: httpx.Response(200, json={}), base_url="http://a.test/v1")])
+    try:
+        register_pool("http://lm.test/v1/", pool)
+        assert get_client("http://lm.test/v1") is pool
+        assert backend_stats()["http://lm.test/v1"]["backends"][0]["url"] == "http://a.test/v1"
+    finally:
+        close_clients()
+    assert get_client("http://lm.test/v1") is not pool
+    close_clients()
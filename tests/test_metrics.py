@@ -0,0 +1,55 @@
+import math
+from fastapi.testclient import TestClient
+from app import app
+import metrics
+from metrics import Counter, Histogram
+
+client = TestClient(app)
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("demo_seconds", "Demo.", ["stage"], buckets=(0.1, 1.0))
+    histogram.observe(0.05, stage="a")
+    histogram.observe(0.5, stage="a")
+    histogram.observe(5.0, stage="a")
+    assert histogram.render() == [
+        "# HELP demo_seconds Demo.",
+        "# TYPE demo_seconds histogram",
+        'demo_seconds_bucket{stage="a",le="0.1"} 1',
+        'demo_seconds_bucket{stage="a",le="1.0"} 2',
+        'demo_seconds_bucket{stage="a",le="+Inf"} 3',
+        'demo_seconds_sum{stage="a"} 5.55',
+        'demo_seconds_count{stage="a"} 3',
+    ]
+    assert histogram.buckets[-1] == math.inf
+
+def test_counter_escapes_label_values():
+    counter = Counter("demo_total", "Demo.", ["type"])
+    counter.inc(type='bad "quote"')
+    counter.inc(2, type='bad "quote"')
+    assert counter.render()[-1] == 'demo_total{type="bad \\"quote\\""} 3'
+
+def test_check_is_instrumented(db, mocker):
+    db.create_project("p1", "some requirements")
+    db.create_environment("p1", "dev")
+    mocker.patch("similarity_check.get_embedding_async", return_value=[0.1] * 1536)
+    mocker.patch("similarity_check.analyze_requirements_async", return_value="STATUS: PASSED")
+    mocker.patch("metrics.SERVER_TIMING", True)
+    saved = metrics.PROMPTS_SAVED.value()
+    searches = metrics.DB_QUERY_SECONDS.count(method="find_similar")
+
+    payload = {"project": "p1", "environment": "dev", "prompt": "Summarize the report."}
+    response = client.post("/api/check", json=payload)
+    assert response.status_code == 200
+    server_timing = response.headers["server-timing"]
+    assert "embedding;dur=" in server_timing and "save;dur=" in server_timing and "db;dur=" in server_timing
+    assert metrics.PROMPTS_SAVED.value() == saved + 1
+    assert metrics.DB_QUERY_SECONDS.count(method="find_similar") == searches + 1
+
+    duplicates = metrics.DUPLICATES_FOUND.value(kind="lexical_exact")
+    client.post("/api/check", json=payload)
+    assert metrics.DUPLICATES_FOUND.value(kind="lexical_exact") == duplicates + 1
+
+    body = client.get("/metrics").text
+    assert 'prompt_check_stage_seconds_count{stage="embedding"}' in body
+    assert 'http_request_seconds_count{method="POST",route="/api/check",status="200"}' in body
+    assert "# TYPE errors_total counter" in body
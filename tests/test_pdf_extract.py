@@ -0,0 +1,92 @@
+import asyncio
+import io
+import os
+import time
+import pytest
+from fastapi.testclient import TestClient
+import app as app_module
+from pdf_extract import PdfExtractor, PdfLimitError, spool_upload
+
+def make_pdf(page_texts):
+    """Minimal PDF with one line of Helvetica text per page."""
+    count = len(page_texts)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % (4 + 2 * i) for i in range(count)) + b"] /Count %d >>" % count,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i, text in enumerate(page_texts):
+        stream = b"BT /F1 12 Tf 72 720 Td (" + text.encode("latin-1") + b") Tj ET"
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (5 + 2 * i))
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+
+    out = io.BytesIO(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    out.write(b"".join(b"%010d 00000 n \n" % offset for offset in offsets))
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+@pytest.fixture
+def extractor():
+    extractor = PdfExtractor(workers=2, pages_per_task=2, max_pages=10)
+    yield extractor
+    extractor.shutdown()
+
+def test_spool_upload_enforces_size_limit():
+    path = spool_upload(io.BytesIO(b"x" * 100), max_bytes=100)
+    try:
+        assert open(path, "rb").read() == b"x" * 100
+    finally:
+        os.unlink(path)
+
+    with pytest.raises(PdfLimitError):
+        spool_upload(io.BytesIO(b"x" * 101), max_bytes=100)
+
+def test_extract_keeps_page_order_and_reports_progress(tmp_path, extractor):
+    path = tmp_path / "spec.pdf"
+    path.write_bytes(make_pdf([f"Requirement {i}" for i in range(5)]))
+
+    async def run():
+        job = extractor.submit(str(path), "spec.pdf")
+        while job.finished_at is None:
+            await asyncio.sleep(0.05)
+        return job
+
+    job = asyncio.run(run())
+    assert job.status == "done"
+    assert (job.pages_done, job.pages_total) == (5, 5)
+    assert job.text == "\n".join(f"Requirement {i}" for i in range(5))
+    assert not path.exists()  # the spooled upload is removed once the job ends
+
+def test_extract_rejects_documents_over_page_limit(tmp_path, extractor):
+    path = tmp_path / "long.pdf"
+    path.write_bytes(make_pdf(["page"] * 11))
+    with pytest.raises(PdfLimitError):
+        asyncio.run(extractor.extract(str(path)))
+
+def test_import_pdf_job_endpoint(mocker, extractor):
+    mocker.patch("app.pdf_extractor", extractor)
+    with TestClient(app_module.app) as client:
+        response = client.post("/api/projects/import-pdf/jobs",
+                               files={"file": ("spec.pdf", make_pdf(["Must cite sources", "Must be polite"]))})
+        assert response.status_code == 202
+        job_id = response.json()["job_id"]
+        for _ in range(200):
+            job = client.get(f"/api/projects/import-pdf/jobs/{job_id}").json()
+            if job["status"] in ("done", "error"):
+                break
+            time.sleep(0.05)
+        assert job["status"] == "done"
+        assert job["pages_done"] == job["pages_total"] == 2
+        assert job["text"] == "Must cite sources\nMust be polite"
+
+        response = client.post("/api/projects/import-pdf", files={"file": ("spec.pdf", make_pdf(["Only page"]))})
+        assert response.json() == {"text": "Only page"}
+        assert client.get("/api/projects/import-pdf/jobs/unknown").status_code == 404
+        assert client.post("/api/projects/import-pdf", files={"file": ("spec.txt", b"text")}).status_code == 400
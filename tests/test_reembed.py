@@ -0,0 +1,55 @@
+import asyncio
+import pytest
+from db_manager import DBManager
+from reembed import ReembedJob
+
+@pytest.fixture
+def library(db, db_config, mocker):
+    """Five prompts embedded with the 1536-dimension test model; the table is restored afterwards."""
+    db.create_project("p1", "reqs")
+    env_id = db.create_environment("p1", "dev")
+    db.save_prompts(env_id, [(f"prompt {'x' * i}", [0.1] * 1536) for i in range(5)])
+    mocker.patch("reembed.DBManager", side_effect=lambda *args, **kwargs: DBManager(**db_config))
+    mocker.patch("reembed.resolve_model_async", return_value="new-embed")
+    mocker.patch("reembed.get_embeddings_async",
+                 side_effect=lambda texts, *a, **k: [[float(len(t)), 1.0, 0.0, 0.5] for t in texts])
+    yield env_id
+    db.reset_prompts_table(1536)
+
+def index_names(db):
+    with db.conn.cursor() as cur:
+        cur.execute("SELECT indexname FROM pg_indexes WHERE tablename = 'prompts' AND indexname LIKE 'prompts_embedding%';")
+        return sorted(row[0] for row in cur.fetchall())
+
+def test_swap_waits_for_prompts_saved_during_migration(db, library):
+    assert db.prepare_reembedding(4, "new-embed") == {"total": 5, "done": 0}
+    rows = db.next_reembedding_batch(0, 10)
+    db.save_reembedded([(pid, [1.0, 0.0, 0.0, 0.0]) for pid, _ in rows])
+    # Searches still use the old column while the shadow column fills.
+    assert db.find_similar(library, [0.1] * 1536, threshold=0.5)
+    late_id = db.save_prompt(library, "saved mid-migration", [0.2] * 1536)
+
+    assert db.swap_reembedding() == [(late_id, "saved mid-migration")]
+    db.save_reembedded([(late_id, [0.0, 1.0, 0.0, 0.0])])
+    assert db.swap_reembedding() == []
+    assert db.find_similar(library, [0.0, 1.0, 0.0, 0.0], threshold=0.9)[0]['id'] == late_id
+
+    # Same model and dimension resumes; anything else starts over.
+    assert db.prepare_reembedding(4, "new-embed") == {"total": 6, "done": 0}
+    db.save_reembedded([(late_id, [0.0, 1.0, 0.0, 0.0])])
+    assert db.prepare_reembedding(4, "new-embed")["done"] == 1
+    assert db.prepare_reembedding(4, "other-embed")["done"] == 0
+    db.abort_reembedding()
+
+def test_job_reembeds_library_and_swaps_index(db, library):
+    job = ReembedJob("http://lm.test/v1", batch_size=2, pause=0)
+    asyncio.run(job.run())
+    progress = job.to_dict()
+    assert progress["status"] == "done", progress["error"]
+    assert (progress["done"], progress["total"], progress["dimensions"]) == (5, 5, 4)
+    assert progress["model"] == "new-embed"
+
+    assert index_names(db) == ["prompts_embedding_hnsw_idx"]
+    assert db.ensure_vector_index()["dimensions"] == 4
+    match = db.find_similar(library, [float(len("prompt xx")), 1.0, 0.0, 0.5], threshold=0.9999)
+    assert match[0]['prompt_text'] == "prompt xx"
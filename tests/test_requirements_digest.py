@@ -0,0 +1,26 @@
+from requirements_digest import compile_chunks, count_tokens, select_chunks
+
+def test_compile_chunks_dedupes_and_drops_boilerplate():
+    page = "ACME Corp - Confidential\n\n- Responses must cite sources.\n- Never reveal internal IDs.\n\n"
+    text = page * 3 + "- responses  MUST cite sources.\n\nAll output is in English."
+    chunks = compile_chunks(text, max_tokens=50)
+    joined = "\n".join(chunks)
+    assert joined.count("Confidential") == 1
+    assert joined.lower().count("must cite sources") == 1
+    assert "Never reveal internal IDs." in joined
+    assert "All output is in English." in joined
+
+def test_compile_chunks_respects_chunk_budget():
+    paragraphs = [f"Rule {i}: " + "the assistant shall follow this policy carefully. " * 6 for i in range(20)]
+    chunks = compile_chunks("\n\n".join(paragraphs), max_tokens=120)
+    assert len(chunks) > 1
+    assert all(count_tokens(c) <= 120 for c in chunks)
+    # A single unit over the budget is split rather than kept whole.
+    assert all(count_tokens(c) <= 20 for c in compile_chunks("word " * 200, max_tokens=20))
+
+def test_select_chunks_ranks_by_similarity_within_budget():
+    chunks = [("a", 40), ("b", 40), ("c", 40)]
+    embeddings = [[1.0, 0.0], [0.0, 1.0], [0.7, 0.7]]
+    assert select_chunks(chunks, embeddings, [0.0, 2.0], budget=80) == [1, 2]
+    # The best chunk is kept even when it alone exceeds the budget.
+    assert select_chunks(chunks, embeddings, [1.0, 0.0], budget=10) == [0]
@@ -0,0 +1,121 @@
+import asyncio
+import json
+import httpx
+import pytest
+import similarity_check
+from analysis_cache import AnalysisCache
+from lm_client import LMClient
+
+@pytest.fixture
+def lm_server(mocker):
+    """Routes similarity_check's LM Studio client to an in-memory handler and records the paths hit."""
+    state = {"models": ["text-embedding-nomic", "llama-3-8b-instruct", "other-embed-model"], "calls": []}
+
+    def handler(request):
+        path = request.url.path.removeprefix("/v1")
+        state["calls"].append(path)
+        if path == "/models":
+            return httpx.Response(200, json={"data": [{"id": m} for m in state["models"]]})
+        body = json.loads(request.content)
+        model = body["model"]
+        if model not in state["models"]:
+            return httpx.Response(404, json={"error": f"Model '{model}' not found"})
+        if path == "/embeddings":
+            inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+            # Reverse order to check that results are matched back by their index.
+            data = [{"index": i, "embedding": [float(len(text)), 1.0]} for i, text in enumerate(inputs)]
+            return httpx.Response(200, json={"data": data[::-1]})
+        if body.get("stream"):
+            chunks = ["STATUS: PASSED\n", "SUMMARY: ", f"Fine ({model})"]
+            lines = [f"data: {json.dumps({'choices': [{'delta': {'content': c}}]})}\n\n" for c in chunks]
+            return httpx.Response(200, text="".join(lines) + "data: [DONE]\n\n", headers={"content-type": "text/event-stream"})
+        return httpx.Response(200, json={"choices": [{"message": {"content": f"STATUS: PASSED ({model})"}}]})
+
+    client = LMClient("http://lm.test/v1", retries=0)
+    client._sync = httpx.Client(base_url=client.base_url, transport=httpx.MockTransport(handler))
+    client._async = httpx.AsyncClient(base_url=client.base_url, transport=httpx.MockTransport(handler))
+    mocker.patch("similarity_check.get_client", return_value=client)
+    mocker.patch("similarity_check.analysis_cache", AnalysisCache(persistent=False))
+    similarity_check.invalidate_models()
+    similarity_check.embedding_cache.clear()
+    yield state
+    similarity_check.invalidate_models()
+    similarity_check.embedding_cache.clear()
+
+def test_model_discovery_is_cached(lm_server):
+    similarity_check.get_embedding("a", "http://lm.test/v1")
+    similarity_check.get_embedding("b", "http://lm.test/v1")
+    similarity_check.analyze_requirements("a", "reqs", "http://lm.test/v1")
+    assert lm_server["calls"].count("/models") == 1
+
+def test_model_not_found_triggers_rediscovery(lm_server):
+    similarity_check.analyze_requirements("a", "reqs", "http://lm.test/v1")
+    lm_server["models"] = ["text-embedding-nomic", "phi-3-mini"]
+
+    result = similarity_check.analyze_requirements("b", "reqs", "http://lm.test/v1")
+    assert result == "STATUS: PASSED (phi-3-mini)"
+    assert lm_server["calls"].count("/models") == 2
+
+def test_repeated_text_is_embedded_once(lm_server):
+    first = similarity_check.get_embedding("Summarize the  report.", "http://lm.test/v1")
+    second = similarity_check.get_embedding("  Summarize the report.\n", "http://lm.test/v1")
+    assert first == second
+    assert lm_server["calls"].count("/embeddings") == 1
+
+    similarity_check.get_embedding("Summarize the report.", "http://lm.test/v1", "other-embed-model")
+    assert lm_server["calls"].count("/embeddings") == 2
+
+def test_concurrent_identical_embeddings_share_one_call(lm_server):
+    async def embed_twice():
+        return await asyncio.gather(
+            similarity_check.get_embedding_async("Same template", "http://lm.test/v1"),
+            similarity_check.get_embedding_async(" Same  template\n", "http://lm.test/v1"),
+            similarity_check.get_embedding_async("Other template", "http://lm.test/v1"),
+        )
+    first, second, other = asyncio.run(embed_twice())
+    assert first == second != other
+    assert lm_server["calls"].count("/embeddings") == 2
+    assert len(similarity_check.embedding_flight) == 0
+
+def test_batched_embeddings_keep_input_order(lm_server):
+    prompts = ["a", "bb", "ccc", "dddd", "eeeee"]
+    embeddings = asyncio.run(similarity_check.get_embeddings_async(prompts, "http://lm.test/v1", batch_size=2))
+    assert [e[0] for e in embeddings] == [1.0, 2.0, 3.0, 4.0, 5.0]
+    assert lm_server["calls"].count("/embeddings") == 3
+
+    # Already-embedded texts are served from the cache; only the new one is sent.
+    asyncio.run(similarity_check.get_embeddings_async(prompts + ["ffffff"], "http://lm.test/v1", batch_size=2))
+    assert lm_server["calls"].count("/embeddings") == 4
+
+def test_analysis_is_cached_per_requirements(lm_server):
+    info = {}
+    first = similarity_check.analyze_requirements("Summarize the report.", "reqs", "http://lm.test/v1", cache_info=info)
+    assert info == {"cached": False}
+    second = asyncio.run(similarity_check.analyze_requirements_async(
+        " Summarize the  report. ", "reqs", "http://lm.test/v1", cache_info=info
+    ))
+    assert second == first
+    assert info == {"cached": True}
+    assert lm_server["calls"].count("/chat/completions") == 1
+
+    # Changed requirements or focus never reuse an old analysis.
+    similarity_check.analyze_requirements("Summarize the report.", "new reqs", "http://lm.test/v1", cache_info=info)
+    similarity_check.analyze_requirements("Summarize the report.", "reqs", "http://lm.test/v1", project_focus="security", cache_info=info)
+    assert info == {"cached": False}
+    assert lm_server["calls"].count("/chat/completions") == 3
+
+def test_streamed_analysis_yields_chunks_and_is_cached(lm_server):
+    async def collect(info):
+        return [c async for c in similarity_check.analyze_requirements_stream_async(
+            "a", "reqs", "http://lm.test/v1", cache_info=info
+        )]
+
+    info = {}
+    chunks = asyncio.run(collect(info))
+    assert chunks == ["STATUS: PASSED\n", "SUMMARY: ", "Fine (llama-3-8b-instruct)"]
+    assert info == {"cached": False}
+    assert similarity_check.parse_analysis("".join(chunks))["summary"] == "Fine (llama-3-8b-instruct)"
+
+    assert asyncio.run(collect(info)) == ["".join(chunks)]
+    assert info == {"cached": True}
+    assert lm_server["calls"].count("/chat/completions") == 1
@@ -0,0 +1,201 @@
+import io
+import struct
+
+import numpy as np
+import psycopg2.extensions
+
+# PGCOPY binary stream framing: signature, flags, header extension length / end-of-data marker.
+COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+COPY_TRAILER = struct.pack(">h", -1)
+
+_text_formats = {}
+
+
+def _text_format(dim):
+    # One %-format for the whole vector is several times faster than joining per-float strings.
+    # 9 significant digits round-trip every float32 exactly.
+    fmt = _text_formats.get(dim)
+    if fmt is None:
+        fmt = _text_formats[dim] = "[" + ",".join(["%.9g"] * dim) + "]"
+    return fmt
+
+
+class Vector:
+    """
+    pgvector value backed by a float32 NumPy buffer.
+
+    Passing a Vector as a query parameter renders a compact `'[...]'::vector`
+    literal that Postgres parses with pgvector's own input function, instead of
+    the ARRAY[...] of numerics psycopg2 produces for a plain list. psycopg2 only
+    speaks the text protocol for parameters, so pgvector's binary format
+    (`to_binary`) is used where the driver does allow it: binary COPY.
+    """
+    __slots__ = ("data",)
+
+    def __init__(self, values):
+        self.data = values.data if isinstance(values, Vector) else np.asarray(values, dtype=np.float32).ravel()
+
+    def __len__(self):
+        return self.data.size
+
+    def tolist(self):
+        return self.data.tolist()
+
+    def to_text(self):
+        return _text_format(self.data.size) % tuple(self.data.tolist())
+
+    def to_binary(self):
+        """pgvector's send/recv format: int16 dimensions, int16 unused, big-endian float32 values."""
+        return struct.pack(">HH", self.data.size, 0) + self.data.astype(">f4").tobytes()
+
+    @classmethod
+    def from_binary(cls, data):
+        dim, _ = struct.unpack_from(">HH", data)
+        return cls(np.frombuffer(data, dtype=">f4", count=dim, offset=4))
+
+    @classmethod
+    def from_text(cls, text):
+        return cls(np.array(text.strip("[]").split(","), dtype=np.float32))
+
+    # psycopg2 adaptation protocol
+    def __conform__(self, protocol):
+        if protocol is psycopg2.extensions.ISQLQuote:
+            return self
+
+    def getquoted(self):
+        return b"'" + self.to_text().encode("ascii") + b"'::vector"
+
+
+class HalfVector(Vector):
+    """Vector sent as pgvector's half-precision `halfvec` type (pgvector >= 0.7)."""
+    __slots__ = ()
+
+    def to_binary(self):
+        return struct.pack(">HH", self.data.size, 0) + self.data.astype(">f2").tobytes()
+
+    def getquoted(self):
+        return b"'" + self.to_text().encode("ascii") + b"'::halfvec"
+
+
+class Bits:
+    """
+    Binary quantization of a vector: one bit per dimension, set where the value is
+    positive. Stored as a Postgres `bit(dim)`; the Hamming distance between two
+    Bits approximates the angle between the original vectors.
+    """
+    __slots__ = ("data",)
+
+    def __init__(self, values):
+        values = values.data if isinstance(values, Vector) else np.asarray(values, dtype=np.float32).ravel()
+        self.data = values > 0
+
+    def __len__(self):
+        return self.data.size
+
+    def to_text(self):
+        return (self.data.astype(np.uint8) + ord("0")).tobytes().decode("ascii")
+
+    def to_binary(self):
+        """bit/varbit send format: int32 bit count, then the bits packed most significant first."""
+        return struct.pack(">i", self.data.size) + np.packbits(self.data).tobytes()
+
+    def __conform__(self, protocol):
+        if protocol is psycopg2.extensions.ISQLQuote:
+            return self
+
+    def getquoted(self):
+        return b"B'" + self.to_text().encode("ascii") + b"'"
+
+
+def _encode_field(kind, value):
+    if value is None:
+        return struct.pack(">i", -1)
+    if kind == "int4":
+        data = struct.pack(">i", value)
+    elif kind == "int8":
+        data = struct.pack(">q", value)
+    elif kind == "text":
+        data = value.encode("utf-8")
+    elif kind == "vector":
+        data = Vector(value).to_binary()
+    elif kind == "halfvec":
+        data = HalfVector(value).to_binary()
+    elif kind == "bit":
+        data = Bits(value).to_binary()
+    elif kind == "int8[]":
+        # One-dimensional array: ndim, has-nulls flag, element type oid (int8), length, lower bound,
+        # then each element as (byte length, value).
+        data = struct.pack(">iiiii", 1, 0, 20, len(value), 1) + b"".join(struct.pack(">iq", 8, v) for v in value)
+    else:
+        raise ValueError(f"Unsupported binary COPY column type '{kind}'.")
+    return struct.pack(">i", len(data)) + data
+
+
+def copy_binary(cur, table, columns, rows):
+    """
+    Loads `rows` into `table` with COPY ... FORMAT BINARY.
+
+    `columns` is a list of (name, kind) pairs with kind one of int4, int8, text,
+    vector, halfvec, bit or int8[]; each row supplies values in the same order.
+    Vectors travel in pgvector's binary format, so nothing is formatted or parsed
+    as text.
+    """
+    parts = [COPY_HEADER]
+    field_count = struct.pack(">h", len(columns))
+    for row in rows:
+        parts.append(field_count)
+        parts.extend(_encode_field(kind, value) for (_, kind), value in zip(columns, row))
+    parts.append(COPY_TRAILER)
+
+    names = ", ".join(name for name, _ in columns)
+    cur.copy_expert(f"COPY {table} ({names}) FROM STDIN WITH (FORMAT BINARY)", io.BytesIO(b"".join(parts)))
+
+
+class VectorCopyReader:
+    """
+    Write target for `COPY (SELECT id, embedding ...) TO STDOUT WITH (FORMAT BINARY)`.
+
+    Rows are decoded as the chunks arrive into a preallocated float32 matrix, so the
+    export never exists as text or as one big byte string. Every row has the same
+    size (int4 id, `dim`-dimensional vector); NULL embeddings must be filtered out
+    by the query.
+    """
+    def __init__(self, rows, dim):
+        self.ids = np.empty(rows, dtype=np.int64)
+        self.matrix = np.empty((rows, dim), dtype=np.float32)
+        self.count = 0
+        self._row = np.dtype([
+            ("fields", ">i2"), ("id_len", ">i4"), ("id", ">i4"),
+            ("vec_len", ">i4"), ("dim", ">u2"), ("unused", ">u2"), ("values", ">f4", (dim,)),
+        ])
+        self._buffer = bytearray()
+        self._header_done = False
+
+    def write(self, data):
+        self._buffer += data
+        if not self._header_done:
+            if len(self._buffer) < len(COPY_HEADER):
+                return len(data)
+            if not self._buffer.startswith(COPY_HEADER[:11]):
+                raise ValueError("Not a binary COPY stream.")
+            del self._buffer[:len(COPY_HEADER)]
+            self._header_done = True
+        complete = len(self._buffer) // self._row.itemsize
+        # The 2-byte trailer never fills a whole row, so it stays in the buffer.
+        if complete:
+            rows = np.frombuffer(self._buffer, dtype=self._row, count=complete)
+            if self.count + complete > len(self.ids):
+                raise ValueError("COPY returned more rows than expected.")
+            if (rows["dim"] != self.matrix.shape[1]).any():
+                raise ValueError(f"Expected {self.matrix.shape[1]}-dimensional vectors.")
+            end = self.count + complete
+            self.ids[self.count:end] = rows["id"]
+            self.matrix[self.count:end] = rows["values"]
+            self.count = end
+            del rows
+            del self._buffer[:complete * self._row.itemsize]
+        return len(data)
+
+    def result(self):
+        """(ids, matrix) for the rows received."""
+        return self.ids[:self.count], self.matrix[:self.count]